@@ -1,56 +1,163 @@
 import streamlit as st
 from typing import Optional, Union
-from config import MODEL_OPTIONS, COMPANY_SUFFIXES, API_CONFIG
-from extractors import RegexExtractor, LLMExtractor, VLMExtractor
-from utils.file_utils import process_pdf_files, process_image_files
+from config import MODEL_OPTIONS, BATCH_CONFIG, WARMUP_CONFIG
+from extractors import RegexExtractor, LLMExtractor, VLMExtractor, HybridExtractor, CascadeExtractor, create_extractor
+from extractors.factory import CASCADE_MODES, EXTRACTION_MODES, cascade_models
+from utils.job_utils import get_job_queue
+from utils.warmup_utils import get_model_warmer
+from utils.cache_utils import get_extraction_cache
+from utils.export_utils import batch_to_frame
+from utils.store_utils import InvoiceFilter, get_invoice_store
 from utils.display_utils import show_results, chat_interface
-from models import Invoice
+from models import Invoice, InvoiceBatch
 from config import logger
 
+import re
+import secrets
+import time
+import pandas as pd
 import tomli
 from pathlib import Path
 def get_version():
     with open(Path(__file__).parent.parent / "pyproject.toml", "rb") as f:
         return tomli.load(f)["tool"]["poetry"]["version"]
     
-def init_extractor() -> Union[RegexExtractor, LLMExtractor, VLMExtractor]:
+# 界面选项 -> 提取模式（见 extractors.factory.EXTRACTION_MODES）
+MODE_LABELS = {
+    "正则匹配": "regex",
+    "语言大模型(LLM)": "llm",
+    "分级提取(正则+LLM)": "hybrid",
+    "视觉多模态模型(VLM)": "vlm",
+    "模型级联(LLM 小→大)": "cascade",
+    "模型级联(VLM 小→大)": "vlm-cascade",
+}
+# 提取进行中只显示最近完成的这么多张（完整结果在任务结束后分页显示）
+PROGRESS_ROWS = 50
+# 地址栏 ?owner= 的用户令牌格式（secrets.token_urlsafe 生成）
+OWNER_RE = re.compile(r"[A-Za-z0-9_-]{16,64}")
+
+@st.cache_resource(show_spinner=False)
+def load_extractor(mode: str, model: Optional[str] = None) -> Union[RegexExtractor, LLMExtractor, HybridExtractor, VLMExtractor, CascadeExtractor]:
+    """按模式和模型缓存提取器，页面重新运行时直接复用（连接池随之复用）"""
+    return create_extractor(mode, model)
+
+def init_extractor() -> Union[RegexExtractor, LLMExtractor, HybridExtractor, VLMExtractor, CascadeExtractor]:
     """根据用户选择初始化提取器"""
     # 模式选择
     extraction_mode = st.sidebar.radio(
         "提取模式",
-        options=["正则匹配", "语言大模型(LLM)", "视觉多模态模型(VLM)"],
+        options=list(MODE_LABELS),
         index=1,
         help="选择信息提取方式"
     )
+    mode = MODE_LABELS[extraction_mode]
     
     # 正则模式
-    if extraction_mode == "正则匹配":
-        return RegexExtractor(COMPANY_SUFFIXES)
+    if mode == "regex":
+        st.session_state.extraction_settings = (mode, None)
+        return load_extractor(mode)
     
     # 获取模型配置
-    model_type = "visual" if extraction_mode == "视觉多模态模型(VLM)" else "text"
-    selected_model = st.sidebar.selectbox(
-        label=f"选择{'视觉多模态' if model_type=='visual' else '语言'}模型",
-        options=[k for k, v in MODEL_OPTIONS.items() if v["type"] == model_type],
-        index=0
-    )
-    model_config = MODEL_OPTIONS[selected_model]
-    
-    # LLM模式
-    if extraction_mode == "语言大模型(LLM)":
-        return LLMExtractor(
-            suffixes=COMPANY_SUFFIXES,
-            model_path=model_config["model_path"],
-            api_key=API_CONFIG["api_key"],
-            base_url=API_CONFIG["base_url"]
+    model_type = EXTRACTION_MODES[mode]
+    if mode in CASCADE_MODES:
+        # 级联模式按 cascade_config 的顺序使用全部模型，不单独选择
+        selected_model = None
+        models = cascade_models(model_type)
+        st.sidebar.caption(f"级联顺序：{' → '.join(models)}")
+        show_cascade_stats()
+    else:
+        selected_model = st.sidebar.selectbox(
+            label=f"选择{'视觉多模态' if model_type=='visual' else '语言'}模型",
+            options=[k for k, v in MODEL_OPTIONS.items() if v["type"] == model_type],
+            index=0
         )
-    
-    # 多模态模式
-    return VLMExtractor(
-        model_path=model_config["model_path"],
-        api_key=API_CONFIG["api_key"],
-        base_url=API_CONFIG["base_url"]
-    )
+        models = [selected_model]
+    # 后台任务按 (模式, 模型) 在工作进程中创建提取器
+    st.session_state.extraction_settings = (mode, selected_model)
+    # 选择模型后立即在后台加载（级联模式加载第一级），第一张发票不再等待模型载入
+    st.session_state.probe_model = models[0]
+    warmer = get_model_warmer()
+    if warmer is not None:
+        warmer.warm(models[0])
+        with st.sidebar:
+            show_model_status(models[0])
+    # 同一模式和模型只创建一次
+    return load_extractor(mode, selected_model)
+
+def show_cascade_stats() -> None:
+    """侧边栏显示各模型的累计级联统计（后台任务结束时写入），用于调整级联顺序"""
+    stats = get_job_queue().model_stats()
+    if not stats:
+        return
+    with st.sidebar.expander("📈 模型级联统计"):
+        st.dataframe(
+            pd.DataFrame(stats)[["model", "calls", "pass_rate", "mean_seconds", "resolved"]].rename(columns={
+                "model": "模型", "calls": "调用", "pass_rate": "通过率", "mean_seconds": "平均耗时(秒)",
+                "resolved": "完成张数",
+            }),
+            hide_index=True,
+            column_config={"通过率": st.column_config.NumberColumn(format="percent")},
+        )
+
+def session_owner() -> str:
+    """
+    本会话的批次归属令牌
+
+    保存在地址栏 ?owner=，刷新页面或收藏链接后仍能看到自己的批次；
+    历史批次只列出同一令牌创建的批次，其他用户的批次不可见。
+    """
+    owner = st.query_params.get("owner", "")
+    if not OWNER_RE.fullmatch(owner):
+        owner = secrets.token_urlsafe(16)
+        st.query_params["owner"] = owner
+    return owner
+
+def owned_batch_id(value: str, owner: str) -> Optional[int]:
+    """地址栏 ?batch= 的批次ID，批次不存在或不属于本会话时返回None"""
+    if not value.isdigit():
+        return None
+    batch = get_invoice_store().batch(int(value))
+    if batch is None or batch.owner != owner:
+        logger.warning(f"拒绝访问批次 {value}：不存在或不属于当前会话")
+        return None
+    return batch.batch_id
+
+@st.fragment(run_every=2.0)
+def show_model_status(model: str) -> None:
+    """侧边栏显示模型预热状态（每2秒刷新；超过保留时长后重新预热，失败后按间隔重试）"""
+    status = get_model_warmer().warm(model)
+    st.caption(f"模型 {model}：{status.describe()}")
+
+@st.fragment(run_every=1.0)
+def show_job_progress(job_id: int) -> None:
+    """
+    每秒刷新一次任务进度与最近完成的部分结果，任务结束后重新运行整个页面显示完整结果
+
+    只在已完成张数变化时从结果库读取最近 PROGRESS_ROWS 张（不读取整批），其余刷新复用上次的表格。
+    """
+    queue = get_job_queue()
+    job = queue.get(job_id)
+    if not job.active:
+        st.rerun()
+    if st.button("⏹ 取消提取", key="cancel_extract", disabled=bool(job.cancel_requested)):
+        queue.cancel(job_id)
+        job = queue.get(job_id)
+    st.progress(job.done / job.total if job.total else 0.0, text=job.describe())
+    if job.done:
+        cached = st.session_state.get("progress_frame")
+        if not cached or cached[:2] != (job_id, job.done):
+            # 已完成的发票按上传顺序显示最后一页
+            batch = get_invoice_store().batch(job.batch_id)
+            where = InvoiceFilter(has_error=False)
+            total = batch.count(where)
+            partial = InvoiceBatch.from_invoices(batch.page(where, offset=max(total - PROGRESS_ROWS, 0),
+                                                            limit=PROGRESS_ROWS), keep_raw_text=False)
+            cached = st.session_state.progress_frame = (job_id, job.done, total,
+                                                        batch_to_frame(partial, include_error=False))
+        _, _, total, frame = cached
+        if total > len(frame):
+            st.caption(f"最近完成的 {len(frame)} 份（共 {total} 份）")
+        st.dataframe(frame, use_container_width=True)
 
 def main():
     st.set_page_config(page_title="Fapiao Assistant", layout="wide")
@@ -59,9 +166,16 @@ def main():
     
     # 初始化关键会话状态
     if "app_initialized" not in st.session_state:
+        owner = session_owner()
+        # 会话中只保存批次ID，发票存放在结果库中；地址栏 ?batch= 使刷新页面后仍能恢复（只接受本会话的批次）
+        batch_id = owned_batch_id(st.query_params.get("batch", ""), owner)
+        if batch_id is None and "batch" in st.query_params:
+            st.query_params.pop("batch")
+            st.warning("地址中的批次不存在或不属于当前用户，已忽略")
         st.session_state.update({
             "app_initialized": True,
-            "invoices": [],
+            "owner": owner,
+            "batch_id": batch_id,
             "current_extractor": None,
             "current_model": None
         })
@@ -70,9 +184,16 @@ def main():
     st.sidebar.header("⚙️ 处理设置")
     extractor = init_extractor()
     st.session_state.current_extractor = extractor
+    max_workers = st.sidebar.slider(
+        "并发数",
+        min_value=1,
+        max_value=16,
+        value=BATCH_CONFIG.get("max_workers", 4),
+        help="同时进行的模型调用数量"
+    )
     
     # 获取当前模型配置（用于聊天）
-    model_type = "text" if isinstance(extractor, VLMExtractor) else "visual"
+    model_type = "text" if extractor.input_kind == "file" else "visual"
     selected_model = next(
         k for k, v in MODEL_OPTIONS.items() 
         if v["type"] == model_type
@@ -81,7 +202,7 @@ def main():
     
     # 文件上传区域
     st.header("📤 上传文件")
-    file_types = ["pdf", "png", "jpg"] if isinstance(extractor, VLMExtractor) else ["pdf"]
+    file_types = ["pdf", "png", "jpg"] if extractor.input_kind == "file" else ["pdf"]
 
     uploaded_files = st.file_uploader(
         "选择发票文件",
@@ -90,47 +211,98 @@ def main():
         help=f"支持格式: {', '.join(file_types)}"
     )
     
-    # 处理按钮
-    invoices = []
+    # 处理按钮：提取作为后台任务交给工作进程池，页面重新运行或断开重连都不影响任务执行
+    store = get_invoice_store()
+    queue = get_job_queue()
     if uploaded_files and st.button("开始提取"):
-        with st.spinner("正在提取发票信息..."):
+        mode, model = st.session_state.extraction_settings
+        # 提交前测量服务排队延迟，繁忙时提示（任务仍然排队执行）
+        warmer = get_model_warmer()
+        if mode != "regex" and warmer is not None:
             try:
-                # 根据文件类型选择处理器
-
-                if isinstance(extractor, VLMExtractor):
-                    for uploaded_file in uploaded_files:
-                        invoice = extractor.extract(uploaded_file)
-                        invoices.append(invoice)
-                else:
-                    process_func = process_pdf_files if uploaded_files[0].type == "application/pdf" else process_image_files
-                    invoices = process_func(uploaded_files, extractor)
-                    
-                # 存储结果到会话状态
-                st.session_state.invoices = invoices
-                if any(invoice.error for invoice in invoices if hasattr(invoice, 'error')):
-                    st.error("部分发票处理出错，请检查结果")
-                else:
-                    st.success(f"成功处理 {len(invoices)} 份发票!")
+                latency = warmer.probe(st.session_state.probe_model)
+                if latency > WARMUP_CONFIG.get("slow_queue_seconds", 5):
+                    st.warning(f"模型服务当前较繁忙（单次请求 {latency:.1f} 秒），提取可能较慢")
             except Exception as e:
-                st.error(f"处理失败: {str(e)}")
-                st.session_state.invoices = []
+                st.warning(f"模型服务探测失败: {str(e)}")
+        label = f"{type(extractor).__name__} · {len(uploaded_files)} 份"
+        try:
+            job = queue.enqueue(uploaded_files, mode, model, max_workers=max_workers, label=label,
+                                owner=st.session_state.owner)
+        except Exception as e:
+            logger.exception("提交提取任务失败")
+            st.error(f"提交提取任务失败: {str(e)}")
+        else:
+            # 会话状态只记录批次ID，任务按批次查询（刷新页面也能继续查看进度）
+            st.session_state.batch_id = job.batch_id
+            st.query_params["batch"] = str(job.batch_id)
 
-    # 结果显示
-    if st.session_state.get("invoices"):
+    # 当前批次对应的任务：未结束时轮询进度，结束后显示结果
+    job = queue.job_for_batch(st.session_state.batch_id) if st.session_state.get("batch_id") else None
+    if job and job.active:
+        show_job_progress(job.id)
+    elif job:
+        if job.message:
+            st.info(job.message)
+        if job.status == "failed":
+            st.error(f"处理失败: {job.error}")
+        elif job.status == "cancelled":
+            st.warning(f"已取消提取，保留已完成的 {job.done}/{job.total} 份结果")
+        elif job.errors:
+            st.error("部分发票处理出错，请检查结果")
+        else:
+            st.success(f"成功处理 {job.total} 份发票! 用时 {job.progress().elapsed:.1f} 秒")
+
+    # 结果显示（按批次从结果库读取）
+    batch = store.batch(st.session_state.batch_id) if st.session_state.get("batch_id") else None
+    if batch and not (job and job.active):
         st.divider()
         st.header("📊 提取结果")
-        show_results(st.session_state.invoices)     
+        show_results(batch)
     
         st.divider()
         try:
             chat_interface(
                 model_path=st.session_state.current_model,  # 使用统一模型配置
-                invoices=st.session_state.invoices
+                invoices=batch
             )
         except Exception as e:
             st.error(f"对话界面初始化失败: {str(e)}")
             logger.exception("对话界面错误详情:")
 
+    # 历史批次（本会话用户在结果库中保存的最近批次，可切换查看）
+    recent = store.recent_batches(st.session_state.owner)
+    if recent:
+        labels = {
+            batch_id: f"#{batch_id} {time.strftime('%m-%d %H:%M', time.localtime(created_at))} {label or ''}"
+            for batch_id, label, _, created_at in recent
+        }
+        if batch and batch.batch_id not in labels:
+            labels[batch.batch_id] = f"#{batch.batch_id} {batch.label or ''}"
+        options = [None] + list(labels)
+        current = st.session_state.get("batch_id")
+        chosen = st.sidebar.selectbox(
+            "历史批次",
+            options=options,
+            index=options.index(current) if current in options else 0,
+            format_func=lambda batch_id: "（未选择）" if batch_id is None else labels[batch_id],
+        )
+        if chosen != current:
+            st.session_state.batch_id = chosen
+            if chosen is None:
+                st.query_params.pop("batch", None)
+            else:
+                st.query_params["batch"] = str(chosen)
+            st.rerun()
+
+    # 缓存统计（放在提取之后渲染；计数记录在缓存库中，包含任务工作进程的查询）
+    cache = get_extraction_cache()
+    if cache is not None:
+        stats = cache.stats()
+        st.sidebar.caption(
+            f"结果缓存：命中 {stats['hits']} · 未命中 {stats['misses']} · 共 {stats['entries']} 条"
+        )
+
     # 在侧边栏添加关于信息
     st.sidebar.markdown("---")
     with st.sidebar.expander("ℹ️ 关于本系统"):
@@ -0,0 +1,2 @@
+# benchmarks/__init__.py
+"""性能基准与合成发票语料"""
@@ -0,0 +1,68 @@
+# benchmarks/__main__.py
+"""
+基准测试入口
+
+    python -m benchmarks run --count 200 --extractors regex,llm,vlm -o bench_results.json
+    python -m benchmarks compare baseline.json bench_results.json --threshold 0.1
+"""
+import argparse
+import json
+import logging
+import sys
+
+from .runner import compare_results, format_report, run_benchmarks, save_report
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="发票提取性能基准")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="生成合成语料并运行基准")
+    run.add_argument("--count", type=int, default=100, help="合成发票数量")
+    run.add_argument("--seed", type=int, default=0)
+    run.add_argument("--extractors", default="regex", help="逗号分隔：regex,llm,llm-pack,hybrid,vlm")
+    run.add_argument("--llm-model", help="LLM模式使用的模型名称")
+    run.add_argument("--vlm-model", help="VLM模式使用的模型名称")
+    run.add_argument("--min-items", type=int, default=1, help="每张发票最少明细行")
+    run.add_argument("--max-items", type=int, default=6, help="每张发票最多明细行")
+    run.add_argument("--items-per-page", type=int, default=12, help="每页明细行数（超出即多页）")
+    run.add_argument("-o", "--output", default="bench_results.json", help="结果JSON路径")
+
+    compare = sub.add_parser("compare", help="对比两次结果，退化超过阈值时返回非零")
+    compare.add_argument("baseline")
+    compare.add_argument("current")
+    compare.add_argument("--threshold", type=float, default=0.1, help="允许的相对退化比例")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+
+    if args.command == "run":
+        report = run_benchmarks(
+            [m.strip() for m in args.extractors.split(",") if m.strip()],
+            args.count,
+            seed=args.seed,
+            llm_model=args.llm_model,
+            vlm_model=args.vlm_model,
+            min_items=args.min_items,
+            max_items=args.max_items,
+            items_per_page=args.items_per_page,
+        )
+        save_report(report, args.output)
+        print(format_report(report))
+        print(f"结果已写入 {args.output}")
+        return 0
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.current, encoding="utf-8") as f:
+        current = json.load(f)
+    regressions = compare_results(baseline, current, args.threshold)
+    for line in regressions:
+        print(f"退化: {line}")
+    if not regressions:
+        print("未发现超过阈值的退化")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+# benchmarks/bench_regex.py
+"""
+正则模式微基准：对比预编译单次扫描实现与旧实现的吞吐量（张/秒），并校验两者结果一致
+
+    python -m benchmarks.bench_regex --count 2000 --repeat 5
+"""
+import argparse
+import re
+import time
+from typing import Callable, List, Optional, Tuple
+
+from config import COMPANY_SUFFIXES
+from extractors import RegexExtractor
+from models import Invoice
+from .corpus import generate_corpus
+
+
+class LegacyRegexExtractor(RegexExtractor):
+    """旧版实现的冻结副本（每次调用重新编译/多次扫描），仅作为基准对照"""
+
+    def clean_text(self, text: str) -> str:
+        return re.sub(r'\s+', ' ', text.replace('\n', ' ')).strip()
+
+    def extract_companies(self, text: str) -> Tuple[Optional[str], Optional[str]]:
+        suffixes = "|".join(self.suffixes)
+        pattern = re.compile(r"""
+            (?:(?:[购买销售]\s*)?名称\s*[:：]\s*)?
+            ([^\s：:]+?(?:{})[^)\s]*)
+            \s+
+            (?:(?:[销售售]\s*)?名称\s*[:：]\s*)?
+            ([^\s：:]+?(?:{})[^)\s]*)
+        """.format(suffixes, suffixes), re.VERBOSE | re.DOTALL)
+        match = pattern.search(text)
+        return (match.group(1).strip(), match.group(2).strip()) if match else (None, None)
+
+    def extract_amounts(self, text: str, normalized: bool = False):
+        cleaned = re.sub(r'[ \s\u3000]+', ' ', text.strip())
+        amount, tax, total_amount = None, None, None
+        total_match1 = re.search(
+            r'(?:合\s*计|价税合计).*?[^¥]*¥\s*(\d+\.\d{1,2}).*?[^¥]*¥\s*(\d+\.\d{1,2})',
+            cleaned
+        )
+        total_match2 = re.search(
+            r"价税合计\s*\(?[大小]写\)?[^¥]*¥\s*(\d+\.\d{1,2})",
+            cleaned
+        ) or re.search(
+            r"价税合计[^\d]*[^¥]*¥\s*(\d+\.\d{1,2})",
+            cleaned
+        )
+        if total_match1:
+            amount, tax = (float(total_match1.group(1)), float(total_match1.group(2)))
+        if total_match2:
+            total_amount = float(total_match2.group(1))
+        if amount and tax and total_amount:
+            return amount, tax, total_amount
+        detail_lines = re.findall(
+            r'(?:\*.*?\*)\s+[\d.-]+\s+\d+\s+([\d.-]+)\s+\d+%?\s+([\d.-]+)',
+            cleaned
+        )
+        if detail_lines:
+            amount = sum(float(line[0]) for line in detail_lines)
+            tax = sum(float(line[1]) for line in detail_lines)
+            return (round(amount, 2), round(tax, 2), total_amount)
+        total = re.search(r'价税合计.*?¥\s*(\d+\.\d{2})', cleaned)
+        if total:
+            total_val = float(total.group(1))
+            tax_rate = 0.03 if '3%' in cleaned else 0.06
+            amount = round(total_val / (1 + tax_rate), 2)
+            tax = round(total_val - amount, 2)
+            return (amount, tax, total_amount)
+        return amount, tax, total_amount
+
+    def extract(self, text: str) -> Invoice:
+        cleaned_text = self.clean_text(text)
+        invoice = Invoice(file_name="")
+        match = re.search(r'(?:发票号码[:：])*\s*(\d{20})', cleaned_text)
+        invoice.invoice_number = match.group(1) if match else None
+        match = re.search(r'(?:开票日期[:：])*\s*(\d{4}年\d{1,2}月\d{1,2}日)', cleaned_text)
+        invoice.issue_date = match.group(1) if match else None
+        invoice.buyer, invoice.seller = self.extract_companies(cleaned_text)
+        match = re.search(r'(\*[\u4e00-\u9fa5]+\*+[\u4e00-\u9fa5]+)', cleaned_text)
+        invoice.item_name = match.group(1).strip() if match else None
+        invoice.amount, invoice.tax_amount, invoice.total_amount = self.extract_amounts(cleaned_text)
+        return invoice
+
+
+def measure(extract: Callable[[str], Invoice], texts: List[str], repeat: int) -> float:
+    """返回多轮中最快一轮的吞吐量（张/秒）"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in texts:
+            extract(text)
+        best = min(best, time.perf_counter() - start)
+    return len(texts) / best
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description="正则提取吞吐量基准")
+    parser.add_argument("--count", type=int, default=2000, help="合成发票数量")
+    parser.add_argument("--repeat", type=int, default=5, help="重复轮数（取最快一轮）")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    texts = [inv.text for inv in generate_corpus(args.count, seed=args.seed)]
+    legacy = LegacyRegexExtractor(COMPANY_SUFFIXES)
+    current = RegexExtractor(COMPANY_SUFFIXES)
+
+    mismatches = sum(legacy.extract(t) != current.extract(t) for t in texts)
+    before = measure(legacy.extract, texts, args.repeat)
+    after = measure(current.extract, texts, args.repeat)
+
+    print(f"合成发票: {len(texts)} 张, 结果不一致: {mismatches}")
+    print(f"优化前: {before:,.0f} 张/秒")
+    print(f"优化后: {after:,.0f} 张/秒 ({after / before:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+# benchmarks/corpus.py
+import json
+import random
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import List, Optional
+
+# 名称素材，后缀取自 settings.yaml 的企业后缀词库
+CITIES = ["北京", "上海", "苏州", "杭州", "深圳", "成都", "武汉", "南京", "广州", "西安"]
+NAME_CORES = ["星石娱动", "那家雅居", "吉利优行", "云帆", "青禾", "博远", "华景", "明睿", "中科智联", "恒通"]
+BUYER_SUFFIXES = ["国际传媒有限公司", "文化传播有限公司", "影视制作有限公司", "科技股份有限公司"]
+SELLER_SUFFIXES = ["餐饮有限责任公司", "电子科技有限公司", "酒店管理有限公司", "信息技术有限公司", "商贸中心"]
+
+# 税率 -> 可选项目（类别, 名称）
+ITEMS = {
+    0.06: [("餐饮服务", "餐费"), ("信息技术服务", "技术服务费"), ("现代服务", "咨询服务费"), ("住宿服务", "住宿费")],
+    0.03: [("运输服务", "客运服务费"), ("生活服务", "停车费"), ("运输服务", "出租汽车客运服务")],
+}
+
+DIGITS = "零壹贰叁肆伍陆柒捌玖"
+UNITS = ["", "拾", "佰", "仟"]
+SECTIONS = ["", "万", "亿"]
+
+
+def amount_in_words(value: float) -> str:
+    """将金额转换为发票上的中文大写（如 692.00 -> 陆佰玖拾贰圆整）"""
+    cents = int(round(value * 100))
+    integer, fraction = divmod(cents, 100)
+    words = ""
+    section_index = 0
+    need_zero = False
+    while integer > 0:
+        section = integer % 10000
+        part = ""
+        zero = False
+        for i in range(4):
+            digit = section // (10 ** i) % 10
+            if digit == 0:
+                zero = bool(part)
+            else:
+                part = DIGITS[digit] + UNITS[i] + ("零" if zero else "") + part
+                zero = False
+        if section:
+            words = part + SECTIONS[section_index] + ("零" if need_zero and words else "") + words
+        need_zero = section < 1000
+        integer //= 10000
+        section_index += 1
+    words = (words or "零") + "圆"
+    jiao, fen = divmod(fraction, 10)
+    if not fraction:
+        return words + "整"
+    if jiao:
+        words += DIGITS[jiao] + "角"
+    elif fen:
+        words += "零"
+    if fen:
+        words += DIGITS[fen] + "分"
+    return words
+
+
+@dataclass
+class SyntheticInvoice:
+    """合成发票：文本（分页）及期望的提取结果"""
+    invoice_number: str
+    issue_date: str
+    buyer: str
+    seller: str
+    item_name: str
+    amount: float
+    tax_amount: float
+    total_amount: float
+    tax_rate: float
+    layout: str
+    pages: List[str] = field(default_factory=list)
+
+    @property
+    def text(self) -> str:
+        return "\n".join(self.pages)
+
+
+def _company(rng: random.Random, suffixes: List[str]) -> str:
+    return rng.choice(CITIES) + rng.choice(NAME_CORES) + rng.choice(suffixes)
+
+
+def generate_invoice(
+    rng: random.Random,
+    min_items: int = 1,
+    max_items: int = 6,
+    items_per_page: int = 12,
+    tax_rate: Optional[float] = None
+    ) -> SyntheticInvoice:
+    """
+    生成一张合成发票，版式仿照电子发票（普通发票）及旅客运输服务发票
+
+    Args:
+        rng: 随机数生成器
+        min_items: 最少明细行数
+        max_items: 最多明细行数
+        items_per_page: 每页明细行数，超出时分页（多页版式）
+        tax_rate: 税率（0.03/0.06），默认随机
+
+    Returns:
+        SyntheticInvoice: 合成发票
+    """
+    tax_rate = tax_rate if tax_rate is not None else rng.choice(list(ITEMS))
+    category, name = rng.choice(ITEMS[tax_rate])
+    item_name = f"*{category}*{name}"
+    layout = "transport" if category == "运输服务" else "standard"
+
+    lines = []
+    amount_cents = tax_cents = 0
+    for _ in range(rng.randint(min_items, max_items)):
+        quantity = rng.randint(1, 5)
+        line_cents = rng.randint(500, 200000)
+        line_tax = int(round(line_cents * tax_rate))
+        amount_cents += line_cents
+        tax_cents += line_tax
+        unit_price = line_cents / 100 / quantity
+        lines.append(
+            f"{item_name} {unit_price:.6f} {quantity} {line_cents / 100:.2f} "
+            f"{int(tax_rate * 100)}% {line_tax / 100:.2f}"
+        )
+
+    amount, tax = amount_cents / 100, tax_cents / 100
+    total = (amount_cents + tax_cents) / 100
+    invoice_number = "".join(rng.choice("0123456789") for _ in range(20))
+    issue_date = f"2025年{rng.randint(1, 12):02d}月{rng.randint(1, 28):02d}日"
+    buyer = _company(rng, BUYER_SUFFIXES)
+    seller = _company(rng, SELLER_SUFFIXES)
+    issuer = rng.choice(["胡晋阳", "钟寒冰", "王晓", "李明"])
+
+    if layout == "transport":
+        header = [
+            "电子发票（普通发票）",
+            f"发票号码： {invoice_number}",
+            "旅客运输服务",
+            f"开票日期： {issue_date}",
+            "购 销",
+            f"买 名称：{buyer} 售 名称：{seller}",
+            "方 方",
+            "信",
+            "统一社会信用代码/纳税人识别号：91110116MA01BP9R44",
+            "信",
+            "统一社会信用代码/纳税人识别号：91320594MA1MFD7F31",
+            "息 息",
+            "项目名称 单 价 数 量 金 额 税率/征收率 税 额",
+        ]
+    else:
+        header = [
+            "电子发票（普通发票）",
+            f"发票号码：{invoice_number}",
+            f"开票日期：{issue_date}",
+            f"购 名称：{buyer} 销 名称：{seller}",
+            "买 售",
+            "方 方",
+            "信 统一社会信用代码/纳税人识别号：91110116MA01BP9R44 信 统一社会信用代码/纳税人识别号：91110105562126449H",
+            "息 息",
+            "项目名称 规格型号 单 位 数 量 单 价 金 额 税率/征收率 税 额",
+        ]
+    footer = [f"合 计 ¥{amount:.2f} ¥{tax:.2f}"]
+    if layout == "transport":
+        footer.append("出行人 有效身份证件号 出行日期 出发地 到达地 等 级 交通工具类型")
+    footer += [
+        f"价税合计（大写） {amount_in_words(total)} （小写）¥{total:.2f}",
+        "备",
+        "注",
+        f"开票人：{issuer}",
+    ]
+
+    pages = []
+    for start in range(0, len(lines), items_per_page):
+        chunk = lines[start:start + items_per_page]
+        page = header + chunk
+        if start + items_per_page >= len(lines):
+            page += footer
+        else:
+            page.append(f"第{start // items_per_page + 1}页 续下页")
+        pages.append("\n".join(page))
+
+    return SyntheticInvoice(
+        invoice_number=invoice_number,
+        issue_date=issue_date,
+        buyer=buyer,
+        seller=seller,
+        item_name=item_name,
+        amount=amount,
+        tax_amount=tax,
+        total_amount=total,
+        tax_rate=tax_rate,
+        layout=layout,
+        pages=pages,
+    )
+
+
+def generate_corpus(count: int, seed: int = 0, **kwargs) -> List[SyntheticInvoice]:
+    """生成可复现的合成发票集合（同一seed结果相同）"""
+    rng = random.Random(seed)
+    return [generate_invoice(rng, **kwargs) for _ in range(count)]
+
+
+def render_pdf(invoice: SyntheticInvoice, font_size: float = 8) -> bytes:
+    """将合成发票渲染为PDF（每个文本页一页A4，需要PyMuPDF）"""
+    import fitz
+
+    doc = fitz.open()
+    for text in invoice.pages:
+        page = doc.new_page(width=595, height=842)
+        page.insert_text((30, 50), text, fontname="china-s", fontsize=font_size)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def write_corpus(directory: str, count: int, seed: int = 0, **kwargs) -> List[Path]:
+    """
+    将合成发票写为PDF文件，并生成 expected.jsonl 记录期望的提取结果
+
+    Args:
+        directory: 输出目录
+        count: 发票数量
+        seed: 随机种子
+
+    Returns:
+        List[Path]: 生成的PDF路径
+    """
+    out = Path(directory)
+    out.mkdir(parents=True, exist_ok=True)
+    paths = []
+    with open(out / "expected.jsonl", "w", encoding="utf-8") as manifest:
+        for i, invoice in enumerate(generate_corpus(count, seed=seed, **kwargs)):
+            path = out / f"invoice_{i:05d}.pdf"
+            path.write_bytes(render_pdf(invoice))
+            record = asdict(invoice)
+            record.pop("pages")
+            record["file_name"] = path.name
+            manifest.write(json.dumps(record, ensure_ascii=False) + "\n")
+            paths.append(path)
+    return paths
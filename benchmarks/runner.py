@@ -0,0 +1,317 @@
+# benchmarks/runner.py
+import json
+import math
+import os
+import platform
+import resource
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import tomli
+
+from config import BATCH_CONFIG, COMPANY_SUFFIXES, logger
+from extractors import RegexExtractor, create_extractor
+from utils.file_utils import extract_text_from_pdf
+from .corpus import SyntheticInvoice, generate_corpus, render_pdf
+
+
+def current_rss_mb() -> float:
+    """当前进程常驻内存（MB），非Linux系统退化为历史峰值"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError, IndexError):
+        return max_rss_mb()
+
+
+def max_rss_mb() -> float:
+    """进程生命周期内的最大常驻内存（MB）"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 单位为字节，Linux 为KB
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024
+
+
+def percentile(values: List[float], q: float) -> float:
+    """最近秩法分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class StageRecorder:
+    """按阶段记录耗时样本与阶段结束时的常驻内存峰值"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self.peak_rss: Dict[str, float] = defaultdict(float)
+        self.payload_bytes: List[int] = []
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.samples[name].append(time.perf_counter() - start)
+            self.peak_rss[name] = max(self.peak_rss[name], current_rss_mb())
+
+    def add_bytes(self, size: int) -> None:
+        """记录一次模型请求的图片负载字节数"""
+        self.payload_bytes.append(size)
+
+    def summary(self) -> Dict[str, Dict]:
+        return {
+            name: {
+                "count": len(values),
+                "p50_ms": percentile(values, 50) * 1000,
+                "p95_ms": percentile(values, 95) * 1000,
+                "p99_ms": percentile(values, 99) * 1000,
+                "mean_ms": sum(values) / len(values) * 1000,
+                "peak_rss_mb": round(self.peak_rss[name], 1),
+            }
+            for name, values in self.samples.items()
+        }
+
+
+def _matches(invoice, expected: SyntheticInvoice) -> bool:
+    """号码与价税合计均正确视为提取正确"""
+    return (
+        invoice is not None
+        and invoice.invoice_number == expected.invoice_number
+        and invoice.total_amount is not None
+        and abs(invoice.total_amount - expected.total_amount) < 0.005
+    )
+
+
+def bench_regex(extractor: RegexExtractor, pdf: bytes, recorder: StageRecorder):
+    with recorder.stage("pdf_parse"):
+        text = extract_text_from_pdf(BytesIO(pdf))
+    with recorder.stage("extract"):
+        return extractor.extract(text)
+
+
+def bench_llm(extractor, pdf: bytes, recorder: StageRecorder):
+    with recorder.stage("pdf_parse"):
+        text = extract_text_from_pdf(BytesIO(pdf))
+    with recorder.stage("model_call"):
+        result = extractor.extract_with_llm(text)
+    with recorder.stage("parse"):
+        return extractor._create_invoice_from_result(result)
+
+
+def bench_vlm(extractor, pdf: bytes, recorder: StageRecorder):
+    with recorder.stage("rasterise"):
+        pixmaps = list(extractor._iter_pdf_pixmaps(pdf))
+    with recorder.stage("encode"):
+        payload = [extractor._encode_pixmap(pix) for pix in pixmaps]
+    recorder.add_bytes(sum(len(data) for data in payload))
+    with recorder.stage("model_call"):
+        result = extractor._call_vlm_api(payload, extractor._generate_invoice_prompt())
+    if not result:
+        raise RuntimeError("API处理失败")
+    with recorder.stage("parse"):
+        return extractor._create_invoice_from_result("", result)
+
+
+def bench_hybrid(extractor, pdf: bytes, recorder: StageRecorder):
+    with recorder.stage("pdf_parse"):
+        text = extract_text_from_pdf(BytesIO(pdf))
+    with recorder.stage("extract"):
+        return extractor.extract(text)
+
+
+BENCHES = {
+    "regex": bench_regex,
+    "llm": bench_llm,
+    "hybrid": bench_hybrid,
+    "vlm": bench_vlm,
+}
+
+
+def run_packed(corpus: List[SyntheticInvoice], pdfs: List[bytes], model: Optional[str] = None) -> Dict:
+    """
+    LLM打包模式：按 plan_packs 分组，每组一个请求（顺序执行，与逐张请求的 llm 模式对比）
+
+    打包数取 batch_config.pack_size，未开启（1）时按8张计。
+    """
+    extractor = create_extractor("llm", model)
+    pack_size = BATCH_CONFIG.get("pack_size", 1)
+    extractor.pack_size = pack_size if pack_size > 1 else 8
+    recorder = StageRecorder()
+    start = time.perf_counter()
+    texts = []
+    for pdf in pdfs:
+        with recorder.stage("pdf_parse"):
+            texts.append(extract_text_from_pdf(BytesIO(pdf)))
+    invoices, errors = [], 0
+    packs = extractor.plan_packs(texts)
+    for pack in packs:
+        with recorder.stage("model_call"):
+            try:
+                invoices.extend(extractor.extract_pack([texts[i] for i in pack]))
+            except Exception as e:
+                logger.warning(f"llm-pack 基准单包失败: {str(e)}")
+                errors += len(pack)
+                invoices.extend([None] * len(pack))
+    wall = time.perf_counter() - start
+    usage = extractor.usage_stats()
+    return {
+        "model": extractor.model_path,
+        "invoices": len(corpus),
+        "errors": errors,
+        "accuracy": sum(map(_matches, invoices, corpus)) / len(corpus) if corpus else 0.0,
+        "wall_seconds": wall,
+        "invoices_per_sec": len(corpus) / wall if wall else 0.0,
+        "stages": recorder.summary(),
+        "mean_pack_size": len(corpus) / len(packs) if packs else 0.0,
+        "pack_splits": usage["pack_splits"],
+        "prompt_tokens_per_invoice": usage["prompt_tokens"] / len(corpus) if corpus else 0.0,
+    }
+
+
+def run_extractor(mode: str, corpus: List[SyntheticInvoice], pdfs: List[bytes],
+                  model: Optional[str] = None) -> Dict:
+    """对单个提取器顺序运行整个语料，返回吞吐、准确率与各阶段统计"""
+    if mode == "llm-pack":
+        return run_packed(corpus, pdfs, model)
+    extractor = RegexExtractor(COMPANY_SUFFIXES) if mode == "regex" else create_extractor(mode, model)
+    recorder = StageRecorder()
+    errors = correct = 0
+    start = time.perf_counter()
+    for expected, pdf in zip(corpus, pdfs):
+        try:
+            invoice = BENCHES[mode](extractor, pdf, recorder)
+        except Exception as e:
+            logger.warning(f"{mode} 基准单张失败: {str(e)}")
+            errors += 1
+            continue
+        correct += _matches(invoice, expected)
+    wall = time.perf_counter() - start
+    result = {
+        "model": getattr(extractor, "model_path", None),
+        "invoices": len(corpus),
+        "errors": errors,
+        "accuracy": correct / len(corpus) if corpus else 0.0,
+        "wall_seconds": wall,
+        "invoices_per_sec": len(corpus) / wall if wall else 0.0,
+        "stages": recorder.summary(),
+    }
+    if recorder.payload_bytes:
+        result["mean_payload_kb"] = sum(recorder.payload_bytes) / len(recorder.payload_bytes) / 1024
+    if hasattr(extractor, "stats"):
+        result["model_avoided_ratio"] = extractor.stats()["model_avoided_ratio"]
+    if hasattr(extractor, "usage_stats"):
+        result["prompt_tokens_per_invoice"] = extractor.usage_stats()["prompt_tokens"] / len(corpus) if corpus else 0.0
+    return result
+
+
+def project_version() -> str:
+    with open(Path(__file__).resolve().parent.parent / "pyproject.toml", "rb") as f:
+        return tomli.load(f)["tool"]["poetry"]["version"]
+
+
+def run_benchmarks(modes: List[str], count: int, seed: int = 0,
+                   llm_model: Optional[str] = None, vlm_model: Optional[str] = None,
+                   **corpus_kwargs) -> Dict:
+    """
+    生成语料并依次运行各提取器
+
+    Args:
+        modes: 提取器列表（regex/llm/vlm）
+        count: 合成发票数量
+        seed: 随机种子
+        llm_model / vlm_model: settings.yaml 中的模型名称
+        corpus_kwargs: 传给 generate_corpus 的参数（明细行数、分页等）
+
+    Returns:
+        Dict: 可直接写为JSON的结果
+    """
+    corpus = generate_corpus(count, seed=seed, **corpus_kwargs)
+    render_start = time.perf_counter()
+    pdfs = [render_pdf(invoice) for invoice in corpus]
+    render_seconds = time.perf_counter() - render_start
+
+    results = {}
+    for mode in modes:
+        model_name = {"llm": llm_model, "llm-pack": llm_model, "hybrid": llm_model, "vlm": vlm_model}.get(mode)
+        results[mode] = run_extractor(mode, corpus, pdfs, model_name)
+
+    return {
+        "meta": {
+            "version": project_version(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "corpus": {
+                "count": count,
+                "seed": seed,
+                "pages": sum(len(invoice.pages) for invoice in corpus),
+                "render_seconds": render_seconds,
+                **corpus_kwargs,
+            },
+        },
+        "results": results,
+        "process_max_rss_mb": round(max_rss_mb(), 1),
+    }
+
+
+def compare_results(baseline: Dict, current: Dict, threshold: float = 0.1) -> List[str]:
+    """
+    对比两次基准结果，返回超过阈值的退化项
+
+    Args:
+        baseline: 基线结果
+        current: 本次结果
+        threshold: 允许的相对退化比例（0.1 即 10%）
+
+    Returns:
+        List[str]: 退化说明，空列表表示无退化
+    """
+    regressions = []
+    for mode, result in current["results"].items():
+        base = baseline["results"].get(mode)
+        if not base:
+            continue
+        if result["invoices_per_sec"] < base["invoices_per_sec"] * (1 - threshold):
+            regressions.append(
+                f"{mode}: 吞吐 {base['invoices_per_sec']:.2f} -> {result['invoices_per_sec']:.2f} 张/秒"
+            )
+        for stage, stats in result["stages"].items():
+            base_stats = base["stages"].get(stage)
+            if base_stats and stats["p95_ms"] > base_stats["p95_ms"] * (1 + threshold):
+                regressions.append(
+                    f"{mode}.{stage}: p95 {base_stats['p95_ms']:.2f} -> {stats['p95_ms']:.2f} ms"
+                )
+    return regressions
+
+
+def format_report(report: Dict) -> str:
+    """生成便于终端阅读的摘要"""
+    lines = []
+    for mode, result in report["results"].items():
+        lines.append(
+            f"[{mode}] {result['invoices_per_sec']:.2f} 张/秒  准确率 {result['accuracy']:.1%}  "
+            f"错误 {result['errors']}/{result['invoices']}"
+            + (f"  免调用模型 {result['model_avoided_ratio']:.1%}" if "model_avoided_ratio" in result else "")
+            + (f"  平均每包 {result['mean_pack_size']:.1f} 张" if "mean_pack_size" in result else "")
+        )
+        for stage, stats in result["stages"].items():
+            lines.append(
+                f"    {stage:<11} p50 {stats['p50_ms']:9.2f} ms  p95 {stats['p95_ms']:9.2f} ms  "
+                f"p99 {stats['p99_ms']:9.2f} ms  RSS {stats['peak_rss_mb']:.0f} MB"
+            )
+    lines.append(f"进程最大RSS: {report['process_max_rss_mb']} MB")
+    return "\n".join(lines)
+
+
+def save_report(report: Dict, path: str) -> None:
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
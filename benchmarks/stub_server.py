@@ -0,0 +1,414 @@
+# benchmarks/stub_server.py
+"""
+本地模拟模型服务：实现项目调用的两个接口，用于可复现的负载测试
+
+    /v1/chat/completions  OpenAI兼容（LLMExtractor、utils.llm_utils.ask_llm）
+    /api/generate         Ollama（VLMExtractor._call_vlm_api）
+
+    python -m benchmarks.stub_server --port 11435 --latency lognormal:-0.7,0.4 --error-rate 0.02
+    OLLAMA_BASE_URL=http://127.0.0.1:11435 streamlit run app.py
+"""
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# 默认的提取结果（与提示词中的样本2一致）
+DEFAULT_EXTRACT_ANSWER = {
+    "购方名称": "北京星石娱动国际传媒有限公司",
+    "销方名称": "苏州市吉利优行电子科技有限公司",
+    "发票号码": "25327000000693696263",
+    "开票日期": "2025年06月23日",
+    "项目名称": "*运输服务*客运服务费",
+    "金额": "98.77",
+    "税率": "3%",
+    "税额": "2.96",
+    "价税合计": "101.73",
+    "价税合计(小写)": "101.73",
+    "开票人": "钟寒冰",
+}
+DEFAULT_CHAT_ANSWER = "根据提供的发票数据，共有若干张发票，价税合计请以明细为准。"
+# 打包请求中每张发票的分节标题（见 LLMExtractor 的 PACK_SECTION）
+PACK_SECTION_RE = re.compile(r"^## 发票 (\d+)$", re.MULTILINE)
+
+
+class LatencyModel:
+    """
+    延迟分布（秒），格式 "类型:参数"：
+        fixed:0.5 | uniform:0.2,1.0 | normal:0.5,0.1 | lognormal:mu,sigma | exponential:0.5
+    """
+
+    KINDS = ("fixed", "uniform", "normal", "lognormal", "exponential")
+
+    def __init__(self, spec: str = "fixed:0"):
+        kind, _, params = spec.partition(":")
+        if kind not in self.KINDS:
+            raise ValueError(f"不支持的延迟分布: {kind}，可选: {', '.join(self.KINDS)}")
+        self.kind = kind
+        self.params = [float(p) for p in params.split(",") if p] or [0.0]
+        self.spec = spec
+
+    def sample(self, rng: random.Random) -> float:
+        p = self.params
+        if self.kind == "fixed":
+            value = p[0]
+        elif self.kind == "uniform":
+            value = rng.uniform(p[0], p[1])
+        elif self.kind == "normal":
+            value = rng.gauss(p[0], p[1])
+        elif self.kind == "lognormal":
+            value = rng.lognormvariate(p[0], p[1])
+        else:
+            value = rng.expovariate(1 / p[0]) if p[0] > 0 else 0.0
+        return max(0.0, value)
+
+
+@dataclass
+class StubConfig:
+    latency: LatencyModel = field(default_factory=LatencyModel)
+    error_rate: float = 0.0
+    error_status: int = 500
+    tokens_per_sec: float = 0.0          # 0 表示不模拟逐token生成耗时
+    prefill_tokens_per_sec: float = 0.0  # 0 表示不模拟提示词预填充耗时
+    answer_mode: str = "canned"          # canned：固定答案；regex：按提示词中的发票文本生成答案
+    extract_answer: Dict = field(default_factory=lambda: dict(DEFAULT_EXTRACT_ANSWER))
+    chat_answer: str = DEFAULT_CHAT_ANSWER
+    seed: int = 0
+
+
+class StubStats:
+    """请求计数与最大并发，供 /stub/stats 查询"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.by_path: Dict[str, int] = {}
+
+    @contextmanager
+    def track(self, path: str):
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            self.by_path[path] = self.by_path.get(path, 0) + 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def record_error(self):
+        with self._lock:
+            self.errors += 1
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight,
+                "by_path": dict(self.by_path),
+            }
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算token数：中日韩字符各计1个，其余约4个字符计1个"""
+    cjk = sum(1 for ch in text if "一" <= ch <= "鿿")
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def split_tokens(text: str) -> List[str]:
+    """按模拟token切分输出（中文逐字，其余按单词/符号）"""
+    return re.findall(r"[一-鿿]|\w+|\s+|[^\w\s]", text)
+
+
+class StubModelServer:
+    """模拟服务实例：行为由 StubConfig 决定，随机性由 seed 固定"""
+
+    def __init__(self, config: StubConfig):
+        self.config = config
+        self.stats = StubStats()
+        self._rng = random.Random(config.seed)
+        self._rng_lock = threading.Lock()
+        self._regex_extractor = None
+
+    def draw(self) -> Tuple[float, bool]:
+        """抽取本次请求的延迟与是否失败（加锁保证同一seed下序列可复现）"""
+        with self._rng_lock:
+            return self.config.latency.sample(self._rng), self._rng.random() < self.config.error_rate
+
+    def extract_answer(self, prompt: str) -> Dict:
+        """单张发票返回JSON对象；打包请求（“## 发票 序号”分节）返回 {"发票": [...]}"""
+        text = prompt.rsplit("发票文本", 1)[-1]
+        sections = PACK_SECTION_RE.split(text)
+        if len(sections) < 3:
+            return self.answer_one(text)
+        return {"发票": [
+            {**self.answer_one(body), "序号": int(index)}
+            for index, body in zip(sections[1::2], sections[2::2])
+        ]}
+
+    def answer_one(self, text: str) -> Dict:
+        if self.config.answer_mode != "regex":
+            return self.config.extract_answer
+        if self._regex_extractor is None:
+            from config import COMPANY_SUFFIXES
+            from extractors import RegexExtractor
+            self._regex_extractor = RegexExtractor(COMPANY_SUFFIXES)
+        invoice = self._regex_extractor.extract(text)
+        if not invoice.invoice_number:
+            # 提示词中没有发票文本（如VLM只传图片），退回固定答案
+            return self.config.extract_answer
+        total = f"{invoice.total_amount:.2f}" if invoice.total_amount is not None else ""
+        return {
+            "购方名称": invoice.buyer or "",
+            "销方名称": invoice.seller or "",
+            "发票号码": invoice.invoice_number or "",
+            "开票日期": invoice.issue_date or "",
+            "项目名称": invoice.item_name or "",
+            "金额": f"{invoice.amount:.2f}" if invoice.amount is not None else "",
+            "税额": f"{invoice.tax_amount:.2f}" if invoice.tax_amount is not None else "",
+            "价税合计": total,
+            "价税合计(小写)": total,
+        }
+
+    def answer(self, prompt: str, wants_json: bool) -> str:
+        if wants_json:
+            return json.dumps(self.extract_answer(prompt), ensure_ascii=False)
+        return self.config.chat_answer
+
+    def generation_delay(self, prompt: str) -> float:
+        """提示词预填充耗时（按估算token数）"""
+        rate = self.config.prefill_tokens_per_sec
+        return estimate_tokens(prompt) / rate if rate > 0 else 0.0
+
+    def token_interval(self) -> float:
+        rate = self.config.tokens_per_sec
+        return 1 / rate if rate > 0 else 0.0
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    server_version = "FapiaoStub/1.0"
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def stub(self) -> StubModelServer:
+        return self.server.stub
+
+    def log_message(self, format, *args):  # noqa: A002 - 覆盖基类签名
+        pass
+
+    def _send_json(self, status: int, payload: Dict) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self) -> Dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        if self.path == "/stub/stats":
+            self._send_json(200, self.stub.stats.snapshot())
+        elif self.path == "/v1/models":
+            self._send_json(200, {"object": "list", "data": [{"id": "stub", "object": "model"}]})
+        elif self.path == "/api/tags":
+            self._send_json(200, {"models": [{"name": "stub"}]})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        routes = {"/v1/chat/completions": self._chat_completions, "/api/generate": self._generate}
+        handler = routes.get(self.path.split("?")[0])
+        if handler is None:
+            self._send_json(404, {"error": "not found"})
+            return
+        with self.stub.stats.track(self.path):
+            request = self._read_json()
+            latency, fail = self.stub.draw()
+            time.sleep(latency)
+            if fail:
+                self.stub.stats.record_error()
+                self._send_json(self.stub.config.error_status, {
+                    "error": {"message": "stub injected error", "type": "server_error"}
+                })
+                return
+            handler(request)
+
+    def _stream(self, content_type: str, chunks: Iterator[bytes]) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for chunk in chunks:
+            self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _tokens(self, text: str) -> Iterator[str]:
+        interval = self.stub.token_interval()
+        for token in split_tokens(text):
+            if interval:
+                time.sleep(interval)
+            yield token
+
+    def _chat_completions(self, request: Dict) -> None:
+        messages = request.get("messages", [])
+        prompt = "\n".join(str(m.get("content", "")) for m in messages)
+        wants_json = (request.get("response_format") or {}).get("type") == "json_object"
+        answer = self.stub.answer(prompt, wants_json)
+        time.sleep(self.stub.generation_delay(prompt))
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+        model = request.get("model", "stub")
+        usage = {
+            "prompt_tokens": estimate_tokens(prompt),
+            "completion_tokens": len(split_tokens(answer)),
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+        if not request.get("stream"):
+            interval = self.stub.token_interval()
+            time.sleep(interval * usage["completion_tokens"])
+            self._send_json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": answer},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage,
+            })
+            return
+
+        def events() -> Iterator[bytes]:
+            base = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model}
+            for token in self._tokens(answer):
+                chunk = {**base, "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]}
+                yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8")
+            final = {**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+            yield f"data: {json.dumps(final)}\n\n".encode("utf-8")
+            yield b"data: [DONE]\n\n"
+
+        self._stream("text/event-stream", events())
+
+    def _generate(self, request: Dict) -> None:
+        prompt = str(request.get("prompt", ""))
+        answer = self.stub.answer(prompt, request.get("format") == "json")
+        time.sleep(self.stub.generation_delay(prompt))
+        model = request.get("model", "stub")
+        eval_count = len(split_tokens(answer))
+
+        def record(response: str, done: bool) -> Dict:
+            return {
+                "model": model,
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "response": response,
+                "done": done,
+            }
+
+        if request.get("stream") is False:
+            time.sleep(self.stub.token_interval() * eval_count)
+            self._send_json(200, {
+                **record(answer, True),
+                "prompt_eval_count": estimate_tokens(prompt),
+                "eval_count": eval_count,
+            })
+            return
+
+        def lines() -> Iterator[bytes]:
+            for token in self._tokens(answer):
+                yield (json.dumps(record(token, False), ensure_ascii=False) + "\n").encode("utf-8")
+            yield (json.dumps({**record("", True), "eval_count": eval_count}) + "\n").encode("utf-8")
+
+        self._stream("application/x-ndjson", lines())
+
+
+def create_server(config: StubConfig, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """创建（未启动的）模拟服务，port=0 时自动分配端口"""
+    server = ThreadingHTTPServer((host, port), StubRequestHandler)
+    server.daemon_threads = True
+    server.stub = StubModelServer(config)
+    return server
+
+
+@contextmanager
+def run_stub_server(config: Optional[StubConfig] = None, host: str = "127.0.0.1",
+                    port: int = 0) -> Iterator[ThreadingHTTPServer]:
+    """
+    在后台线程中运行模拟服务，供基准脚本使用
+
+        with run_stub_server(StubConfig(latency=LatencyModel("fixed:0.2"))) as server:
+            base_url = f"http://127.0.0.1:{server.server_port}"
+    """
+    server = create_server(config or StubConfig(), host, port)
+    thread = threading.Thread(target=server.serve_forever, name="fapiao-stub", daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="OpenAI/Ollama 兼容的本地模拟模型服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--latency", default="fixed:0", help="延迟分布，如 fixed:0.5、uniform:0.2,1.0、lognormal:-0.7,0.4")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="注入错误的概率（0~1）")
+    parser.add_argument("--error-status", type=int, default=500, help="注入错误的HTTP状态码")
+    parser.add_argument("--tokens-per-sec", type=float, default=0.0, help="输出token速率，0为不限")
+    parser.add_argument("--prefill-tokens-per-sec", type=float, default=0.0, help="提示词预填充速率，0为不模拟")
+    parser.add_argument("--answer-mode", choices=["canned", "regex"], default="canned",
+                        help="canned：固定答案；regex：用正则提取提示词中的发票作为答案")
+    parser.add_argument("--answers", help="JSON文件，可含 extract（对象）与 chat（字符串）两项")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    config = StubConfig(
+        latency=LatencyModel(args.latency),
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        tokens_per_sec=args.tokens_per_sec,
+        prefill_tokens_per_sec=args.prefill_tokens_per_sec,
+        answer_mode=args.answer_mode,
+        seed=args.seed,
+    )
+    if args.answers:
+        with open(args.answers, encoding="utf-8") as f:
+            answers = json.load(f)
+        config.extract_answer = answers.get("extract", config.extract_answer)
+        config.chat_answer = answers.get("chat", config.chat_answer)
+
+    server = create_server(config, args.host, args.port)
+    print(f"模拟模型服务已启动: http://{args.host}:{server.server_port}  (Ctrl+C 退出)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
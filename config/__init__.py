@@ -27,6 +27,15 @@ MODEL_OPTIONS = OLLAMA_MODEL_OPTIONS if _config['default_model'] == 'ollama' els
 COMPANY_SUFFIXES = _config['company_suffixes']
 DEFAULT_INVOICE_FIELDS = _config['default_invoice_fields']
 SUPPORTED_FILE_TYPES = _config['supported_file_types']
+BATCH_CONFIG = _config.get('batch_config', {})
+CACHE_CONFIG = _config.get('cache_config', {})
+RASTER_CONFIG = _config.get('raster_config', {})
+HTTP_CONFIG = _config.get('http_config', {})
+CHAT_CONFIG = _config.get('chat_config', {})
+DUPLICATE_CONFIG = _config.get('duplicate_config', {})
+WARMUP_CONFIG = _config.get('warmup_config', {})
+CASCADE_CONFIG = _config.get('cascade_config', {})
+CACHE_CONFIG["directory"] = os.getenv("FAPIAO_CACHE_DIR", CACHE_CONFIG.get("directory", ".cache"))
 
 def switch_to_vllm():
     """切换到VLLM模型（保持原有功能）"""
@@ -2,10 +2,19 @@ from .base_extractor import *
 from .regex_extractor import *
 from .llm_extractor import *
 from .vlm_extractor import *
+from .hybrid_extractor import *
+from .cascade_extractor import *
+from .async_extractor import *
+from .factory import *
 
 __all__ = [
     'BaseExtractor',
     'RegexExtractor', 
     'LLMExtractor',
-    'VLMExtractor'
+    'VLMExtractor',
+    'HybridExtractor',
+    'CascadeExtractor',
+    'AsyncLLMExtractor',
+    'AsyncVLMExtractor',
+    'create_extractor'
 ]
@@ -0,0 +1,183 @@
+# extractors/async_extractor.py
+import asyncio
+from typing import AsyncIterator, Awaitable, Callable, Iterable, Optional, Tuple, TypeVar
+
+import httpx
+
+from config import API_CONFIG, BATCH_CONFIG, COMPANY_SUFFIXES
+from models import Invoice, InvoiceFile, FileInput
+from .client_pool import create_async_http_client, create_async_openai_client
+from .llm_extractor import LLMExtractor
+from .vlm_extractor import VLMExtractor
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+async def bounded_as_completed(
+    items: Iterable[T],
+    worker: Callable[[T], Awaitable[R]],
+    concurrency: Optional[int] = None
+    ) -> AsyncIterator[Tuple[int, R]]:
+    """
+    以有限并发执行 worker，按完成顺序产出 (输入序号, 结果)
+
+    在途任务数达到上限时暂停读取输入（信号量背压），输入可以是惰性迭代器。
+    生成器提前关闭时取消尚未完成的任务。
+
+    Args:
+        items: 输入
+        worker: 处理单个输入的协程函数
+        concurrency: 最大在途任务数，默认取 batch_config.async_concurrency
+
+    Yields:
+        Tuple[int, R]: (输入序号, 结果)
+    """
+    semaphore = asyncio.Semaphore(concurrency or BATCH_CONFIG.get("async_concurrency", 64))
+    pending = set()
+
+    async def run(index: int, item: T) -> Tuple[int, R]:
+        try:
+            return index, await worker(item)
+        finally:
+            semaphore.release()
+
+    try:
+        for index, item in enumerate(items):
+            await semaphore.acquire()
+            pending.add(asyncio.create_task(run(index, item)))
+            finished = {task for task in pending if task.done()}
+            pending -= finished
+            for task in finished:
+                yield task.result()
+        while pending:
+            finished, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in finished:
+                yield task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+class AsyncExtractorMixin:
+    """异步提取器公共部分：客户端生命周期与 extract_many"""
+
+    def _loop_bound(self, attr: str, factory: Callable):
+        """异步客户端绑定事件循环：当前循环与创建时不同则重新创建"""
+        loop = asyncio.get_running_loop()
+        client, owner = getattr(self, attr, (None, None))
+        if client is None or owner is not loop:
+            client = factory()
+            setattr(self, attr, (client, loop))
+        return client
+
+    async def aclose(self) -> None:
+        """关闭异步客户端"""
+        raise NotImplementedError
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+    async def aextract(self, item) -> Invoice:
+        raise NotImplementedError
+
+    async def _aextract_safe(self, item) -> Invoice:
+        """单个输入出错时返回带error的Invoice，不影响其他输入"""
+        try:
+            return await self.aextract(item)
+        except Exception as e:
+            self.logger.error(f"{type(self).__name__}.aextract 运行失败: {str(e)}")
+            return Invoice(file_name=getattr(item, "name", ""), error=str(e))
+
+    async def extract_many(self, items: Iterable, concurrency: Optional[int] = None
+                           ) -> AsyncIterator[Tuple[int, Invoice]]:
+        """
+        并发提取，按完成顺序产出 (输入序号, Invoice)
+
+        Args:
+            items: 提取器的原生输入（LLM为发票文本，VLM为文件）
+            concurrency: 最大在途请求数，默认取 batch_config.async_concurrency
+
+        Yields:
+            Tuple[int, Invoice]: (输入序号, 提取结果)
+        """
+        async for index, invoice in bounded_as_completed(items, self._aextract_safe, concurrency):
+            yield index, invoice
+
+
+class AsyncLLMExtractor(AsyncExtractorMixin, LLMExtractor):
+    """基于 AsyncOpenAI 的LLM提取器，提示词与结果解析沿用 LLMExtractor"""
+
+    def __init__(self, model_path: str,
+                 api_key: str = API_CONFIG["api_key"], base_url: str = API_CONFIG["base_url"],
+                 suffixes: list = COMPANY_SUFFIXES):
+        super().__init__(model_path, api_key, base_url, suffixes)
+        self.api_key = api_key
+        self.base_url = base_url
+
+    @property
+    def async_client(self):
+        return self._loop_bound(
+            "_async_client", lambda: create_async_openai_client(self.base_url, self.api_key)
+        )
+
+    async def aextract_with_llm(self, text: str) -> Optional[dict]:
+        try:
+            response = await self.async_client.chat.completions.create(**self._build_request(text))
+            self._record_usage(response)
+            return self._parse_completion(response.choices[0].message.content)
+        except Exception as e:
+            self.logger.error(f"{__name__}.aextract_with_llm 运行失败: {str(e)}")
+            raise
+
+    async def aextract(self, text: str) -> Invoice:
+        return self._create_invoice_from_result(await self.aextract_with_llm(text))
+
+    async def aclose(self) -> None:
+        client, _ = getattr(self, "_async_client", (None, None))
+        if client is not None:
+            await client.close()
+            self._async_client = (None, None)
+
+
+class AsyncVLMExtractor(AsyncExtractorMixin, VLMExtractor):
+    """基于 httpx.AsyncClient 的VLM提取器，文件预处理在线程中执行，请求与解析沿用 VLMExtractor"""
+
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        return self._loop_bound("_async_client", lambda: create_async_http_client(self.ollama_url))
+
+    async def _acall_vlm_api(self, inputs, prompt: str):
+        headers, data = self._build_vlm_request(inputs, prompt)
+        try:
+            response = await self.async_client.post("/api/generate", headers=headers, json=data)
+            return self._handle_vlm_result(response.json())
+        except (httpx.HTTPError, ValueError) as e:
+            self.logger.error(f"API请求失败: {str(e)}")
+            return None
+
+    async def aextract_prepared(self, file_name: str, prepared) -> Invoice:
+        processed_data, _ = prepared
+        result = await self._acall_vlm_api(processed_data, self._generate_invoice_prompt())
+        if not result:
+            return Invoice(file_name=file_name, error="API处理失败")
+        return self._create_invoice_from_result(file_name, result)
+
+    async def aextract(self, uploaded_file: FileInput) -> Invoice:
+        uploaded_file = InvoiceFile.coerce(uploaded_file)
+        file_name = getattr(uploaded_file, 'name', '未知文件')
+        try:
+            # PDF转图片为CPU密集操作，放到线程中执行，避免阻塞事件循环
+            prepared = await asyncio.to_thread(self.prepare, uploaded_file)
+        except ValueError as e:
+            return Invoice(file_name=file_name, error=str(e))
+        return await self.aextract_prepared(file_name, prepared)
+
+    async def aclose(self) -> None:
+        client, _ = getattr(self, "_async_client", (None, None))
+        if client is not None:
+            await client.aclose()
+            self._async_client = (None, None)
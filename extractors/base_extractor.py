@@ -1,33 +1,77 @@
 # extractors/base_extractor.py
 from typing import Dict, Optional, Tuple
 import re
+import hashlib
 from models import Invoice
 from config import logger
 from datetime import datetime
 from typing import Dict, Optional, List, Tuple, Union
 
+# 预编译的公共正则（进程内只编译一次）
+AMOUNT_WHITESPACE_RE = re.compile(r'[ \s\u3000]+')
+# 合计行：金额、税额（`.*?¥` 与原 `.*?[^¥]*¥` 匹配结果相同，但省去了重复回溯）
+TOTAL_PAIR_RE = re.compile(r'(?:合\s*计|价税合计).*?¥\s*(\d+\.\d{1,2}).*?¥\s*(\d+\.\d{1,2})')
+# 价税合计（优先匹配带“大写/小写”标注的写法）
+TOTAL_WITH_TAX_RE = re.compile(r"价税合计\s*\(?[大小]写\)?[^¥]*¥\s*(\d+\.\d{1,2})")
+TOTAL_WITH_TAX_LOOSE_RE = re.compile(r"价税合计[^\d]*[^¥]*¥\s*(\d+\.\d{1,2})")
+DETAIL_LINE_RE = re.compile(r'(?:\*.*?\*)\s+[\d.-]+\s+\d+\s+([\d.-]+)\s+\d+%?\s+([\d.-]+)')
+# 明细行税率：从“*类别*”起到同一行的税率（下一个“*类别*”之前），免税/不征税按0
+DETAIL_RATE_RE = re.compile(r'\*[^*\s]+\*[^*%]*?\s(\d+(?:\.\d+)?%|免税|不征税)')
+TAX_RATE_RE = re.compile(r'(\d+(?:\.\d+)?)\s*%|免税|不征税')
+TOTAL_FALLBACK_RE = re.compile(r'价税合计.*?¥\s*(\d+\.\d{2})')
+# 价税合计大写（如“价税合计（大写） 壹佰零壹圆柒角叁分”）
+TOTAL_IN_WORDS_RE = re.compile(r'价税合计\s*[（(]?\s*大\s*写\s*[）)]?[\s⨂ⓧ]*([零壹贰叁肆伍陆柒捌玖拾佰仟万亿元圆角分整正]+)')
+CHINESE_DIGITS = {
+    '零': 0, '壹': 1, '贰': 2, '叁': 3, '肆': 4,
+    '伍': 5, '陆': 6, '柒': 7, '捌': 8, '玖': 9
+}
+CHINESE_UNITS = {'拾': 10, '佰': 100, '仟': 1000}
+
+COMPANY_PATTERN = r"""
+    (?:(?:[购买销售]\s*)?名称\s*[:：]\s*)?
+    ([^\s：:]+?(?:{})[^)\s]*)
+    \s+
+    (?:(?:[销售售]\s*)?名称\s*[:：]\s*)?
+    ([^\s：:]+?(?:{})[^)\s]*)
+"""
+
 class BaseExtractor:
+    # 提取器所需的输入类型："text" 为PDF/OCR文本，"file" 为原始文件
+    input_kind = "text"
+
     def __init__(self, suffixes: list):
         self.suffixes = suffixes
-    
+
+    @property
+    def suffixes(self) -> list:
+        return self._suffixes
+
+    @suffixes.setter
+    def suffixes(self, suffixes: list):
+        # 购销方正则只在后缀词库变化时编译一次
+        self._suffixes = suffixes
+        alternatives = "|".join(suffixes)
+        self._company_re = re.compile(
+            COMPANY_PATTERN.format(alternatives, alternatives), re.VERBOSE | re.DOTALL
+        )
+
     def clean_text(self, text: str) -> str:
-        return re.sub(r'\s+', ' ', text.replace('\n', ' ')).strip()
-    
+        # 与 re.sub(r'\s+', ' ', text).strip() 等价（str.split 与 \s 使用同一空白字符定义），但快数倍
+        return " ".join(text.split())
+
     def extract_companies(self, text: str) -> Tuple[Optional[str], Optional[str]]:
-        suffixes = "|".join(self.suffixes)
-        pattern = re.compile(r"""
-            (?:(?:[购买销售]\s*)?名称\s*[:：]\s*)?
-            ([^\s：:]+?(?:{})[^)\s]*)
-            \s+
-            (?:(?:[销售售]\s*)?名称\s*[:：]\s*)?
-            ([^\s：:]+?(?:{})[^)\s]*)
-        """.format(suffixes, suffixes), re.VERBOSE | re.DOTALL)
-        
-        match = pattern.search(text)
+        match = self._company_re.search(text)
         return (match.group(1).strip(), match.group(2).strip()) if match else (None, None)
-    
-    def extract_amounts(self, text: str) -> Tuple[Optional[float], Optional[float], Optional[float]]:
-        cleaned = re.sub(r'[ \s\u3000]+', ' ', text.strip())
+
+    def extract_amounts(self, text: str, normalized: bool = False) -> Tuple[Optional[float], Optional[float], Optional[float]]:
+        """
+        提取金额、税额、价税合计
+
+        Args:
+            text: 发票文本
+            normalized: 文本是否已由 clean_text 规整过（是则跳过空白归一化）
+        """
+        cleaned = text if normalized else AMOUNT_WHITESPACE_RE.sub(' ', text.strip())
 
         amount, tax, total_amount = None, None, None
 
@@ -37,18 +81,9 @@ class BaseExtractor:
         ## 价税合计(大写) ⨂ 陆拾叁元叁角 (小写) ¥ 63.3"""
 
         # 提取金额、税额
-        total_match1 = re.search(
-            r'(?:合\s*计|价税合计).*?[^¥]*¥\s*(\d+\.\d{1,2}).*?[^¥]*¥\s*(\d+\.\d{1,2})',
-            cleaned
-        )
+        total_match1 = TOTAL_PAIR_RE.search(cleaned)
         # 提取税价合计
-        total_match2 = re.search(
-            r"价税合计\s*\(?[大小]写\)?[^¥]*¥\s*(\d+\.\d{1,2})",
-            cleaned
-        ) or re.search(
-            r"价税合计[^\d]*[^¥]*¥\s*(\d+\.\d{1,2})", 
-            cleaned
-        )
+        total_match2 = TOTAL_WITH_TAX_RE.search(cleaned) or TOTAL_WITH_TAX_LOOSE_RE.search(cleaned)
         if total_match1:
             amount, tax = (float(total_match1.group(1)), float(total_match1.group(2)))
 
@@ -59,17 +94,14 @@ class BaseExtractor:
             return amount, tax, total_amount
         
         # 模式2：处理明细行累加
-        detail_lines = re.findall(
-            r'(?:\*.*?\*)\s+[\d.-]+\s+\d+\s+([\d.-]+)\s+\d+%?\s+([\d.-]+)',
-            cleaned
-        )
+        detail_lines = DETAIL_LINE_RE.findall(cleaned)
         if detail_lines:
             amount = sum(float(line[0]) for line in detail_lines)
             tax = sum(float(line[1]) for line in detail_lines)
             return (round(amount, 2), round(tax, 2), total_amount)
         
         # 模式3：反向计算价税合计
-        total = re.search(r'价税合计.*?¥\s*(\d+\.\d{2})', cleaned)
+        total = TOTAL_FALLBACK_RE.search(cleaned)
         if total:
             total_val = float(total.group(1))
             # 按照最常见税率计算（3%或6%）
@@ -80,9 +112,36 @@ class BaseExtractor:
         
         return amount, tax, total_amount
     
+    def extract_tax_rates(self, text: str) -> Optional[List[float]]:
+        """明细行税率（每行一项，如 [0.13, 0.06]），文本中没有明细行时返回None"""
+        return self.parse_tax_rates(" ".join(DETAIL_RATE_RE.findall(text)))
+
+    def parse_tax_rates(self, value) -> Optional[List[float]]:
+        """
+        解析税率写法（"13%"、"13%,6%"、"免税"，或模型返回的小数 0.13）
+
+        Returns:
+            Optional[List[float]]: 按出现顺序的税率，无法解析时返回None
+        """
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return [value / 100 if value >= 1 else float(value)]
+        if not isinstance(value, str):
+            return None
+        rates = [float(match.group(1)) / 100 if match.group(1) else 0.0 for match in TAX_RATE_RE.finditer(value)]
+        return rates or None
+
+    def extract_total_in_words(self, text: str) -> Optional[str]:
+        """价税合计大写，文本中没有时返回None"""
+        match = TOTAL_IN_WORDS_RE.search(text)
+        return match.group(1) if match else None
+
     def extract(self, text: str) -> Invoice:
         raise NotImplementedError
 
+    def prompt_fingerprint(self) -> str:
+        """提示词/规则指纹，提示词变化后旧的缓存结果自动失效"""
+        return hashlib.sha256("|".join(self.suffixes).encode("utf-8")).hexdigest()[:16]
+
     def safe_extract(self, text: str) -> Invoice:
         try:
             return self.extract(text)
@@ -119,56 +178,58 @@ class BaseExtractor:
         amount_str = amount_str.strip()
         if not amount_str:
             return 0.0
-        
-        # 2. 去除无关字符
-        for char in ["元", "整", "人民币", "¥", "RMB"]:
+
+        # 2. 去除无关字符（“圆”与“元”同义，统一为“元”作为整数与角分的分界）
+        for char in ["整", "正", "人民币", "¥", "RMB"]:
             amount_str = amount_str.replace(char, "")
-        
-        # 3. 定义映射关系
-        digit_map = {
-            '零': 0, '壹': 1, '贰': 2, '叁': 3, '肆': 4,
-            '伍': 5, '陆': 6, '柒': 7, '捌': 8, '玖': 9
-        }
-        unit_map = {
-            '分': 0.01, '角': 0.1,
-            '拾': 10, '佰': 100, '仟': 1000,
-            '万': 10000, '亿': 100000000
-        }
-        
-        # 4. 分离整数和小数部分
+        amount_str = amount_str.replace("圆", "元")
+
+        # 3. 分离整数和小数部分（“元”之后为角分，“点”之后为小数位）
+        if "元" in amount_str:
+            integer_part, fraction_part = amount_str.split("元", 1)
+        elif "点" in amount_str:
+            integer_part, fraction_part = amount_str.split("点", 1)
+        elif any(char in amount_str for char in "角分"):
+            integer_part, fraction_part = "", amount_str
+        else:
+            integer_part, fraction_part = amount_str, ""
+
+        # 4. 转换整数部分：拾/佰/仟在节内累加，万/亿结束一节
+        total, section, number = 0, 0, 0
+        for char in integer_part:
+            if char in CHINESE_DIGITS:
+                number = CHINESE_DIGITS[char]
+            elif char in CHINESE_UNITS:
+                # “拾”前省略“壹”（如“拾万”）
+                section += (number or (1 if char == "拾" else 0)) * CHINESE_UNITS[char]
+                number = 0
+            elif char == "万":
+                total += (section + number) * 10000
+                section = number = 0
+            elif char == "亿":
+                total = (total + section + number) * 100000000
+                section = number = 0
+            else:
+                raise ValueError(f"无效的中文大写金额: {amount_str}")
+        integer_value = total + section + number
+
+        # 5. 转换小数部分（角分，或“点”之后逐位的小数）
+        decimal_value = 0.0
         if "点" in amount_str:
-            integer_part, decimal_part = amount_str.split("点")
+            digits = [CHINESE_DIGITS[char] for char in fraction_part if char in CHINESE_DIGITS]
+            decimal_value = sum(digit / 10 ** (i + 1) for i, digit in enumerate(digits))
         else:
-            integer_part = amount_str
-            decimal_part = ""
-        
-        # 5. 转换整数部分
-        integer_value = 0.0
-        temp_value = 0
-        current_unit = 1
-        
-        for char in reversed(integer_part):
-            if char in digit_map:
-                temp_value += digit_map[char] * current_unit
-            elif char in unit_map:
-                if unit_map[char] > current_unit:
-                    integer_value += temp_value
-                    temp_value = 0
-                    current_unit = unit_map[char]
+            number = 0
+            for char in fraction_part:
+                if char in CHINESE_DIGITS:
+                    number = CHINESE_DIGITS[char]
+                elif char in "角分":
+                    decimal_value += number * (0.1 if char == "角" else 0.01)
+                    number = 0
                 else:
-                    current_unit = unit_map[char]
-                    temp_value *= current_unit
-        integer_value += temp_value
-        
-        # 6. 转换小数部分
-        decimal_value = 0.0
-        if decimal_part:
-            for char in decimal_part:
-                if char in digit_map:
-                    decimal_value = decimal_value * 10 + digit_map[char]
-            decimal_value /= 10 ** len(decimal_part)
-        
-        return integer_value + decimal_value
+                    raise ValueError(f"无效的中文大写金额: {amount_str}")
+
+        return round(integer_value + decimal_value, 2)
 
     def to_float(self, value: Union[str, int, float]) -> float:
         """
@@ -0,0 +1,202 @@
+# extractors/cascade_extractor.py
+import hashlib
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from config import CASCADE_CONFIG, COMPANY_SUFFIXES
+from models import Invoice
+from .base_extractor import BaseExtractor
+from .hybrid_extractor import check_fields
+
+
+class CascadeExtractor(BaseExtractor):
+    """
+    模型级联：先用最小的模型提取，校验不通过的发票再交给下一个更大的模型
+
+    校验规则与分级提取相同（必填字段齐全、金额 + 税额 与价税合计一致）。
+    各级均不通过时返回缺失/错误字段最少的结果。
+    同时按模型统计调用次数、通过率与平均耗时，用于根据实际数据调整级联顺序。
+
+    批量提取时逐级处理：一组发票先全部交给第一级，未通过的子集再整体交给下一级。
+    同一时刻只有一个模型在处理请求，单GPU的Ollama不会在各级模型之间反复切换。
+    """
+
+    def __init__(self, extractors: List[BaseExtractor], tolerance: float = 0.01,
+                 suffixes: list = COMPANY_SUFFIXES, chunk_size: int = CASCADE_CONFIG.get("chunk_size", 16)):
+        """
+        初始化级联提取器
+
+        Args:
+            extractors: 按从小到大排列的 LLMExtractor 或 VLMExtractor（同一类型）
+            tolerance: 金额校验允许误差
+            suffixes: 企业后缀词库
+            chunk_size: 批处理引擎每组交给 extract_pack 的张数为 chunk_size × 并发数
+        """
+        if not extractors:
+            raise ValueError("级联至少需要一个模型")
+        super().__init__(suffixes)
+        self.logger = logging.getLogger(__name__)
+        self.extractors = extractors
+        self.tolerance = tolerance
+        # 批处理引擎据此选择文本或文件输入；pack_size > 1 时按组调用 plan_packs / extract_pack 逐级处理
+        self.input_kind = getattr(extractors[0], "input_kind", "text")
+        self.pack_size = chunk_size
+        self.model_path = "cascade:" + ">".join(ex.model_path for ex in extractors)
+        self._stats_lock = threading.Lock()
+        self.reset_stats()
+
+    def prompt_fingerprint(self) -> str:
+        """级联顺序、校验规则与各模型提示词共同决定结果，一并计入指纹"""
+        raw = f"cascade:{self.tolerance}:" + ":".join(ex.prompt_fingerprint() for ex in self.extractors)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+    def prepare(self, uploaded_file):
+        """VLM级联按最大模型的渲染参数预处理一次，各级共用（升级时不重复渲染）"""
+        return self.extractors[-1].prepare(uploaded_file)
+
+    def _attempt(self, extractor: BaseExtractor,
+                 call: Callable[[BaseExtractor], Invoice]) -> Tuple[Union[Invoice, Exception], float]:
+        """
+        调用一级模型并记录统计
+
+        Returns:
+            Tuple[Union[Invoice, Exception], float]: 结果（调用失败时为异常）与未通过校验的字段数
+                                                     （0 为通过，提取失败或调用失败为 inf）
+        """
+        started = time.perf_counter()
+        try:
+            invoice = call(extractor)
+        except Exception as e:
+            self._record(extractor.model_path, time.perf_counter() - started, passed=False, error=True)
+            self.logger.warning(f"{__name__}.extract {extractor.model_path} 调用失败: {str(e)}")
+            return e, float("inf")
+        score = float("inf") if invoice.error else len(check_fields(invoice, self.tolerance))
+        self._record(extractor.model_path, time.perf_counter() - started, score == 0, error=bool(invoice.error))
+        return invoice, score
+
+    def _cascade(self, calls: List[Callable[[BaseExtractor], Invoice]], workers: int = 1) -> List[Union[Invoice, Exception]]:
+        """
+        逐级处理一组发票：本级的全部调用完成后，未通过校验的发票再整体交给下一级
+
+        Args:
+            calls: 每张发票一个回调，参数为某一级的提取器
+            workers: 每一级的并发调用数
+
+        Returns:
+            List[Union[Invoice, Exception]]: 与 calls 顺序一致；各级均不通过时为缺失/错误字段最少的结果，
+                                             各级均调用失败时为最后一次的异常
+        """
+        best: List[Optional[Tuple[float, Invoice]]] = [None] * len(calls)  # (未通过的字段数, 结果)，提取失败的结果排在最后
+        last_error: List[Optional[Exception]] = [None] * len(calls)
+        results: List[Union[Invoice, Exception, None]] = [None] * len(calls)
+        pending = list(range(len(calls)))
+        pool = ThreadPoolExecutor(workers, thread_name_prefix="fapiao-cascade") if workers > 1 else None
+        try:
+            for level, extractor in enumerate(self.extractors):
+                if not pending:
+                    break
+                outcomes = (pool.map if pool else map)(partial(self._attempt, extractor), [calls[i] for i in pending])
+                remaining = []
+                for i, (outcome, score) in zip(pending, list(outcomes)):
+                    if isinstance(outcome, Exception):
+                        last_error[i] = outcome
+                    elif score == 0:
+                        with self._stats_lock:
+                            self._resolved[level] += 1
+                        results[i] = outcome
+                        continue
+                    elif best[i] is None or score < best[i][0]:
+                        best[i] = (score, outcome)
+                    remaining.append(i)
+                pending = remaining
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        with self._stats_lock:
+            self._unresolved += len(pending)
+        for i in pending:
+            results[i] = best[i][1] if best[i] is not None else last_error[i]
+        return results
+
+    def extract(self, text: str) -> Invoice:
+        return self._single(lambda extractor: extractor.extract(text))
+
+    def extract_prepared(self, file_name: str, prepared) -> Invoice:
+        return self._single(lambda extractor: extractor.extract_prepared(file_name, prepared))
+
+    def _single(self, call: Callable[[BaseExtractor], Invoice]) -> Invoice:
+        result = self._cascade([call])[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def plan_packs(self, payloads: List[Any]) -> List[List[int]]:
+        """批处理引擎交来的一组发票整体逐级处理（不拆分）"""
+        return [list(range(len(payloads)))] if payloads else []
+
+    def extract_pack(self, payloads: List[Any]) -> List[Invoice]:
+        """
+        逐级提取一组发票（批处理引擎的打包接口），返回与 payloads 顺序一致的结果
+
+        引擎每组交来 pack_size × 并发数 张，每一级按同样的并发数调用；各级均调用失败的发票返回带 error 的结果。
+
+        Args:
+            payloads: 发票文本，或文件型级联的 prepare() 结果
+
+        Returns:
+            List[Invoice]: 提取结果（文件名由引擎补全）
+        """
+        if self.input_kind == "file":
+            calls = [lambda extractor, p=p: extractor.extract_prepared("", p) for p in payloads]
+        else:
+            calls = [lambda extractor, p=p: extractor.extract(p) for p in payloads]
+        workers = -(-len(payloads) // self.pack_size)
+        return [Invoice(file_name="", error=str(result)) if isinstance(result, Exception) else result
+                for result in self._cascade(calls, workers)]
+
+    def _record(self, model_path: str, seconds: float, passed: bool, error: bool) -> None:
+        with self._stats_lock:
+            stats = self._models[model_path]
+            stats["calls"] += 1
+            stats["seconds"] += seconds
+            stats["passed"] += passed
+            stats["errors"] += error
+
+    def reset_stats(self) -> None:
+        with self._stats_lock:
+            self._models: Dict[str, Dict] = {
+                ex.model_path: dict.fromkeys(("calls", "passed", "errors", "seconds"), 0)
+                for ex in self.extractors
+            }
+            self._resolved = [0] * len(self.extractors)
+            self._unresolved = 0
+
+    def model_stats(self) -> Dict:
+        """
+        返回级联统计
+
+        Returns:
+            Dict: total（处理张数）、unresolved（各级均未通过校验的张数）、
+                  models（按级联顺序的列表，每项含 model、calls（调用次数）、passed（通过校验）、
+                  errors（调用失败或提取失败）、seconds（累计耗时）、resolved（由该级完成的张数）、
+                  pass_rate、mean_seconds）
+        """
+        with self._stats_lock:
+            models = []
+            for (model_path, stats), resolved in zip(self._models.items(), self._resolved):
+                calls = stats["calls"]
+                models.append({
+                    "model": model_path, **stats, "resolved": resolved,
+                    "pass_rate": stats["passed"] / calls if calls else 0.0,
+                    "mean_seconds": stats["seconds"] / calls if calls else 0.0,
+                })
+            return {
+                "total": sum(self._resolved) + self._unresolved,
+                "unresolved": self._unresolved,
+                "models": models,
+            }
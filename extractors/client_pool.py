@@ -0,0 +1,135 @@
+# extractors/client_pool.py
+import threading
+from typing import Dict, Optional, Tuple
+from urllib.parse import urljoin, urlparse
+
+import httpx
+import requests
+from openai import AsyncOpenAI, OpenAI
+from requests.adapters import HTTPAdapter
+
+from config import HTTP_CONFIG, logger
+
+# 进程级连接池：同一 base_url 的所有调用共享连接（keep-alive），避免每次请求重新建立TCP连接
+_pool_lock = threading.Lock()
+_sessions: Dict[str, requests.Session] = {}
+_openai_clients: Dict[Tuple[str, str], OpenAI] = {}
+
+
+def normalize_openai_base_url(base_url: str) -> str:
+    """去除末尾斜杠，并确保以 /v1 结尾（OpenAI兼容接口）"""
+    base_url = base_url.rstrip('/')
+    if not urlparse(base_url).path.endswith('/v1'):
+        base_url = urljoin(base_url + '/', 'v1')
+    return base_url
+
+
+def request_timeout() -> Tuple[float, float]:
+    """requests 使用的 (连接超时, 读取超时)"""
+    return (HTTP_CONFIG.get("connect_timeout", 5.0), HTTP_CONFIG.get("read_timeout", 60.0))
+
+
+def httpx_limits(max_connections: Optional[int] = None) -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=max_connections or HTTP_CONFIG.get("max_connections", 16),
+        max_keepalive_connections=HTTP_CONFIG.get("max_keepalive_connections", 8),
+        keepalive_expiry=HTTP_CONFIG.get("keepalive_expiry", 30.0),
+    )
+
+
+def httpx_timeout() -> httpx.Timeout:
+    connect, read = request_timeout()
+    return httpx.Timeout(read, connect=connect)
+
+
+def get_http_session(base_url: str) -> requests.Session:
+    """
+    获取 base_url 对应的共享 requests.Session（线程安全）
+
+    连接池大小为 max_connections，池满时阻塞等待而不是额外建立连接。
+
+    Args:
+        base_url: 服务地址
+
+    Returns:
+        requests.Session: 共享会话
+    """
+    key = base_url.rstrip('/')
+    with _pool_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=HTTP_CONFIG.get("max_connections", 16),
+                pool_block=True,
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _sessions[key] = session
+            logger.info(f"创建HTTP连接池: {key}")
+        return session
+
+
+def get_openai_client(base_url: str, api_key: str) -> OpenAI:
+    """
+    获取 (base_url, api_key) 对应的共享 OpenAI 客户端（客户端本身线程安全）
+
+    Args:
+        base_url: 服务地址，自动补全 /v1
+        api_key: API密钥
+
+    Returns:
+        OpenAI: 共享客户端
+    """
+    key = (normalize_openai_base_url(base_url), api_key)
+    with _pool_lock:
+        client = _openai_clients.get(key)
+        if client is None:
+            client = OpenAI(
+                api_key=api_key,
+                base_url=key[0],
+                timeout=httpx_timeout(),
+                http_client=httpx.Client(limits=httpx_limits(), timeout=httpx_timeout()),
+            )
+            _openai_clients[key] = client
+            logger.info(f"创建OpenAI客户端连接池: {key[0]}")
+        return client
+
+
+def create_async_openai_client(base_url: str, api_key: str) -> AsyncOpenAI:
+    """
+    创建 AsyncOpenAI 客户端
+
+    异步客户端绑定创建时的事件循环，不放入进程级连接池，由调用方负责关闭。
+    连接上限取 http_config.max_async_connections（异步并发通常远高于线程数）。
+    """
+    return AsyncOpenAI(
+        api_key=api_key,
+        base_url=normalize_openai_base_url(base_url),
+        timeout=httpx_timeout(),
+        http_client=httpx.AsyncClient(
+            limits=httpx_limits(HTTP_CONFIG.get("max_async_connections", 128)),
+            timeout=httpx_timeout(),
+        ),
+    )
+
+
+def create_async_http_client(base_url: str) -> httpx.AsyncClient:
+    """创建指向 base_url 的 httpx.AsyncClient（keep-alive，由调用方负责关闭）"""
+    return httpx.AsyncClient(
+        base_url=base_url.rstrip('/'),
+        limits=httpx_limits(HTTP_CONFIG.get("max_async_connections", 128)),
+        timeout=httpx_timeout(),
+    )
+
+
+def close_clients() -> None:
+    """关闭所有共享连接（进程退出或切换服务地址时调用）"""
+    with _pool_lock:
+        for session in _sessions.values():
+            session.close()
+        for client in _openai_clients.values():
+            client.close()
+        _sessions.clear()
+        _openai_clients.clear()
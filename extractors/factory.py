@@ -0,0 +1,86 @@
+# extractors/factory.py
+from typing import List, Optional
+
+from config import API_CONFIG, CASCADE_CONFIG, COMPANY_SUFFIXES, MODEL_OPTIONS
+from .base_extractor import BaseExtractor
+from .regex_extractor import RegexExtractor
+from .llm_extractor import LLMExtractor
+from .vlm_extractor import VLMExtractor
+from .hybrid_extractor import HybridExtractor
+from .cascade_extractor import CascadeExtractor
+from .async_extractor import AsyncLLMExtractor, AsyncVLMExtractor
+
+# 提取模式 -> 所需模型类型
+EXTRACTION_MODES = {
+    "regex": None,
+    "llm": "text",
+    "hybrid": "text",
+    "vlm": "visual",
+    "cascade": "text",
+    "vlm-cascade": "visual",
+}
+# 级联模式 -> 被级联的单模型模式
+CASCADE_MODES = {"cascade": "llm", "vlm-cascade": "vlm"}
+
+
+def default_model(model_type: str) -> str:
+    """返回配置中指定类型的第一个模型名称"""
+    return next(k for k, v in MODEL_OPTIONS.items() if v["type"] == model_type)
+
+
+def cascade_models(model_type: str) -> List[str]:
+    """
+    级联顺序：cascade_config 中该类型的模型（从小到大），只保留 MODEL_OPTIONS 中存在的；
+    未配置时按 MODEL_OPTIONS 中的顺序
+    """
+    configured = [name for name in CASCADE_CONFIG.get(model_type) or []
+                  if name in MODEL_OPTIONS and MODEL_OPTIONS[name]["type"] == model_type]
+    return configured or [k for k, v in MODEL_OPTIONS.items() if v["type"] == model_type]
+
+
+def create_extractor(mode: str, model: Optional[str] = None, use_async: bool = False) -> BaseExtractor:
+    """
+    按模式名称创建提取器（供命令行等非UI场景使用）
+
+    Args:
+        mode: 提取模式，"regex" / "llm" / "hybrid" / "vlm" / "cascade" / "vlm-cascade"
+        model: MODEL_OPTIONS 中的模型名称，默认取该类型的第一个模型（级联模式忽略，按 cascade_models 的顺序）
+        use_async: 返回异步提取器（AsyncLLMExtractor / AsyncVLMExtractor），仅支持 llm / vlm 模式
+
+    Returns:
+        BaseExtractor: 提取器实例
+
+    Raises:
+        ValueError: 模式或模型名称无效
+    """
+    if mode not in EXTRACTION_MODES:
+        raise ValueError(f"不支持的提取模式: {mode}")
+    if use_async and mode not in ("llm", "vlm"):
+        raise ValueError(f"{mode} 模式不支持异步提取")
+    if mode == "regex":
+        return RegexExtractor(COMPANY_SUFFIXES)
+    if mode in CASCADE_MODES:
+        return CascadeExtractor([
+            create_extractor(CASCADE_MODES[mode], name) for name in cascade_models(EXTRACTION_MODES[mode])
+        ])
+
+    model_type = EXTRACTION_MODES[mode]
+    model = model or default_model(model_type)
+    if model not in MODEL_OPTIONS or MODEL_OPTIONS[model]["type"] != model_type:
+        raise ValueError(f"模型 {model} 不是可用的{model_type}模型")
+    model_path = MODEL_OPTIONS[model]["model_path"]
+
+    if mode in ("llm", "hybrid"):
+        extractor = (AsyncLLMExtractor if use_async else LLMExtractor)(
+            suffixes=COMPANY_SUFFIXES,
+            model_path=model_path,
+            api_key=API_CONFIG["api_key"],
+            base_url=API_CONFIG["base_url"]
+        )
+        return HybridExtractor(extractor) if mode == "hybrid" else extractor
+    return (AsyncVLMExtractor if use_async else VLMExtractor)(
+        model_path=model_path,
+        api_key=API_CONFIG["api_key"],
+        base_url=API_CONFIG["base_url"],
+        raster=MODEL_OPTIONS[model].get("raster")
+    )
@@ -0,0 +1,108 @@
+# extractors/hybrid_extractor.py
+import hashlib
+import logging
+import threading
+from typing import Dict, List
+
+from models import Invoice
+from models.invoice import AMOUNT_FIELDS
+from .base_extractor import BaseExtractor
+from .regex_extractor import RegexExtractor
+from .llm_extractor import LLMExtractor
+
+
+def check_fields(invoice: Invoice, tolerance: float = 0.01) -> List[str]:
+    """
+    字段与金额校验，返回未通过的字段（分级提取与模型级联共用）
+
+    必填字段缺失的计入；金额 + 税额 与价税合计不一致时三个金额字段都计入。
+    """
+    failed = invoice.missing_fields()
+    if not invoice.amounts_consistent(tolerance):
+        # 三个金额互相校验，无法确定哪一个错误，整体重新提取
+        failed += [name for name in AMOUNT_FIELDS if name not in failed]
+    return failed
+
+
+class HybridExtractor(BaseExtractor):
+    """
+    分级提取：先用正则提取并校验，只有校验不通过的发票才调用大模型
+
+    校验规则：必填字段齐全，且 金额 + 税额 与价税合计相差不超过1分。
+    调用大模型后只替换校验失败的字段，正则已正确提取的字段保持不变。
+    """
+
+    def __init__(self, llm_extractor: LLMExtractor, tolerance: float = 0.01):
+        super().__init__(llm_extractor.suffixes)
+        self.logger = logging.getLogger(__name__)
+        self.regex_extractor = RegexExtractor(llm_extractor.suffixes)
+        self.llm_extractor = llm_extractor
+        self.model_path = llm_extractor.model_path
+        self.tolerance = tolerance
+        self._stats_lock = threading.Lock()
+        self.reset_stats()
+
+    def prompt_fingerprint(self) -> str:
+        """校验规则与大模型提示词共同决定结果，一并计入指纹"""
+        raw = f"hybrid:{self.tolerance}:{self.llm_extractor.prompt_fingerprint()}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+    def failed_fields(self, invoice: Invoice) -> List[str]:
+        """返回需要交给大模型重新提取的字段"""
+        return check_fields(invoice, self.tolerance)
+
+    def extract(self, text: str) -> Invoice:
+        invoice = self.regex_extractor.extract(text)
+        failed = self.failed_fields(invoice)
+        if not failed:
+            self._record(failed)
+            return invoice
+
+        self._record(failed)
+        try:
+            llm_invoice = self.llm_extractor.extract(text)
+        except Exception as e:
+            self.logger.warning(f"{__name__}.extract 大模型补全失败: {str(e)}")
+            invoice.error = f"字段 {', '.join(failed)} 提取失败: {str(e)}"
+            return invoice
+        if llm_invoice.error:
+            invoice.error = llm_invoice.error
+            return invoice
+
+        for name in failed:
+            setattr(invoice, name, getattr(llm_invoice, name))
+        if invoice.tax_rates is None:
+            invoice.tax_rates = llm_invoice.tax_rates
+        return invoice
+
+    def _record(self, failed: List[str]) -> None:
+        with self._stats_lock:
+            self._total += 1
+            if failed:
+                self._escalated += 1
+                for name in failed:
+                    self._field_counts[name] = self._field_counts.get(name, 0) + 1
+
+    def reset_stats(self) -> None:
+        with self._stats_lock:
+            self._total = 0
+            self._escalated = 0
+            self._field_counts: Dict[str, int] = {}
+
+    def stats(self) -> Dict:
+        """
+        返回分级统计
+
+        Returns:
+            Dict: total（处理张数）、regex_only（仅正则完成）、escalated（调用了大模型）、
+                  model_avoided_ratio（免调用大模型的比例）、fields（各字段升级次数）
+        """
+        with self._stats_lock:
+            regex_only = self._total - self._escalated
+            return {
+                "total": self._total,
+                "regex_only": regex_only,
+                "escalated": self._escalated,
+                "model_avoided_ratio": regex_only / self._total if self._total else 0.0,
+                "fields": dict(self._field_counts),
+            }
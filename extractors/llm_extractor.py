@@ -1,179 +1,341 @@
 # extractors/llm_extractor.py
 import json
 import re
-from typing import Optional
-
-from openai import OpenAI
+import hashlib
+import math
+import threading
+from typing import Dict, List, Optional
 
 import logging
+from openai import BadRequestError
+
 from models import Invoice
 from .base_extractor import BaseExtractor
-from config import API_CONFIG, COMPANY_SUFFIXES
+from .client_pool import get_openai_client
+from config import (API_CONFIG, BATCH_CONFIG, CHAT_CONFIG, COMPANY_SUFFIXES,
+                    OLLAMA_MODEL_OPTIONS, VLLM_MODEL_OPTIONS)
+
+# 提示词版本：修改 PROMPT_PREFIX / PROMPT_SUFFIX 时同步更新（计入缓存指纹）
+PROMPT_VERSION = "invoice-extract-v2"
+
+# 静态前缀（角色说明与少样本示例）：所有请求逐字节相同，不得插入任何随请求变化的内容
+PROMPT_PREFIX = """你现在是智能发票处理助手invoice_extractor。
+请你从“发票文本”中提取关键信息，并按以下JSON格式返回。
+# 样本
+invoice_sample='''
+电子发票（普通发票）
+发票号码： 25327000000693696263
+旅客运输服务
+开票日期： 2025年06月23日
+购 销
+买 名称：北京星石娱动国际传媒有限公司 售 名称：苏州市吉利优行电子科技有限公司
+方 方
+信
+统一社会信用代码/纳税人识别号：91110116MA01BP9R44
+信
+统一社会信用代码/纳税人识别号：91320594MA1MFD7F31
+息 息
+项目名称 单 价 数 量 金 额 税率/征收率 税 额
+*运输服务*客运服务费 129.757282 1 129.76 3% 3.89
+*运输服务*客运服务费 -30.99 3% -0.93
+合 计 ¥98.77 ¥2.96
+出行人 有效身份证件号 出行日期 出发地 到达地 等 级 交通工具类型
+价税合计（大写） 壹佰零壹圆柒角叁分 （小写）¥101.73
+备
+注
+开票人：钟寒冰'''
+明细行税率不同时，"税率"列出全部税率，如"13%,6%"。
+返回示例：{"购方名称": "北京星石娱动国际传媒有限公司", "销方名称": "苏州市吉利优行电子科技有限公司", "发票号码": "25327000000693696263", "开票日期": "2025年06月23日", "项目名称": "*运输服务*客运服务费", "金额": "98.77", "税率": "3%", "税额": "2.96", "价税合计": "101.73", "开票人": "钟寒冰"}
+"""
+
+# 可变后缀：只包含发票文本
+PROMPT_SUFFIX = "# 发票文本：\n{text}"
+
+# 多张发票打包时的后缀：每张发票以“## 发票 序号”开头，要求返回带“序号”的JSON数组
+PACK_SUFFIX = (
+    "# 发票文本（共{count}张，每张以“## 发票 序号”开头）：\n"
+    "请逐张按上述格式提取，返回JSON对象 {{\"发票\": [...]}}，数组按序号排列，"
+    "每个元素增加\"序号\"字段。\n{sections}"
+)
+PACK_SECTION = "## 发票 {index}\n{text}"
+
+CJK_CHAR_RE = re.compile(r"[\u4e00-\u9fff]")
+BLANK_RE = re.compile(r"[ \t\u3000]+")
+
+
+def _pack_index(value) -> Optional[int]:
+    """打包回复中的“序号”：整数或整数字符串（如 3、"3"、3.0），其他写法返回None"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str) and value.strip().isdecimal():
+        return int(value.strip())
+    return None
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算token数：中日韩字符各计1个，其余约4个字符计1个"""
+    cjk = len(CJK_CHAR_RE.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def model_context_length(model_path: Optional[str]) -> int:
+    """模型上下文长度（settings.yaml 中的 context_length），未配置时取 chat_config.default_context_length"""
+    for option in list(OLLAMA_MODEL_OPTIONS.values()) + list(VLLM_MODEL_OPTIONS.values()):
+        if option.get("model_path") == model_path and option.get("context_length"):
+            return option["context_length"]
+    return CHAT_CONFIG.get("default_context_length", 4096)
 
-from urllib.parse import urljoin, urlparse
+
+def clean_invoice_text(text: str) -> str:
+    """压缩空白：去掉空行与行首尾空白，连续空格合并为一个（打包时节省token）"""
+    lines = (BLANK_RE.sub(" ", line).strip() for line in text.splitlines())
+    return "\n".join(line for line in lines if line)
 
 
 class LLMExtractor(BaseExtractor):
     def __init__(self, model_path: str, 
                  api_key: str = API_CONFIG["api_key"], base_url: str = API_CONFIG["base_url"],
-                 suffixes: list = COMPANY_SUFFIXES):
+                 suffixes: list = COMPANY_SUFFIXES, pack_size: Optional[int] = None):
         super().__init__(suffixes)
         self.logger = logging.getLogger(__name__)
+        self.model_path = model_path
+        # 每次请求最多打包的发票数（1为逐张请求），实际数量还受模型上下文长度限制
+        self.pack_size = pack_size or BATCH_CONFIG.get("pack_size", 1)
+        # 同一服务地址共享连接池（URL在其中标准化并补全/v1）
+        self.client = get_openai_client(base_url, api_key)
+        self._usage_lock = threading.Lock()
+        self.reset_usage()
 
-        # 标准化URL（去除末尾斜杠）
-        base_url = base_url.rstrip('/')
-        
-        # 检查是否已包含/v1
-        parsed = urlparse(base_url)
-        if not parsed.path.endswith('/v1'):
-            base_url = urljoin(base_url + '/', 'v1')
+    def generate_prompt(self, text: str) -> str:
+        """完整提示词（静态前缀 + 发票文本），与实际请求中 system + user 消息内容一致"""
+        return PROMPT_PREFIX + self.prompt_suffix(text)
 
+    @staticmethod
+    def prompt_suffix(text: str) -> str:
+        """提示词中随发票变化的部分，只出现在最后一条消息中"""
+        return PROMPT_SUFFIX.format(text=text)
 
-        self.model_path = model_path
-        self.client = OpenAI(
-            api_key = api_key,
-            base_url = base_url,
-            timeout=60.0
+    def prompt_fingerprint(self) -> str:
+        """提示词模板指纹（版本号 + 静态前缀 + 后缀模板，不含发票文本）"""
+        raw = PROMPT_VERSION + PROMPT_PREFIX + PROMPT_SUFFIX
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+    def _build_request(self, text: str) -> Dict:
+        """
+        构造 chat.completions 请求参数（同步/异步提取器共用）
+
+        system 消息为逐字节不变的静态前缀，发票文本只放在 user 消息中，
+        vLLM 前缀缓存与 Ollama 的KV缓存复用可跳过前缀的预填充计算。
+        """
+        return {
+            "model": self.model_path,
+            "messages": [
+                {"role": "system", "content": PROMPT_PREFIX},
+                {"role": "user", "content": self.prompt_suffix(text)}
+            ],
+            "response_format": {"type": "json_object"},
+            "temperature": 0.3,
+        }
+
+    def _record_usage(self, response) -> None:
+        """累计服务端返回的token用量（prompt_tokens_details.cached_tokens 为命中前缀缓存的部分）"""
+        usage = getattr(response, "usage", None)
+        if usage is None:
+            return
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = getattr(details, "cached_tokens", None) or 0
+        with self._usage_lock:
+            self._usage["requests"] += 1
+            self._usage["prompt_tokens"] += usage.prompt_tokens or 0
+            self._usage["cached_tokens"] += cached
+            self._usage["completion_tokens"] += usage.completion_tokens or 0
+
+    def reset_usage(self) -> None:
+        with self._usage_lock:
+            self._usage = dict.fromkeys((
+                "requests", "prompt_tokens", "cached_tokens", "completion_tokens",
+                "packs", "packed_invoices", "pack_splits",
+            ), 0)
+
+    def usage_stats(self) -> Dict:
+        """
+        返回提示词token统计
+
+        Returns:
+            Dict: prompt_version、prefix_chars（静态前缀字符数）、requests、prompt_tokens、
+                  cached_tokens（命中前缀缓存的token数）、completion_tokens、
+                  mean_prompt_tokens、cached_ratio、packs（打包请求数）、
+                  packed_invoices（打包请求成功提取的张数）、pack_splits（拆分重试次数）
+        """
+        with self._usage_lock:
+            usage = dict(self._usage)
+        requests = usage["requests"]
+        usage.update(
+            prompt_version=PROMPT_VERSION,
+            prefix_chars=len(PROMPT_PREFIX),
+            mean_prompt_tokens=usage["prompt_tokens"] / requests if requests else 0.0,
+            cached_ratio=usage["cached_tokens"] / usage["prompt_tokens"] if usage["prompt_tokens"] else 0.0,
         )
+        return usage
 
-    def generate_prompt(self, text: str) -> str:
-        prompt = f"""你现在是智能发票处理助手invoice_extractor。
-            请你从“发票文本”中提取关键信息，并按以下JSON格式返回。
-            # 样本 1
-            invoice_sample1='''电子发票（普通发票）
-            发票号码：25112000000130340249
-            开票日期：2025年06月24日
-            购 名称：北京星石娱动国际传媒有限公司 销 名称：北京那家雅居餐饮有限责任公司
-            买 售
-            方 方
-            信 统一社会信用代码/纳税人识别号：91110116MA01BP9R44 信 统一社会信用代码/纳税人识别号：91110105562126449H
-            息 息
-            项目名称 规格型号 单 位 数 量 单 价 金 额 税率/征收率 税 额
-            *餐饮服务*餐费 1652.8301886792453 652.83 6% 39.17
-            合 计 ¥652.83 ¥39.17
-            价税合计（大写） 陆佰玖拾贰圆整 （小写）¥692.00
-            备
-            注
-            开票人：胡晋阳
-            胡晋阳'''
-            返回示例：{{
-                "buyer": "北京星石娱动国际传媒有限公司",
-                "seller": "北京那家雅居餐饮有限责任公司",
-                "invoice_number": "25112000000130340249",
-                "issue_date": "2025年06月24日",
-                "project_name": "*餐饮服务*餐费",
-                "amount": "652.83",
-                "tax_rate": "6%",
-                "tax_amount": "39.17",
-                "total_with_tax_lowercase": "692.00",
-                "issuer": "胡晋阳"
-            }}
-            # 样本 2
-            invoce_sample2='''
-            电子发票（普通发票）
-            发票号码： 25327000000693696263
-            旅客运输服务
-            开票日期： 2025年06月23日
-            购 销
-            买 名称：北京星石娱动国际传媒有限公司 售 名称：苏州市吉利优行电子科技有限公司
-            方 方
-            信
-            统一社会信用代码/纳税人识别号：91110116MA01BP9R44
-            信
-            统一社会信用代码/纳税人识别号：91320594MA1MFD7F31
-            息 息
-            项目名称 单 价 数 量 金 额 税率/征收率 税 额
-            *运输服务*客运服务费 129.757282 1 129.76 3% 3.89
-            *运输服务*客运服务费 -30.99 3% -0.93
-            合 计 ¥98.77 ¥2.96
-            出行人 有效身份证件号 出行日期 出发地 到达地 等 级 交通工具类型
-            价税合计（大写） 壹佰零壹圆柒角叁分 （小写）¥101.73
-            备
-            注
-            开票人：钟寒冰'''
-            返回示例：{{
-                "buyer": "北京星石娱动国际传媒有限公司",
-                "seller": "苏州市吉利优行电子科技有限公司",
-                "invoice_number": "25327000000693696263",
-                "issue_date": "2025年06月23日",
-                "project_name": "*运输服务*客运服务费",
-                "amount": "98.77",
-                "tax_rate": "3%",
-                "tax_amount": "2.96",
-                "total_with_tax_lowercase": "101.73",
-                "issuer": "胡晋阳"
-            }}
-            # 发票文本：
-            {text}"""
-        
-        prompt = f"""你现在是智能发票处理助手invoice_extractor。
-            请你从“发票文本”中提取关键信息，并按以下JSON格式返回。
-            # 样本 2
-            invoce_sample2='''
-            电子发票（普通发票）
-            发票号码： 25327000000693696263
-            旅客运输服务
-            开票日期： 2025年06月23日
-            购 销
-            买 名称：北京星石娱动国际传媒有限公司 售 名称：苏州市吉利优行电子科技有限公司
-            方 方
-            信
-            统一社会信用代码/纳税人识别号：91110116MA01BP9R44
-            信
-            统一社会信用代码/纳税人识别号：91320594MA1MFD7F31
-            息 息
-            项目名称 单 价 数 量 金 额 税率/征收率 税 额
-            *运输服务*客运服务费 129.757282 1 129.76 3% 3.89
-            *运输服务*客运服务费 -30.99 3% -0.93
-            合 计 ¥98.77 ¥2.96
-            出行人 有效身份证件号 出行日期 出发地 到达地 等 级 交通工具类型
-            价税合计（大写） 壹佰零壹圆柒角叁分 （小写）¥101.73
-            备
-            注
-            开票人：钟寒冰'''
-            返回示例：{{
-                "购方名称": "北京星石娱动国际传媒有限公司", 
-                "销方名称": "苏州市吉利优行电子科技有限公司",
-                "发票号码": "25327000000693696263", 
-                "开票日期": "2025年06月23日", 
-                "项目名称": "*运输服务*客运服务费",
-                "金额": "98.77",
-                "税率": "3%",
-                "税额": "2.96",
-                "价税合计": "101.73",
-                "开票人": "胡晋阳"
-            }}。
-            # 发票文本：
-            {text}"""
-
-        return prompt
-    
-    def extract_with_llm(self, text: str) -> Optional[Invoice]:
-        prompt = self.generate_prompt(text)
+    def plan_packs(self, texts: List[str]) -> List[List[int]]:
+        """
+        按模型上下文长度把发票分组（保持输入顺序）
+
+        每组不超过 pack_size 张；每张发票计入压缩后文本的token数与
+        batch_config.pack_output_tokens（回复预留），合计不超过上下文长度减去静态前缀。
+        单张即超出预算的发票单独成组。
+
+        Args:
+            texts: 发票文本
+
+        Returns:
+            List[List[int]]: 每组发票在 texts 中的序号
+        """
+        budget = (model_context_length(self.model_path) - estimate_tokens(PROMPT_PREFIX)
+                  - estimate_tokens(PACK_SUFFIX))
+        output_tokens = BATCH_CONFIG.get("pack_output_tokens", 200)
+        packs, current, used = [], [], 0
+        for i, text in enumerate(texts):
+            cost = estimate_tokens(clean_invoice_text(text)) + output_tokens + 8
+            if current and (len(current) >= self.pack_size or used + cost > budget):
+                packs.append(current)
+                current, used = [], 0
+            current.append(i)
+            used += cost
+        if current:
+            packs.append(current)
+        return packs
+
+    def _build_pack_request(self, texts: List[str]) -> Dict:
+        """多张发票打包为一个请求：静态前缀不变，后缀依次列出各张发票的压缩文本"""
+        sections = "\n".join(
+            PACK_SECTION.format(index=i, text=clean_invoice_text(text)) for i, text in enumerate(texts, 1)
+        )
+        request = self._build_request("")
+        request["messages"][-1]["content"] = PACK_SUFFIX.format(count=len(texts), sections=sections)
+        return request
+
+    def _parse_pack_completion(self, content: Optional[str], texts: List[str]) -> Dict[int, Dict]:
+        """
+        解析打包请求的回复，按“序号”对应回输入
+
+        序号均为 1..len(texts) 内互不重复的整数时按序号对应（完整回复即恰为 1..n）；
+        序号缺失、重复、不是整数或超出范围（如从0开始编号）时，数组长度与输入一致则按位置对应。
+        发票号码不在对应文本中的元素视为错位，与无法解析的元素一样不返回（由调用方重试）。
+
+        Returns:
+            Dict[int, Dict]: texts 序号 -> 模型返回的JSON结果
+
+        Raises:
+            ValueError: 回复不是JSON或不含数组
+        """
+        if not content or not (json_match := re.search(r'[\[{].*[\]}]', content, re.DOTALL)):
+            raise ValueError("回复中没有JSON")
+        data = json.loads(json_match.group())
+        if isinstance(data, dict):
+            data = data.get("发票", next((v for v in data.values() if isinstance(v, list)), None))
+        if not isinstance(data, list):
+            raise ValueError("回复中没有JSON数组")
+
+        items = [item for item in data if isinstance(item, dict)]
+        indexes = [_pack_index(item.get("序号")) for item in items]
+        if len(set(indexes)) == len(indexes) and set(indexes) <= set(range(1, len(texts) + 1)):
+            mapped = {index - 1: item for index, item in zip(indexes, items)}
+        elif len(items) == len(texts):
+            mapped = dict(enumerate(items))
+        else:
+            raise ValueError(f"回复 {len(items)} 条结果无法对应 {len(texts)} 张发票")
+
+        results = {}
+        for i, item in mapped.items():
+            if not 0 <= i < len(texts):
+                continue
+            number = re.sub(r"\D", "", str(item.get("发票号码", "")))
+            if number and number not in re.sub(r"\s", "", texts[i]):
+                continue
+            results[i] = item
+        return results
+
+    def extract_pack(self, texts: List[str]) -> List[Invoice]:
+        """
+        一次请求提取多张发票，返回与 texts 顺序一致的结果
+
+        回复无法解析或请求超出上下文时对半拆分重试；只剩一张时退回单张提取。
+        回复中部分发票缺失、错位或无法转换时，只把这些发票逐张重新提取；
+        单张提取失败的发票返回带 error 的结果，不影响同包的其他发票。
+
+        Args:
+            texts: 发票文本（通常来自 plan_packs 的一组）
+
+        Returns:
+            List[Invoice]: 提取结果
+        """
+        if len(texts) == 1:
+            return [self._extract_single(texts[0])]
         try:
-            # logging.error(f"llm extract2: {response}")
-            response = self.client.chat.completions.create(
-                model=self.model_path,
-                messages=[
-                    {"role": "system", "content": "你是智能发票处理助手。"},
-                    {"role": "user", "content": prompt}
-                ],
-                response_format={"type": "json_object"},
-                temperature=0.3
-            )
-            # logging.error(f"llm extract2: {response}")
-            result = response.choices[0].message.content
-            if json_match := re.search(r'\{.*\}', result, re.DOTALL):
-                return json.loads(json_match.group())
+            response = self.client.chat.completions.create(**self._build_pack_request(texts))
+            self._record_usage(response)
+            results = self._parse_pack_completion(response.choices[0].message.content, texts)
+        except (ValueError, BadRequestError) as e:
+            self.logger.warning(f"{__name__}.extract_pack {len(texts)} 张发票打包失败，拆分重试: {str(e)}")
+            results = {}
+        with self._usage_lock:
+            self._usage["packs"] += 1
+            self._usage["packed_invoices"] += len(results)
+
+        if not results:
+            with self._usage_lock:
+                self._usage["pack_splits"] += 1
+            middle = len(texts) // 2
+            return self.extract_pack(texts[:middle]) + self.extract_pack(texts[middle:])
+
+        invoices = {}
+        for i, result in results.items():
+            try:
+                invoices[i] = self._create_invoice_from_result(result)
+            except Exception as e:
+                self.logger.warning(f"{__name__}.extract_pack 第 {i + 1} 张发票结果无法转换: {str(e)}")
+        missing = [i for i in range(len(texts)) if i not in invoices]
+        if missing:
+            self.logger.warning(f"{__name__}.extract_pack {len(missing)}/{len(texts)} 张发票结果缺失，逐张重试")
+            invoices.update((i, self._extract_single(texts[i])) for i in missing)
+        return [invoices[i] for i in range(len(texts))]
+
+    def _extract_single(self, text: str) -> Invoice:
+        """打包中单张发票的提取，失败时返回带 error 的结果"""
+        try:
+            return self.extract(text)
         except Exception as e:
-            self.logger.error(f"{__name__}.extract_with_llm 运行失败: {str(e)}")
-            raise
+            self.logger.error(f"{__name__}.extract_pack 单张提取失败: {str(e)}")
+            return Invoice(file_name="", error=str(e))
 
+    def _parse_completion(self, content: Optional[str]) -> Optional[Dict]:
+        """从模型回复中截取JSON对象"""
+        if content and (json_match := re.search(r'\{.*\}', content, re.DOTALL)):
+            return json.loads(json_match.group())
         return None
+
+    def extract_with_llm(self, text: str) -> Optional[Dict]:
+        try:
+            response = self.client.chat.completions.create(**self._build_request(text))
+            self._record_usage(response)
+            return self._parse_completion(response.choices[0].message.content)
+        except Exception as e:
+            self.logger.error(f"{__name__}.extract_with_llm 运行失败: {str(e)}")
+            raise
     
     def extract(self, text: str) -> Invoice:
         result = self.extract_with_llm(text)
         # logging.error(f"llm extract: {llm_result}")
+        return self._create_invoice_from_result(result)
+
+    def _create_invoice_from_result(self, result: Optional[Dict]) -> Invoice:
+        """将模型返回的JSON结果转换为Invoice"""
         try:
             if result:
                 return Invoice(
@@ -186,6 +348,7 @@ class LLMExtractor(BaseExtractor):
                     amount=self.to_float(result.get("金额")),
                     tax_amount=self.to_float(result.get("税额")),
                     total_amount=self.to_float(result.get("价税合计", )),
+                    tax_rates=self.parse_tax_rates(result.get("税率")),
                     raw_text=json.dumps(result, ensure_ascii=False, indent=2),
                     error=None
                 )
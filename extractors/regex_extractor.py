@@ -4,27 +4,35 @@ import re
 from .base_extractor import BaseExtractor
 from models import Invoice
 
+# 原模式中的“发票号码：”“开票日期：”前缀均为可选，不影响捕获结果；
+# 去掉后 re 可以直接按数字字符集快速定位，捕获内容与原模式完全一致
+INVOICE_NUMBER_RE = re.compile(r'\d{20}')
+ISSUE_DATE_RE = re.compile(r'\d{4}年\d{1,2}月\d{1,2}日')
+ITEM_NAME_RE = re.compile(r'\*[\u4e00-\u9fa5]+\*+[\u4e00-\u9fa5]+')
+
 class RegexExtractor(BaseExtractor):
     def extract_invoice_number(self, text: str) -> Optional[str]:
-        match = re.search(r'(?:发票号码[:：])*\s*(\d{20})', text)
-        return match.group(1) if match else None
-    
+        match = INVOICE_NUMBER_RE.search(text)
+        return match.group() if match else None
+
     def extract_issue_date(self, text: str) -> Optional[str]:
-        match = re.search(r'(?:开票日期[:：])*\s*(\d{4}年\d{1,2}月\d{1,2}日)', text)
-        return match.group(1) if match else None
-    
+        match = ISSUE_DATE_RE.search(text)
+        return match.group() if match else None
+
     def extract_item_name(self, text: str) -> Optional[str]:
-        match = re.search(r'(\*[\u4e00-\u9fa5]+\*+[\u4e00-\u9fa5]+)', text)
-        return match.group(1).strip() if match else None
-    
+        match = ITEM_NAME_RE.search(text)
+        return match.group().strip() if match else None
+
     def extract(self, text: str) -> Invoice:
         cleaned_text = self.clean_text(text)
         invoice = Invoice(file_name="")
-        
+
         invoice.invoice_number = self.extract_invoice_number(cleaned_text)
         invoice.issue_date = self.extract_issue_date(cleaned_text)
         invoice.buyer, invoice.seller = self.extract_companies(cleaned_text)
         invoice.item_name = self.extract_item_name(cleaned_text)
-        invoice.amount, invoice.tax_amount, invoice.total_amount = self.extract_amounts(cleaned_text)
+        invoice.amount, invoice.tax_amount, invoice.total_amount = self.extract_amounts(cleaned_text, normalized=True)
+        invoice.total_in_words = self.extract_total_in_words(cleaned_text)
+        invoice.tax_rates = self.extract_tax_rates(cleaned_text)
 
         return invoice
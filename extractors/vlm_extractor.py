@@ -1,12 +1,16 @@
 import requests
 import base64
+import hashlib
 import json
 import logging
-from typing import Dict, Optional, List, Tuple, Union
+import threading
+import time
+from collections import deque
+from typing import Dict, Iterator, Optional, List, Tuple, Union
 from io import BytesIO
-from models import Invoice
-from streamlit.runtime.uploaded_file_manager import UploadedFile
+from models import Invoice, InvoiceFile, FileInput
 from .base_extractor import BaseExtractor
+from .client_pool import get_http_session, request_timeout
 
 try:
     import magic
@@ -16,13 +20,26 @@ except Exception:
 from pdf2image import convert_from_bytes
 from pdf2image.exceptions import PDFInfoNotInstalledError, PDFPageCountError, PDFSyntaxError
 import pdfplumber
-from config import API_CONFIG, logger
+from config import API_CONFIG, RASTER_CONFIG, WARMUP_CONFIG, logger
 from PIL import Image
 
 import fitz  # pip install pymupdf
 
+# 渲染参数默认值，依次被 settings.yaml 的 raster_config 与模型级 raster 覆盖
+DEFAULT_RASTER = {
+    "dpi": 200,
+    "max_pages": 3,
+    "grayscale": False,
+    "max_long_edge": 1600,  # 渲染图像长边像素上限，0 表示不限制
+    "format": "png",        # png / jpeg
+    "jpeg_quality": 85,
+}
+
 
 class VLMExtractor(BaseExtractor):
+    # 批处理引擎据此决定预处理方式：直接传入文件而非PDF文本
+    input_kind = "file"
+
     SUPPORTED_MIME_TYPES = {
         'application/pdf',
         'image/jpeg',
@@ -34,7 +51,8 @@ class VLMExtractor(BaseExtractor):
                  model_path: str = "qwen2.5vl:3b",
                  api_key: str = API_CONFIG["api_key"],
                  base_url: str = API_CONFIG["base_url"],
-                 max_pages: int = 3):
+                 max_pages: Optional[int] = None,
+                 raster: Optional[Dict] = None):
         """
         初始化VLMExtractor
         
@@ -42,20 +60,28 @@ class VLMExtractor(BaseExtractor):
             model_path: 模型路径 (default: "qwen2.5vl:3b")
             api_key: API密钥
             base_url: API基础地址
-            max_pages: 处理PDF时的最大页数 (default: 3)
+            max_pages: 处理PDF时的最大页数，默认取渲染配置中的 max_pages
+            raster: 模型级渲染参数（dpi、max_pages、grayscale、max_long_edge、format、jpeg_quality）
         """
         self.logger = logging.getLogger(__name__)
         self.model_path = model_path
         self.model_name = model_path
-        self.ollama_url = base_url
+        self.ollama_url = base_url.rstrip('/')
         self.api_key = api_key
-        self.max_pages = max_pages
+        self.session = get_http_session(self.ollama_url)
+        self.raster = {**DEFAULT_RASTER, **RASTER_CONFIG, **(raster or {})}
+        self.max_pages = max_pages or self.raster["max_pages"]
+        self.image_mime_type = "image/jpeg" if self.raster["format"] == "jpeg" else "image/png"
+        # 最近渲染页面的指标（多线程共享同一实例，加锁写入）
+        self._metrics_lock = threading.Lock()
+        self._page_metrics = deque(maxlen=1000)
 
     def _generate_invoice_prompt(self) -> str:
         """生成发票提取的提示词"""
         
         prompt = """你是专业的发票信息提取助手。请你从以下发票文本或上传的文档图片中，提取以下信息，并按 JSON 格式返回。
                 注意返回数据确保：金额98.77+税额2.96 == 税价合计(小写)101.73。
+                明细行税率不同时，"税率"列出全部税率，如"13%,6%"。
                 返回示例：{
                     "购方名称": "北京星石娱动国际传媒有限公司", 
                     "销方名称": "苏州市吉利优行电子科技有限公司",
@@ -72,12 +98,18 @@ class VLMExtractor(BaseExtractor):
 
         return prompt
 
-    def _process_uploaded_file(self, uploaded_file: UploadedFile) -> Tuple[List[bytes], str]:
+    def prompt_fingerprint(self) -> str:
+        """提示词模板与渲染参数的指纹（渲染参数不同，模型看到的图片也不同）"""
+        raster = json.dumps({**self.raster, "max_pages": self.max_pages}, sort_keys=True)
+        raw = self._generate_invoice_prompt() + raster
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+    def _process_uploaded_file(self, uploaded_file: FileInput) -> Tuple[List[bytes], str]:
         """
         处理上传文件，返回处理后的数据列表和内容类型
         
         Args:
-            uploaded_file: 上传的文件对象
+            uploaded_file: 上传的文件对象、文件路径或二进制内容
             
         Returns:
             Tuple[List[bytes], str]: (处理后的数据列表, 内容类型)
@@ -86,6 +118,7 @@ class VLMExtractor(BaseExtractor):
             ValueError: 文件类型不支持或处理失败
         """
         try:
+            uploaded_file = InvoiceFile.coerce(uploaded_file)
             uploaded_file.seek(0)
             file_data = uploaded_file.read()
             content_type = getattr(uploaded_file, 'type', None) or magic.from_buffer(file_data[:1024], mime=True)
@@ -130,7 +163,7 @@ class VLMExtractor(BaseExtractor):
             # 方式1：转换为图片 (高质量)
             images = self._convert_pdf_to_images(pdf_data)
             # logger.error("以图片格式返回")
-            return images, 'image/png'
+            return images, self.image_mime_type
             
         except PDFSyntaxError as e:
             self.logger.warning(f"PDF语法错误，尝试修复: {str(e)}")
@@ -138,34 +171,70 @@ class VLMExtractor(BaseExtractor):
                 # 方式2：尝试修复PDF后转换
                 fixed_pdf = self._repair_pdf(pdf_data)
                 images = self._convert_pdf_to_images(fixed_pdf)
-                return images, 'image/png'
+                return images, self.image_mime_type
             except Exception:
                 # 方式3：降级为文本提取
                 return self._extract_pdf_text(pdf_data), 'text/plain'
             
+    def _iter_pdf_pixmaps(self, pdf_bytes: bytes) -> Iterator["fitz.Pixmap"]:
+        """
+        按需逐页渲染PDF（生成器），达到 max_pages 后不再渲染后续页面
+
+        缩放比例取 dpi/72 与 max_long_edge/页面长边 中的较小者，
+        在渲染阶段直接得到目标尺寸，避免先渲染大图再缩小。
+        """
+        raster = self.raster
+        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+        try:
+            colorspace = fitz.csGRAY if raster["grayscale"] else fitz.csRGB
+            for index in range(min(doc.page_count, self.max_pages)):
+                page = doc.load_page(index)
+                scale = raster["dpi"] / 72
+                if raster.get("max_long_edge"):
+                    scale = min(scale, raster["max_long_edge"] / max(page.rect.width, page.rect.height))
+                yield page.get_pixmap(matrix=fitz.Matrix(scale, scale), colorspace=colorspace, alpha=False)
+        finally:
+            doc.close()
+
+    def _render_pdf_pages(self, pdf_bytes: bytes) -> List[Image.Image]:
+        """使用PyMuPDF将PDF页面渲染为PIL图像（受 max_pages 限制）"""
+        images = []
+        for pix in self._iter_pdf_pixmaps(pdf_bytes):
+            mode = "L" if pix.n == 1 else "RGB"
+            images.append(Image.frombytes(mode, [pix.width, pix.height], pix.samples))
+        return images
+
+    def _encode_pixmap(self, pix: "fitz.Pixmap") -> bytes:
+        """由PyMuPDF直接编码，省去转换为PIL图像的拷贝"""
+        if self.raster["format"] == "jpeg":
+            return pix.tobytes("jpeg", jpg_quality=self.raster["jpeg_quality"])
+        return pix.tobytes("png")
+
     def _convert_pdf_to_images(self, pdf_data: bytes) -> List[bytes]:
         """安全的PDF转图片实现"""
-        def pdf_to_images(pdf_bytes, dpi=300):
-            doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-            images = []
-            for page in doc:
-                pix = page.get_pixmap(dpi=dpi, colorspace="rgb")
-                img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-                images.append(img)
-            return [self._image_to_bytes(img) for img in images]
-        
         try:
-            return pdf_to_images(pdf_data)
+            pages = []
+            render_start = time.perf_counter()
+            for index, pix in enumerate(self._iter_pdf_pixmaps(pdf_data)):
+                encode_start = time.perf_counter()
+                data = self._encode_pixmap(pix)
+                done = time.perf_counter()
+                self._record_page(index, pix.width, pix.height, encode_start - render_start,
+                                  done - encode_start, len(data))
+                pages.append(data)
+                render_start = time.perf_counter()
+            return pages
         except Exception as e:
-            pass
+            self.logger.warning(f"PyMuPDF渲染失败，改用pdf2image: {str(e)}")
 
         try:
             images = convert_from_bytes(
                 pdf_data,
-                dpi=200,  # 平衡质量和性能
+                dpi=self.raster["dpi"],
                 first_page=1,
-                last_page=min(3, self.max_pages),
+                last_page=self.max_pages,
                 fmt='png',
+                grayscale=self.raster["grayscale"],
                 thread_count=2,  # 避免OOM
                 poppler_path="/usr/bin"  # 显式指定路径
             )
@@ -175,9 +244,42 @@ class VLMExtractor(BaseExtractor):
             raise ValueError("请安装poppler-utils: sudo apt install poppler-utils") from e
         except PDFSyntaxError as e:
             raise ValueError("PDF文件损坏或加密") from e
-        except MemoryError:
+        except MemoryError as e:
             raise ValueError("内存不足，请减少处理页数") from e
-        
+
+    def _record_page(self, index: int, width: int, height: int,
+                     render_seconds: float, encode_seconds: float, size: int) -> None:
+        """记录单页渲染/编码耗时与字节数"""
+        self.logger.debug(
+            f"第{index + 1}页 {width}x{height} 渲染 {render_seconds * 1000:.1f}ms "
+            f"编码 {encode_seconds * 1000:.1f}ms {size / 1024:.0f}KB"
+        )
+        with self._metrics_lock:
+            self._page_metrics.append({
+                "page": index + 1,
+                "width": width,
+                "height": height,
+                "render_ms": render_seconds * 1000,
+                "encode_ms": encode_seconds * 1000,
+                "bytes": size,
+            })
+
+    def raster_metrics(self) -> Dict:
+        """
+        最近渲染页面的汇总指标
+
+        Returns:
+            Dict: pages（页数）、各项平均/最大值（render_ms、encode_ms、bytes）及逐页明细 recent
+        """
+        with self._metrics_lock:
+            recent = list(self._page_metrics)
+        summary = {"pages": len(recent), "recent": recent}
+        for key in ("render_ms", "encode_ms", "bytes"):
+            values = [m[key] for m in recent]
+            summary[f"mean_{key}"] = sum(values) / len(values) if values else 0.0
+            summary[f"max_{key}"] = max(values) if values else 0.0
+        return summary
+
     def _repair_pdf(self, pdf_data: bytes) -> bytes:
         """尝试修复损坏的PDF"""
         try:
@@ -206,21 +308,28 @@ class VLMExtractor(BaseExtractor):
             raise ValueError(f"文本提取失败: {str(e)}") from e
         
     def _image_to_bytes(self, image) -> bytes:
-        """将PIL图像转换为字节"""
+        """将PIL图像按渲染配置（灰度、长边上限、格式）转换为字节"""
+        raster = self.raster
+        if raster["grayscale"] and image.mode != "L":
+            image = image.convert("L")
+        if raster.get("max_long_edge") and max(image.size) > raster["max_long_edge"]:
+            image = image.copy()
+            image.thumbnail((raster["max_long_edge"], raster["max_long_edge"]))
         with BytesIO() as buffer:
-            image.save(buffer, format='PNG', optimize=True)
+            if raster["format"] == "jpeg":
+                image.convert("L" if image.mode == "L" else "RGB").save(
+                    buffer, format="JPEG", quality=raster["jpeg_quality"])
+            else:
+                # optimize=True 会多次尝试压缩参数，耗时数倍而体积收益有限
+                image.save(buffer, format="PNG", compress_level=1)
             return buffer.getvalue()
 
-    def _call_vlm_api(self, inputs: List[Union[str, bytes]], prompt: str) -> Optional[Union[Dict, str]]:
+    def _build_vlm_request(self, inputs: List[Union[str, bytes]], prompt: str) -> Tuple[Dict, Dict]:
         """
-        调用VLM API处理数据
+        构造 /api/generate 请求（同步/异步提取器共用）
         
-        Args:
-            inputs: 输入数据列表（文本或图像字节）
-            prompt: 处理提示词
-            
         Returns:
-            Union[Dict, str, None]: 解析后的结果
+            Tuple[Dict, Dict]: (请求头, 请求体)
         """
         # 准备请求数据
         data = {
@@ -229,6 +338,9 @@ class VLMExtractor(BaseExtractor):
             "stream": False,
             "format": "json"
         }
+        # 每次请求刷新模型常驻时长（不带时服务端按默认的5分钟卸载）
+        if WARMUP_CONFIG.get("keep_alive") is not None:
+            data["keep_alive"] = WARMUP_CONFIG["keep_alive"]
         
         # 添加认证头
         headers = {
@@ -244,21 +356,36 @@ class VLMExtractor(BaseExtractor):
                 base64.b64encode(img).decode('utf-8') 
                 for img in inputs
             ]
+        return headers, data
+
+    def _handle_vlm_result(self, result: Dict) -> Optional[Union[Dict, str]]:
+        """检查 /api/generate 返回的JSON并解析模型回复"""
+        if not result.get("response"):
+            self.logger.error(f"API返回异常: {result}")
+            return None
+        return self._parse_api_response(result["response"])
+
+    def _call_vlm_api(self, inputs: List[Union[str, bytes]], prompt: str) -> Optional[Union[Dict, str]]:
+        """
+        调用VLM API处理数据
+        
+        Args:
+            inputs: 输入数据列表（文本或图像字节）
+            prompt: 处理提示词
+            
+        Returns:
+            Union[Dict, str, None]: 解析后的结果
+        """
+        headers, data = self._build_vlm_request(inputs, prompt)
         try:
-            response = requests.post(
+            response = self.session.post(
                 f"{self.ollama_url}/api/generate",
                 headers=headers,
                 json=data,
-                timeout=60
+                timeout=request_timeout()
             )
             # response.raise_for_status()
-            
-            result = response.json()
-            if not result.get("response"):
-                self.logger.error(f"API返回异常: {result}")
-                return None
-                
-            return self._parse_api_response(result["response"])
+            return self._handle_vlm_result(response.json())
                 
         except requests.exceptions.RequestException as e:
             self.logger.error(f"API请求失败: {str(e)}")
@@ -274,33 +401,60 @@ class VLMExtractor(BaseExtractor):
         except json.JSONDecodeError:
             return response  # 返回原始响应
 
-    def extract(self, uploaded_file: UploadedFile) -> Invoice:
+    def prepare(self, uploaded_file: FileInput) -> Tuple[List[Union[str, bytes]], str]:
+        """
+        预处理阶段（CPU密集）：读取文件并转换为模型输入
+        
+        Args:
+            uploaded_file: 上传的文件对象、文件路径或二进制内容
+            
+        Returns:
+            Tuple[List[Union[str, bytes]], str]: (处理后的数据列表, 内容类型)
+        """
+        return self._process_uploaded_file(uploaded_file)
+
+    def extract_prepared(self, file_name: str, prepared: Tuple[List[Union[str, bytes]], str]) -> Invoice:
+        """
+        模型调用阶段（I/O密集）：对预处理结果调用API并生成Invoice
+        
+        Args:
+            file_name: 文件名
+            prepared: prepare() 的返回值
+            
+        Returns:
+            Invoice: 提取的发票信息对象
+        """
+        processed_data, content_type = prepared
+        prompt = self._generate_invoice_prompt()
+        
+        result = self._call_vlm_api(processed_data, prompt)
+        if not result:
+            return Invoice(file_name=file_name, error="API处理失败")
+        
+        return self._create_invoice_from_result(file_name, result)
+
+    def extract(self, uploaded_file: FileInput) -> Invoice:
         """
         从上传文件中提取发票信息
         
         Args:
-            uploaded_file: 上传的文件对象
+            uploaded_file: 上传的文件对象、文件路径或二进制内容
             
         Returns:
             Invoice: 提取的发票信息对象
         """
+        try:
+            uploaded_file = InvoiceFile.coerce(uploaded_file)
+        except OSError as e:
+            return Invoice(file_name=str(uploaded_file), error=f"文件读取失败: {str(e)}")
         file_name = getattr(uploaded_file, 'name', '未知文件')
         
         try:
             # 1. 处理文件
-            processed_data, content_type = self._process_uploaded_file(uploaded_file)
-            
-            # 2. 准备API调用
-            prompt = self._generate_invoice_prompt()
-            
-            # 3. 调用API
-            result = self._call_vlm_api(processed_data, prompt)
-            if not result:
-                return Invoice(file_name=file_name, error="API处理失败")
+            prepared = self.prepare(uploaded_file)
             
-            # 4. 转换为Invoice对象
-            invoice =  self._create_invoice_from_result(file_name, result)
-            return invoice
+            # 2. 调用API并转换为Invoice对象
+            return self.extract_prepared(file_name, prepared)
             
         except ValueError as e:
             return Invoice(file_name=file_name, error=str(e))
@@ -336,6 +490,7 @@ class VLMExtractor(BaseExtractor):
             amount=self.to_float(result.get("金额")),
             tax_amount=self.to_float(result.get("税额")),
             total_amount=self.to_float(result.get("价税合计(小写)", )),
+            tax_rates=self.parse_tax_rates(result.get("税率")),
             raw_text=json.dumps(result, ensure_ascii=False, indent=2),
             error=None
         )
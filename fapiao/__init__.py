@@ -0,0 +1,2 @@
+# fapiao/__init__.py
+"""命令行批量提取入口：python -m fapiao --help"""
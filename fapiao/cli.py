@@ -0,0 +1,203 @@
+# fapiao/cli.py
+import argparse
+import asyncio
+import logging
+import sys
+import time
+from pathlib import Path
+from typing import Iterable, Iterator, List
+
+from config import BATCH_CONFIG
+from extractors import EXTRACTION_MODES, create_extractor
+from models.invoice_file import guess_mime_type
+from models import Invoice
+from utils.batch_utils import aiter_extract, iter_extract
+from utils.export_utils import EXPORT_FORMATS, open_invoice_writer
+from utils.duplicate_utils import iter_mark_duplicates
+from utils.validation_utils import iter_validated
+
+SUPPORTED_SUFFIXES = {".pdf", ".png", ".jpg", ".jpeg", ".tif", ".tiff"}
+
+
+def collect_input_files(inputs: Iterable[str], file_list: str = None) -> List[Path]:
+    """
+    收集待处理文件：目录递归遍历，文件直接加入，清单文件每行一个路径
+
+    Args:
+        inputs: 文件或目录路径
+        file_list: 清单文件路径（可选）
+
+    Returns:
+        List[Path]: 排序后的文件路径（只保存路径，不读取内容）
+    """
+    paths = [Path(p) for p in inputs]
+    if file_list:
+        with open(file_list, encoding="utf-8") as f:
+            paths.extend(Path(line.strip()) for line in f if line.strip())
+
+    files = []
+    for path in paths:
+        if path.is_dir():
+            files.extend(sorted(
+                p for p in path.rglob("*")
+                if p.is_file() and p.suffix.lower() in SUPPORTED_SUFFIXES
+            ))
+        else:
+            files.append(path)
+    return files
+
+
+def iter_extract_async(files: List[Path], extractor, concurrency: int, use_cache: bool) -> Iterator[Invoice]:
+    """在独立事件循环中运行 aiter_extract，以同步迭代器的形式产出结果（完成顺序）"""
+    loop = asyncio.new_event_loop()
+    results = aiter_extract(files, extractor, concurrency=concurrency, use_cache=use_cache)
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(results.__anext__())
+            except StopAsyncIteration:
+                break
+    finally:
+        loop.run_until_complete(results.aclose())
+        loop.run_until_complete(extractor.aclose())
+        loop.close()
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m fapiao",
+        description="批量提取发票信息并流式写出到 JSONL/CSV/Excel/Parquet"
+    )
+    parser.add_argument("inputs", nargs="*", help="发票文件或目录（目录递归查找PDF/图片）")
+    parser.add_argument("-l", "--file-list", help="清单文件，每行一个发票路径")
+    parser.add_argument("-o", "--output", required=True, help="输出文件路径")
+    parser.add_argument("-f", "--format", choices=EXPORT_FORMATS,
+                        help="输出格式，默认按输出文件扩展名推断")
+    parser.add_argument("-m", "--mode", choices=list(EXTRACTION_MODES), default="llm",
+                        help="提取模式 (default: llm)")
+    parser.add_argument("--model", help="settings.yaml 中的模型名称，默认取该类型的第一个模型")
+    parser.add_argument("-w", "--workers", type=int, default=BATCH_CONFIG.get("max_workers", 4),
+                        help="模型调用并发数")
+    parser.add_argument("--parse-workers", type=int, default=BATCH_CONFIG.get("parse_workers", 2),
+                        help="PDF解析/转图片并发数")
+    parser.add_argument("--async", dest="async_concurrency", type=int, default=0, metavar="N",
+                        help="使用异步提取器，同时在途 N 个模型请求（仅 llm/vlm 模式，结果按完成顺序写出）")
+    parser.add_argument("--pack", type=int, default=0, metavar="N",
+                        help="llm 模式每次请求最多打包 N 张发票（按模型上下文长度自动减少，默认取 batch_config.pack_size）")
+    parser.add_argument("--no-cache", action="store_true", help="不使用提取结果缓存")
+    parser.add_argument("--no-dedup", action="store_true",
+                        help="不做跨批次查重，也不把本次结果登记到查重索引（同一文件重复运行本身不会被标记为重复）")
+    parser.add_argument("--progress-interval", type=float, default=2.0,
+                        help="进度输出间隔（秒）")
+    parser.add_argument("-v", "--verbose", action="store_true", help="输出详细日志")
+    return parser
+
+
+def main(argv: List[str] = None) -> int:
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.WARNING,
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+    )
+
+    files = collect_input_files(args.inputs, args.file_list)
+    if not files:
+        print("未找到待处理的发票文件", file=sys.stderr)
+        return 2
+    unsupported = [p for p in files if guess_mime_type(p.name) is None]
+    if unsupported:
+        print(f"警告: {len(unsupported)} 个文件类型无法识别，将记录为错误", file=sys.stderr)
+
+    try:
+        extractor = create_extractor(args.mode, args.model, use_async=args.async_concurrency > 0)
+        if args.pack:
+            if args.mode != "llm" or args.async_concurrency > 0:
+                raise ValueError("--pack 仅支持同步 llm 模式")
+            extractor.pack_size = args.pack
+        writer = open_invoice_writer(args.output, args.format)
+    except (ValueError, ImportError) as e:
+        print(f"错误: {e}", file=sys.stderr)
+        return 2
+
+    total = len(files)
+    error_count = 0
+    flagged_count = 0
+    duplicate_count = 0
+    error_samples = []  # 只保留前若干条错误明细，内存占用与批量大小无关
+    start = last_report = time.monotonic()
+    if args.async_concurrency > 0:
+        results = iter_extract_async(files, extractor, args.async_concurrency, not args.no_cache)
+    else:
+        results = iter_extract(
+            files,
+            extractor,
+            max_workers=args.workers,
+            parse_workers=args.parse_workers,
+            use_cache=not args.no_cache
+        )
+    # 每200张做一次向量化校验与查重，校验/重复提示随结果写入输出文件
+    results = iter_validated(results, chunk_size=200)
+    if not args.no_dedup:
+        results = iter_mark_duplicates(results, chunk_size=200)
+    with writer:
+        for done, invoice in enumerate(results, 1):
+            writer.write(invoice)
+            if invoice.flags:
+                flagged_count += 1
+            if invoice.duplicate_of:
+                duplicate_count += 1
+            if invoice.error:
+                error_count += 1
+                if len(error_samples) < 20:
+                    error_samples.append((invoice.file_name, invoice.error))
+
+            now = time.monotonic()
+            if now - last_report >= args.progress_interval or done == total:
+                last_report = now
+                rate = done / max(now - start, 1e-9)
+                eta = (total - done) / rate if rate else 0
+                print(
+                    f"[{done}/{total}] {rate:.2f} 张/秒  错误 {error_count}  剩余约 {eta:.0f} 秒",
+                    file=sys.stderr
+                )
+
+    elapsed = time.monotonic() - start
+    print(
+        f"完成: {total} 个文件，成功 {total - error_count}，失败 {error_count}，"
+        f"耗时 {elapsed:.1f} 秒，输出 {args.output}",
+        file=sys.stderr
+    )
+    if flagged_count:
+        print(f"校验: {flagged_count} 张发票存在异常，详见输出文件的“校验提示”列", file=sys.stderr)
+    if duplicate_count:
+        print(f"查重: {duplicate_count} 张发票与历史记录重复，详见输出文件的“重复提示”列", file=sys.stderr)
+    if hasattr(extractor, "stats"):
+        stats = extractor.stats()
+        print(
+            f"分级提取: 仅正则完成 {stats['regex_only']}/{stats['total']} "
+            f"({stats['model_avoided_ratio']:.1%} 免调用大模型)",
+            file=sys.stderr
+        )
+    if hasattr(extractor, "model_stats"):
+        stats = extractor.model_stats()
+        for model in stats["models"]:
+            if model["calls"]:
+                print(
+                    f"模型级联 {model['model']}: 调用 {model['calls']}，通过率 {model['pass_rate']:.1%}，"
+                    f"平均 {model['mean_seconds']:.2f} 秒，完成 {model['resolved']} 张",
+                    file=sys.stderr
+                )
+        print(f"模型级联: {stats['unresolved']}/{stats['total']} 张各级均未通过校验", file=sys.stderr)
+    llm_extractor = getattr(extractor, "llm_extractor", extractor)
+    if hasattr(llm_extractor, "usage_stats") and llm_extractor.usage_stats()["requests"]:
+        usage = llm_extractor.usage_stats()
+        print(
+            f"提示词 {usage['prompt_version']}: 平均 {usage['mean_prompt_tokens']:.0f} tokens/请求，"
+            f"前缀缓存命中 {usage['cached_ratio']:.1%}",
+            file=sys.stderr
+        )
+    for file_name, error in error_samples:
+        print(f"  ✗ {file_name}: {error}", file=sys.stderr)
+    if error_count > len(error_samples):
+        print(f"  ... 另有 {error_count - len(error_samples)} 个错误", file=sys.stderr)
+    return 1 if error_count else 0
@@ -1,4 +1,6 @@
 # models/__init__.py
 from .invoice import *
+from .invoice_file import *
+from .invoice_batch import *
 
-__all__ = ["Invoice"]  # 控制 `from models import *` 时的行为
+__all__ = ["Invoice", "InvoiceFile", "FileInput", "InvoiceBatch"]  # 控制 `from models import *` 时的行为
@@ -1,8 +1,33 @@
 # models/invoice.py
-from typing import Dict, Optional
+from functools import lru_cache
+from typing import Dict, List, Optional
 from dataclasses import dataclass
+from datetime import date, datetime
 import json
 
+# 提取结果必须包含的字段
+REQUIRED_FIELDS = (
+    "invoice_number", "issue_date", "buyer", "seller",
+    "item_name", "amount", "tax_amount", "total_amount",
+)
+AMOUNT_FIELDS = ("amount", "tax_amount", "total_amount")
+# 开票日期可能的字符串格式（正则提取为“2025年06月23日”，模型提取为date）
+DATE_FORMATS = ("%Y年%m月%d日", "%Y-%m-%d", "%Y/%m/%d")
+
+
+@lru_cache(maxsize=4096)
+def parse_issue_date(value) -> Optional[date]:
+    """开票日期（字符串或date）转换为date，无法解析时返回None；同一批次日期重复度高，结果缓存"""
+    if value is None or isinstance(value, date):
+        return value
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(str(value).strip(), fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
 @dataclass
 class Invoice:
     file_name: str
@@ -14,8 +39,27 @@ class Invoice:
     amount: Optional[float] = None
     tax_amount: Optional[float] = None
     total_amount: Optional[float] = None
+    total_in_words: Optional[str] = None   # 价税合计大写（文本中有时提取）
+    tax_rates: Optional[List[float]] = None  # 税率：正则提取为明细行逐行税率，模型提取为回复中列出的税率（校验税额使用）
     raw_text: Optional[str] = None
     error: Optional[str] = None
+    flags: Optional[Dict[str, str]] = None  # 校验提示：字段 -> 说明（见 utils.validation_utils）
+    duplicate_of: Optional[str] = None      # 重复提示：与哪张已登记发票重复（见 utils.duplicate_utils）
+    file_hash: Optional[str] = None         # 文件内容SHA-256（查重时区分同一文件的重复运行与真正的重复发票）
+
+    def missing_fields(self) -> List[str]:
+        """返回为空（None或空字符串）的必填字段"""
+        return [name for name in REQUIRED_FIELDS if getattr(self, name) in (None, "")]
+
+    def amounts_consistent(self, tolerance: float = 0.01) -> bool:
+        """金额 + 税额 与价税合计相差不超过 tolerance（默认1分）"""
+        if None in (self.amount, self.tax_amount, self.total_amount):
+            return False
+        return abs(self.amount + self.tax_amount - self.total_amount) <= tolerance + 1e-9
+
+    def parsed_issue_date(self) -> Optional[date]:
+        """开票日期统一转换为date，无法解析时返回None"""
+        return parse_issue_date(self.issue_date)
 
     def to_dict(self) -> Dict:
         return {
@@ -29,7 +73,9 @@ class Invoice:
             "税额": self.tax_amount or "未提取",
             "价税合计": self.total_amount or "未提取",
             "原始文本": self.raw_text or "",
-            "错误信息": self.error or ""
+            "错误信息": self.error or "",
+            "校验提示": "；".join(self.flags.values()) if self.flags else "",
+            "重复提示": self.duplicate_of or ""
         }
     
     def to_json(self, indent: int = 2, ensure_ascii: bool = False) -> str:
@@ -54,6 +100,8 @@ class Invoice:
                 "税额": self.tax_amount,
                 "价税合计": self.total_amount,
                 "错误信息": self.error,
+                "校验提示": self.flags,
+                "重复提示": self.duplicate_of,
                 # 原始文本过大时不完整输出
                 "原始文本": len(self.raw_text) if self.raw_text else 0
             },
@@ -0,0 +1,341 @@
+# models/invoice_batch.py
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from .invoice import AMOUNT_FIELDS, Invoice
+
+# 金额缺失值（以分为单位的int64列中使用）
+MISSING_CENTS = np.iinfo(np.int64).min
+# 重复度高、适合按类别存储的字符串字段
+CATEGORICAL_FIELDS = ("buyer", "seller", "item_name")
+
+
+@dataclass
+class CategoricalColumn:
+    """字典编码的字符串列：codes 为 int32 序号（-1 表示缺失），categories 为去重后的字符串"""
+    codes: np.ndarray
+    categories: List[str]
+
+    @classmethod
+    def from_values(cls, values: Iterable[Optional[str]]) -> "CategoricalColumn":
+        lookup: Dict[str, int] = {}
+        codes = [-1 if value is None else lookup.setdefault(value, len(lookup)) for value in values]
+        return cls(np.asarray(codes, dtype=np.int32), list(lookup))
+
+    @classmethod
+    def concat(cls, columns: List["CategoricalColumn"]) -> "CategoricalColumn":
+        """合并多个列，类别重新编号"""
+        lookup: Dict[str, int] = {}
+        parts = []
+        for column in columns:
+            remap = np.asarray(
+                [lookup.setdefault(value, len(lookup)) for value in column.categories] + [-1], dtype=np.int32
+            )
+            parts.append(remap[column.codes])  # codes为-1时取到末尾的-1
+        return cls(np.concatenate(parts) if parts else np.empty(0, np.int32), list(lookup))
+
+    def __getitem__(self, index: int) -> Optional[str]:
+        code = self.codes[index]
+        return None if code < 0 else self.categories[code]
+
+    def take(self, indexes: np.ndarray) -> "CategoricalColumn":
+        return CategoricalColumn(self.codes[indexes], self.categories)
+
+    def to_pandas(self) -> pd.Categorical:
+        """零拷贝转换为 pandas.Categorical"""
+        return pd.Categorical.from_codes(self.codes, categories=pd.Index(self.categories, dtype=object))
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + sum(len(value.encode("utf-8")) for value in self.categories)
+
+
+@dataclass
+class InvoiceBatch:
+    """
+    发票批次的列式存储，与 List[Invoice] 可相互转换
+
+    - 购方、销方、项目名称按类别编码（CategoricalColumn），重复字符串只保存一份
+    - 金额以分为单位存为 int64（缺失为 MISSING_CENTS），避免浮点误差
+    - 开票日期存为 datetime64[D]（缺失为 NaT），无法解析的原始字符串另存
+    - 原始文本、错误信息、税率与校验提示稀疏存储在列外（只保存非空的行），可选择不保留原始文本
+    - 与 Invoice 相互转换不丢失字段（raw_text 除外，可选择不保留）
+    """
+    file_name: np.ndarray                     # object
+    invoice_number: np.ndarray                # 全部为ASCII时为定长bytes，否则为object
+    issue_date: np.ndarray                    # datetime64[D]
+    buyer: CategoricalColumn
+    seller: CategoricalColumn
+    item_name: CategoricalColumn
+    amount: np.ndarray                        # int64，单位：分
+    tax_amount: np.ndarray
+    total_amount: np.ndarray
+    total_in_words: np.ndarray                # object，价税合计大写（缺失为None）
+    file_hash: np.ndarray                     # object，文件内容SHA-256（缺失为None）
+    errors: Dict[int, str] = field(default_factory=dict)
+    raw_texts: Dict[int, str] = field(default_factory=dict)
+    unparsed_dates: Dict[int, str] = field(default_factory=dict)
+    flags: Dict[int, Dict[str, str]] = field(default_factory=dict)
+    duplicates: Dict[int, str] = field(default_factory=dict)
+    tax_rates: Dict[int, List[float]] = field(default_factory=dict)
+
+    @classmethod
+    def from_invoices(cls, invoices: Iterable[Invoice], keep_raw_text: bool = True) -> "InvoiceBatch":
+        """
+        由 Invoice 序列构建（只遍历一次，可传入生成器）
+
+        Args:
+            invoices: 发票
+            keep_raw_text: 是否保留原始文本
+
+        Returns:
+            InvoiceBatch: 列式批次
+        """
+        columns: Dict[str, list] = {name: [] for name in (
+            "file_name", "invoice_number", "issue_date", *CATEGORICAL_FIELDS, *AMOUNT_FIELDS, "total_in_words",
+            "file_hash",
+        )}
+        errors, raw_texts, unparsed_dates, flags, duplicates, tax_rates = {}, {}, {}, {}, {}, {}
+        for i, inv in enumerate(invoices):
+            columns["file_name"].append(inv.file_name)
+            columns["invoice_number"].append(inv.invoice_number or "")
+            parsed = inv.parsed_issue_date()
+            columns["issue_date"].append(parsed)
+            if parsed is None and inv.issue_date:
+                unparsed_dates[i] = str(inv.issue_date)
+            for name in CATEGORICAL_FIELDS:
+                columns[name].append(getattr(inv, name))
+            for name in AMOUNT_FIELDS:
+                columns[name].append(getattr(inv, name))
+            columns["total_in_words"].append(inv.total_in_words)
+            columns["file_hash"].append(inv.file_hash)
+            if inv.error:
+                errors[i] = inv.error
+            if inv.flags:
+                flags[i] = inv.flags
+            if inv.duplicate_of:
+                duplicates[i] = inv.duplicate_of
+            if inv.tax_rates is not None:
+                tax_rates[i] = inv.tax_rates
+            if keep_raw_text and inv.raw_text:
+                raw_texts[i] = inv.raw_text
+
+        return cls(
+            file_name=np.asarray(columns["file_name"], dtype=object),
+            invoice_number=_string_array(columns["invoice_number"]),
+            issue_date=np.asarray(columns["issue_date"], dtype="datetime64[D]"),
+            **{name: CategoricalColumn.from_values(columns[name]) for name in CATEGORICAL_FIELDS},
+            **{name: to_cents(columns[name]) for name in AMOUNT_FIELDS},
+            total_in_words=np.asarray(columns["total_in_words"], dtype=object),
+            file_hash=np.asarray(columns["file_hash"], dtype=object),
+            errors=errors,
+            raw_texts=raw_texts,
+            unparsed_dates=unparsed_dates,
+            flags=flags,
+            duplicates=duplicates,
+            tax_rates=tax_rates,
+        )
+
+    @classmethod
+    def concat(cls, batches: List["InvoiceBatch"]) -> "InvoiceBatch":
+        """按顺序合并多个批次"""
+        offsets = np.cumsum([0] + [len(batch) for batch in batches])
+
+        def merged(attr: str) -> Dict:
+            return {offset + i: value for offset, batch in zip(offsets, batches)
+                    for i, value in getattr(batch, attr).items()}
+
+        numbers = [batch.invoice_number for batch in batches]
+        if any(array.dtype == object for array in numbers):
+            numbers = [np.char.decode(array, "ascii").astype(object) if array.dtype.kind == "S" else array
+                       for array in numbers]
+        return cls(
+            file_name=np.concatenate([batch.file_name for batch in batches]) if batches else np.empty(0, object),
+            invoice_number=np.concatenate(numbers) if batches else np.empty(0, "S1"),
+            issue_date=np.concatenate([batch.issue_date for batch in batches]) if batches
+            else np.empty(0, "datetime64[D]"),
+            **{name: CategoricalColumn.concat([getattr(batch, name) for batch in batches])
+               for name in CATEGORICAL_FIELDS},
+            **{name: np.concatenate([getattr(batch, name) for batch in batches]) if batches
+               else np.empty(0, np.int64) for name in AMOUNT_FIELDS},
+            total_in_words=np.concatenate([batch.total_in_words for batch in batches]) if batches
+            else np.empty(0, object),
+            file_hash=np.concatenate([batch.file_hash for batch in batches]) if batches else np.empty(0, object),
+            errors=merged("errors"),
+            raw_texts=merged("raw_texts"),
+            unparsed_dates=merged("unparsed_dates"),
+            flags=merged("flags"),
+            duplicates=merged("duplicates"),
+            tax_rates=merged("tax_rates"),
+        )
+
+    def __len__(self) -> int:
+        return len(self.file_name)
+
+    def __getitem__(self, index: int) -> Invoice:
+        """取出单张发票（金额还原为元，开票日期为date或原始字符串）"""
+        index = range(len(self))[index]
+        issue_date = self.issue_date[index]
+        return Invoice(
+            file_name=self.file_name[index],
+            invoice_number=_string_value(self.invoice_number[index]) or None,
+            issue_date=issue_date.item() if not np.isnat(issue_date) else self.unparsed_dates.get(index),
+            buyer=self.buyer[index],
+            seller=self.seller[index],
+            item_name=self.item_name[index],
+            amount=_cents_value(self.amount[index]),
+            tax_amount=_cents_value(self.tax_amount[index]),
+            total_amount=_cents_value(self.total_amount[index]),
+            total_in_words=self.total_in_words[index],
+            tax_rates=self.tax_rates.get(index),
+            raw_text=self.raw_texts.get(index),
+            error=self.errors.get(index),
+            flags=self.flags.get(index),
+            duplicate_of=self.duplicates.get(index),
+            file_hash=self.file_hash[index],
+        )
+
+    def __iter__(self) -> Iterator[Invoice]:
+        """逐张产出 Invoice（各列先整体转换为Python列表，不逐个访问numpy标量）"""
+        numbers = self.invoice_number
+        if numbers.dtype.kind == "S":
+            numbers = np.char.decode(numbers, "ascii")
+        dates = self.issue_date.astype(object).tolist()
+        names = {name: getattr(self, name) for name in CATEGORICAL_FIELDS}
+        amounts = {name: [None if value == MISSING_CENTS else value / 100 for value in getattr(self, name).tolist()]
+                   for name in AMOUNT_FIELDS}
+        categories = {name: column.categories + [None] for name, column in names.items()}  # 下标-1取到None
+        codes = {name: column.codes.tolist() for name, column in names.items()}
+        words = self.total_in_words.tolist()
+        hashes = self.file_hash.tolist()
+        for i, (file_name, number, issue_date) in enumerate(zip(self.file_name.tolist(), numbers.tolist(), dates)):
+            yield Invoice(
+                file_name=file_name,
+                invoice_number=number or None,
+                issue_date=issue_date if issue_date is not None else self.unparsed_dates.get(i),
+                **{name: categories[name][codes[name][i]] for name in CATEGORICAL_FIELDS},
+                **{name: amounts[name][i] for name in AMOUNT_FIELDS},
+                total_in_words=words[i],
+                tax_rates=self.tax_rates.get(i),
+                raw_text=self.raw_texts.get(i),
+                error=self.errors.get(i),
+                flags=self.flags.get(i),
+                duplicate_of=self.duplicates.get(i),
+                file_hash=hashes[i],
+            )
+
+    def to_invoices(self) -> List[Invoice]:
+        return list(self)
+
+    @property
+    def error_mask(self) -> np.ndarray:
+        """提取失败的行"""
+        mask = np.zeros(len(self), dtype=bool)
+        mask[list(self.errors)] = True
+        return mask
+
+    def take(self, indexes) -> "InvoiceBatch":
+        """按行号（或布尔掩码）取子批次"""
+        indexes = np.arange(len(self))[indexes]
+        position = {old: new for new, old in enumerate(indexes.tolist())}
+
+        def remap(values: Dict) -> Dict:
+            return {position[i]: value for i, value in values.items() if i in position}
+
+        return InvoiceBatch(
+            file_name=self.file_name[indexes],
+            invoice_number=self.invoice_number[indexes],
+            issue_date=self.issue_date[indexes],
+            **{name: getattr(self, name).take(indexes) for name in CATEGORICAL_FIELDS},
+            **{name: getattr(self, name)[indexes] for name in AMOUNT_FIELDS},
+            total_in_words=self.total_in_words[indexes],
+            file_hash=self.file_hash[indexes],
+            errors=remap(self.errors),
+            raw_texts=remap(self.raw_texts),
+            unparsed_dates=remap(self.unparsed_dates),
+            flags=remap(self.flags),
+            duplicates=remap(self.duplicates),
+            tax_rates=remap(self.tax_rates),
+        )
+
+    def amounts_yuan(self, name: str) -> np.ndarray:
+        """金额列换算为元（float64，缺失为NaN）"""
+        cents = getattr(self, name)
+        return np.where(cents == MISSING_CENTS, np.nan, cents / 100)
+
+    def to_frame(self, columns: Optional[Dict[str, str]] = None, include_error: bool = True) -> pd.DataFrame:
+        """
+        转换为DataFrame（按列构建，不逐行访问对象）
+
+        Args:
+            columns: 字段名 -> 列名 的映射（同时决定列顺序），默认使用字段名
+            include_error: 是否包含 error 列（columns 中未列出时忽略）
+
+        Returns:
+            pd.DataFrame: 金额为元（float64），购/销方与项目名称为category类型，flags 为合并后的校验提示，
+                          duplicate_of 为重复提示
+        """
+        data = {
+            "file_name": self.file_name,
+            "invoice_number": np.char.decode(self.invoice_number, "ascii")
+            if self.invoice_number.dtype.kind == "S" else self.invoice_number,
+            "issue_date": self.issue_date,
+            **{name: getattr(self, name).to_pandas() for name in CATEGORICAL_FIELDS},
+            **{name: self.amounts_yuan(name) for name in AMOUNT_FIELDS},
+        }
+        if include_error:
+            data["error"] = _sparse_column(len(self), self.errors)
+        data["flags"] = _sparse_column(len(self), {i: "；".join(flags.values()) for i, flags in self.flags.items()})
+        data["duplicate_of"] = _sparse_column(len(self), self.duplicates)
+        if columns is None:
+            return pd.DataFrame(data)
+        return pd.DataFrame({label: data[name] for name, label in columns.items() if name in data})
+
+    @property
+    def nbytes(self) -> int:
+        """列数据占用的大致字节数（不含原始文本）"""
+        return (
+            sum(len(str(name).encode("utf-8")) + 8 for name in self.file_name)
+            + self.invoice_number.nbytes
+            + self.issue_date.nbytes
+            + sum(getattr(self, name).nbytes for name in CATEGORICAL_FIELDS)
+            + sum(getattr(self, name).nbytes for name in AMOUNT_FIELDS)
+            + sum(len(message.encode("utf-8")) for message in self.errors.values())
+        )
+
+
+def to_cents(values: Iterable[Optional[float]]) -> np.ndarray:
+    """金额（元）转换为以分为单位的int64数组，None/NaN 记为 MISSING_CENTS"""
+    yuan = np.asarray([np.nan if value is None else value for value in values], dtype=np.float64)
+    missing = np.isnan(yuan)
+    cents = np.rint(np.where(missing, 0, yuan) * 100).astype(np.int64)
+    cents[missing] = MISSING_CENTS
+    return cents
+
+
+def _sparse_column(size: int, values: Dict[int, str]) -> np.ndarray:
+    column = np.full(size, None, dtype=object)
+    for i, value in values.items():
+        column[i] = value
+    return column
+
+
+def _cents_value(cents: np.int64) -> Optional[float]:
+    return None if cents == MISSING_CENTS else int(cents) / 100
+
+
+def _string_array(values: List[str]) -> np.ndarray:
+    """全部为ASCII（发票号码通常为20位数字）时存为定长bytes，否则为object"""
+    try:
+        return np.asarray([value.encode("ascii") for value in values], dtype="S") if values \
+            else np.empty(0, "S1")
+    except UnicodeEncodeError:
+        return np.asarray(values, dtype=object)
+
+
+def _string_value(value) -> str:
+    return value.decode("ascii") if isinstance(value, bytes) else value
+
@@ -0,0 +1,58 @@
+# models/invoice_file.py
+import io
+import mimetypes
+import os
+from pathlib import Path
+from typing import BinaryIO, Optional, Union
+
+# 提取器可接受的文件输入：路径、二进制内容或类文件对象（如Streamlit的UploadedFile）
+FileInput = Union[str, os.PathLike, bytes, BinaryIO]
+
+# mimetypes 在部分系统上缺少这些映射
+_EXTRA_TYPES = {
+    ".pdf": "application/pdf",
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".tif": "image/tiff",
+    ".tiff": "image/tiff",
+}
+
+
+class InvoiceFile(io.BytesIO):
+    """与Streamlit UploadedFile 接口一致（name/type/size）的内存文件，供命令行等非UI场景使用"""
+
+    def __init__(self, data: bytes, name: str = "未知文件", type: Optional[str] = None):
+        super().__init__(data)
+        self.name = name
+        self.type = type or guess_mime_type(name)
+        self.size = len(data)
+
+    @classmethod
+    def from_path(cls, path: Union[str, os.PathLike]) -> "InvoiceFile":
+        """从磁盘路径读取文件"""
+        path = Path(path)
+        return cls(path.read_bytes(), name=path.name)
+
+    @classmethod
+    def coerce(cls, file: FileInput) -> BinaryIO:
+        """
+        将各种文件输入统一为带 name/type 的类文件对象
+
+        Args:
+            file: 路径、二进制内容或已有的类文件对象
+
+        Returns:
+            BinaryIO: 类文件对象（已有对象原样返回）
+        """
+        if isinstance(file, (str, os.PathLike)):
+            return cls.from_path(file)
+        if isinstance(file, (bytes, bytearray)):
+            return cls(bytes(file))
+        return file
+
+
+def guess_mime_type(name: str) -> Optional[str]:
+    """根据扩展名推断MIME类型"""
+    suffix = Path(name).suffix.lower()
+    return _EXTRA_TYPES.get(suffix) or mimetypes.guess_type(name)[0]
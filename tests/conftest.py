@@ -0,0 +1,6 @@
+# tests/conftest.py
+import os
+import tempfile
+
+# 测试使用独立的缓存目录（提取缓存、查重索引、结果库、任务表），不读写仓库下的 .cache
+os.environ.setdefault("FAPIAO_CACHE_DIR", tempfile.mkdtemp(prefix="fapiao-tests-"))
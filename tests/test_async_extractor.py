@@ -0,0 +1,45 @@
+# tests/test_async_extractor.py
+import asyncio
+
+from benchmarks.stub_server import LatencyModel, StubConfig, run_stub_server
+from extractors.async_extractor import AsyncLLMExtractor, bounded_as_completed
+
+
+def test_extract_many_respects_concurrency_limit():
+    texts = [f"发票{i}" for i in range(12)]
+
+    async def run(base_url):
+        async with AsyncLLMExtractor("stub", api_key="test", base_url=base_url) as extractor:
+            return [item async for item in extractor.extract_many(texts, concurrency=3)]
+
+    with run_stub_server(StubConfig(latency=LatencyModel("fixed:0.1"))) as server:
+        results = asyncio.run(run(f"http://127.0.0.1:{server.server_port}"))
+        stats = server.stub.stats.snapshot()
+    assert sorted(index for index, _ in results) == list(range(12))
+    assert not any(invoice.error for _, invoice in results)
+    assert stats["requests"] == 12
+    assert stats["max_in_flight"] == 3
+
+
+def test_bounded_as_completed_reads_input_lazily():
+    consumed = []
+
+    def items():
+        for i in range(10):
+            consumed.append(i)
+            yield i
+
+    async def worker(i):
+        await asyncio.sleep(0.01 * (i % 3))
+        return i * i
+
+    async def first_result():
+        results = bounded_as_completed(items(), worker, concurrency=2)
+        first = await results.__anext__()
+        await results.aclose()
+        return first
+
+    index, value = asyncio.run(first_result())
+    assert value == index * index
+    # 信号量背压：拿到第一个结果时最多读取了 concurrency + 1 个输入
+    assert len(consumed) <= 3
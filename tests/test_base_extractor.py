@@ -0,0 +1,40 @@
+# tests/test_base_extractor.py
+import pytest
+
+from extractors.base_extractor import BaseExtractor
+
+PARSER = BaseExtractor([])
+
+
+@pytest.mark.parametrize("words, expected", [
+    ("壹佰零壹圆柒角叁分", 101.73),
+    ("拾万元整", 100000.0),
+    ("壹拾万零伍元", 100005.0),
+    ("伍角", 0.5),
+    ("零元捌分", 0.08),
+    ("叁佰零伍元零捌分", 305.08),
+    ("壹亿贰仟万元整", 120000000.0),
+    ("壹亿零叁拾万零陆元伍角", 100300006.5),
+    ("贰万零壹佰元整", 20100.0),
+])
+def test_chinese_amount_to_float(words, expected):
+    assert PARSER._chinese_amount_to_float(words) == expected
+
+
+def test_chinese_amount_to_float_rejects_invalid_text():
+    with pytest.raises(ValueError):
+        PARSER._chinese_amount_to_float("壹佰元五角")
+
+
+def test_extract_tax_rates_reads_each_detail_line():
+    text = ("项目名称 单 价 数 量 金 额 税率/征收率 税 额 *信息技术服务*软件服务 500.00 1 500.00 6% 30.00 "
+            "*电子计算机*笔记本 1000.00 1 1000.00 13% 130.00 *农产品*大米 20.00 1 20.00 免税 *** 合 计")
+    assert PARSER.extract_tax_rates(text) == [0.06, 0.13, 0.0]
+    assert PARSER.extract_tax_rates("合 计 ¥98.77 ¥2.96") is None
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("3%", [0.03]), ("13%,6%", [0.13, 0.06]), ("1.5%", [0.015]), (0.09, [0.09]), ("免税", [0.0]), ("", None),
+])
+def test_parse_tax_rates(value, expected):
+    assert PARSER.parse_tax_rates(value) == expected
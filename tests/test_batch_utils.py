@@ -0,0 +1,81 @@
+# tests/test_batch_utils.py
+import time
+
+import pytest
+
+from benchmarks.corpus import write_corpus
+from extractors.base_extractor import BaseExtractor
+from models import Invoice, InvoiceFile
+from utils.batch_utils import iter_extract, iter_extract_unordered
+
+
+class SleepyExtractor:
+    """文件型提取器：文件名中的数字为模型调用耗时（10ms），含 bad 的文件调用失败，含 broken 的预处理失败"""
+    input_kind = "file"
+    model_path = ""
+
+    def prepare(self, file):
+        if "broken" in file.name:
+            raise ValueError("无法解析")
+        return file.name
+
+    def extract_prepared(self, file_name, payload):
+        if "bad" in payload:
+            raise RuntimeError("模型调用失败")
+        time.sleep(int(payload.split(".")[0].split("-")[0]) / 100)
+        return Invoice(file_name="", invoice_number=payload)
+
+
+def _files(*names):
+    return [InvoiceFile(b"", name=name) for name in names]
+
+
+@pytest.fixture(scope="module")
+def pdfs(tmp_path_factory):
+    return write_corpus(tmp_path_factory.mktemp("corpus"), 6)
+
+
+class ShortPackExtractor(BaseExtractor):
+    """打包接口每包少返回一张"""
+    pack_size = 3
+    model_path = "short-pack"
+
+    def __init__(self):
+        super().__init__([])
+
+    def plan_packs(self, payloads):
+        return [list(range(len(payloads)))]
+
+    def extract_pack(self, payloads):
+        return [Invoice(file_name="", invoice_number=str(i)) for i in range(len(payloads) - 1)]
+
+
+def test_short_pack_results_become_error_invoices(pdfs):
+    invoices = list(iter_extract(pdfs, ShortPackExtractor(), max_workers=1, use_cache=False))
+    assert len(invoices) == len(pdfs)
+    assert all(invoice is not None for invoice in invoices)
+    assert [invoice.file_name for invoice in invoices] == [path.name for path in pdfs]
+    assert [bool(invoice.error) for invoice in invoices] == [False, False, True] * 2
+
+
+def test_iter_extract_keeps_input_order():
+    names = ["9.pdf", "1.pdf", "5.pdf", "0.pdf", "3.pdf"]
+    invoices = list(iter_extract(_files(*names), SleepyExtractor(), max_workers=4, use_cache=False))
+    assert [invoice.file_name for invoice in invoices] == names
+    assert [invoice.invoice_number for invoice in invoices] == names
+
+
+def test_iter_extract_isolates_failing_files():
+    names = ["1.pdf", "2-bad.pdf", "1-broken.pdf", "0.pdf"]
+    invoices = list(iter_extract(_files(*names), SleepyExtractor(), max_workers=2, use_cache=False))
+    assert [invoice.file_name for invoice in invoices] == names
+    assert [invoice.error for invoice in invoices] == [None, "模型调用失败", "无法解析", None]
+
+
+def test_iter_extract_unordered_yields_fast_files_first():
+    names = ["30.pdf", "0.pdf", "1.pdf", "2-bad.pdf"]
+    results = list(iter_extract_unordered(_files(*names), SleepyExtractor(), max_workers=4, use_cache=False))
+    assert sorted(position for position, _ in results) == [0, 1, 2, 3]
+    assert results[-1][0] == 0
+    assert all(invoice.file_name == names[position] for position, invoice in results)
+    assert dict(results)[3].error == "模型调用失败"
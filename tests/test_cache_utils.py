@@ -0,0 +1,95 @@
+# tests/test_cache_utils.py
+import time
+
+from models import Invoice, InvoiceFile
+from utils.batch_utils import iter_extract
+from utils.cache_utils import ExtractionCache, file_digest, get_extraction_cache, make_cache_key
+
+
+class FakeExtractor:
+    """文件型提取器，记录模型调用次数"""
+    input_kind = "file"
+
+    def __init__(self, model_path="model-a", prompt="v1"):
+        self.model_path, self.prompt, self.calls = model_path, prompt, 0
+
+    def prompt_fingerprint(self):
+        return self.prompt
+
+    def prepare(self, file):
+        return file.read()
+
+    def extract_prepared(self, file_name, payload):
+        self.calls += 1
+        return Invoice(file_name="", invoice_number=payload.decode())
+
+
+class OtherExtractor(FakeExtractor):
+    pass
+
+
+def test_counters_are_shared_between_processes(tmp_path):
+    """工作进程（另一个缓存实例）的命中/未命中计入界面进程的统计"""
+    worker, ui = ExtractionCache(tmp_path), ExtractionCache(tmp_path)
+    assert worker.get("a") is None
+    worker.put("a", Invoice(file_name="a.pdf", invoice_number="1"))
+    assert worker.get("a").invoice_number == "1"
+    assert ui.stats() == {"hits": 1, "misses": 1, "entries": 1}
+    ui.clear()
+    assert worker.stats() == {"hits": 0, "misses": 0, "entries": 0}
+
+
+def test_key_depends_on_content_model_and_prompt():
+    digest = file_digest(b"pdf")
+    key = make_cache_key(digest, FakeExtractor())
+    assert key == make_cache_key(file_digest(b"pdf"), FakeExtractor())
+    assert key != make_cache_key(file_digest(b"other"), FakeExtractor())
+    assert key != make_cache_key(digest, FakeExtractor(model_path="model-b"))
+    assert key != make_cache_key(digest, FakeExtractor(prompt="v2"))
+    assert key != make_cache_key(digest, OtherExtractor())
+
+
+def test_batch_reuses_cached_results_until_prompt_changes():
+    get_extraction_cache().clear()
+
+    def files():
+        return [InvoiceFile(b"12345678", name="a.pdf"), InvoiceFile(b"87654321", name="b.pdf")]
+
+    first = FakeExtractor()
+    list(iter_extract(files(), first, max_workers=2))
+    cached = FakeExtractor()
+    invoices = list(iter_extract(files(), cached, max_workers=2))
+    assert (first.calls, cached.calls) == (2, 0)
+    assert [invoice.invoice_number for invoice in invoices] == ["12345678", "87654321"]
+    assert [invoice.file_hash for invoice in invoices] == [file_digest(b"12345678"), file_digest(b"87654321")]
+    changed = FakeExtractor(prompt="v2")
+    list(iter_extract(files(), changed, max_workers=2))
+    assert changed.calls == 2
+
+
+def test_error_results_are_not_cached(tmp_path):
+    cache = ExtractionCache(tmp_path)
+    cache.put("a", Invoice(file_name="a.pdf", error="超时"))
+    assert cache.get("a") is None
+
+
+def test_expired_entries_miss_and_are_evicted(tmp_path):
+    cache = ExtractionCache(tmp_path, max_age_days=1 / 86400)
+    cache.put("a", Invoice(file_name="a.pdf"))
+    time.sleep(1.1)
+    assert cache.get("a") is None
+    cache.evict()
+    assert cache.stats()["entries"] == 0
+
+
+def test_size_eviction_drops_least_recently_used(tmp_path):
+    cache = ExtractionCache(tmp_path)
+    for key in "abc":
+        cache.put(key, Invoice(file_name=f"{key}.pdf"))
+        time.sleep(0.01)
+    cache.get("a")
+    size = cache._conn.execute("SELECT size FROM extraction_cache WHERE key = 'a'").fetchone()[0]
+    cache.max_bytes = 2 * size
+    cache.evict()
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
@@ -0,0 +1,51 @@
+# tests/test_cascade_extractor.py
+import threading
+
+from extractors.base_extractor import BaseExtractor
+from extractors.cascade_extractor import CascadeExtractor
+from models import Invoice
+
+CALLS = []
+CALLS_LOCK = threading.Lock()
+
+
+class FakeExtractor(BaseExtractor):
+    """只有 passes 中的发票（按文本）能通过校验"""
+
+    def __init__(self, model_path: str, passes: set):
+        super().__init__([])
+        self.model_path = model_path
+        self.passes = passes
+
+    def prompt_fingerprint(self) -> str:
+        return self.model_path
+
+    def extract(self, text: str) -> Invoice:
+        with CALLS_LOCK:
+            CALLS.append(self.model_path)
+        if text not in self.passes:
+            return Invoice(file_name="", invoice_number=text)
+        return Invoice(file_name="", invoice_number=text, issue_date="2025年06月23日", buyer="甲公司",
+                       seller="乙公司", item_name="*服务*费", amount=100.0, tax_amount=6.0, total_amount=106.0)
+
+
+def test_batch_runs_level_by_level():
+    CALLS.clear()
+    texts = [str(i) for i in range(12)]
+    cascade = CascadeExtractor([FakeExtractor("small", set(texts[:6])), FakeExtractor("large", set(texts))],
+                               chunk_size=3)
+    results = cascade.extract_pack(texts)
+    assert [r.invoice_number for r in results] == texts
+    assert not any(r.error for r in results)
+    # 第一级处理完整组之后，第二级才开始处理未通过的子集
+    assert CALLS == ["small"] * 12 + ["large"] * 6
+    stats = cascade.model_stats()
+    assert [m["resolved"] for m in stats["models"]] == [6, 6]
+    assert stats["unresolved"] == 0
+
+
+def test_unresolved_invoice_keeps_best_result():
+    cascade = CascadeExtractor([FakeExtractor("small", set()), FakeExtractor("large", set())])
+    invoice = cascade.extract("1")
+    assert invoice.invoice_number == "1"
+    assert cascade.model_stats()["unresolved"] == 1
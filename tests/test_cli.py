@@ -0,0 +1,20 @@
+# tests/test_cli.py
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def test_cli_import_does_not_load_streamlit():
+    """命令行入口只加载非UI模块"""
+    code = "import sys, fapiao.cli; print(any(name.split('.')[0] == 'streamlit' for name in sys.modules))"
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    assert result.stdout.strip().splitlines()[-1] == "False"
+
+
+def test_ui_helpers_still_importable_from_utils():
+    import utils
+    from utils import display_utils
+
+    assert utils.show_results is display_utils.show_results
@@ -0,0 +1,38 @@
+# tests/test_context_utils.py
+import threading
+
+from models import Invoice
+from utils.context_utils import build_chat_context, get_invoice_index
+
+
+def _batch(seller: str, count: int):
+    return [Invoice(file_name=f"{seller}{i}.pdf", invoice_number=f"{i:020d}", issue_date="2025年06月01日",
+                    buyer="北京星石娱动国际传媒有限公司", seller=seller, item_name="*服务*费",
+                    amount=100.0, tax_amount=6.0, total_amount=106.0) for i in range(count)]
+
+
+def test_index_is_cached_per_batch():
+    first, second = _batch("甲方科技有限公司", 3), _batch("乙方科技有限公司", 5)
+    index = get_invoice_index(first)
+    assert get_invoice_index(second) is not index
+    assert get_invoice_index(first) is index
+    assert len(get_invoice_index(second)) == 5
+
+
+def test_concurrent_sessions_get_their_own_context():
+    """两个会话同时提问，上下文中只出现各自批次的发票"""
+    batches = [_batch("甲方科技有限公司", 50), _batch("乙方科技有限公司", 50)]
+    leaked = []
+
+    def ask(mine: int) -> None:
+        for _ in range(50):
+            context = build_chat_context("销方是谁", batches[mine])
+            if ("乙方" if mine == 0 else "甲方") in context.text:
+                leaked.append(mine)
+
+    threads = [threading.Thread(target=ask, args=(k,)) for k in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not leaked
@@ -0,0 +1,77 @@
+# tests/test_duplicate_utils.py
+import threading
+
+import pytest
+
+from models import Invoice
+from utils.duplicate_utils import DuplicateIndex
+
+
+def _invoices(count: int):
+    return [
+        Invoice(file_name=f"{i}.pdf", invoice_number=f"{i:020d}", issue_date="2025年06月23日",
+                seller=f"销方{i}有限公司", total_amount=100.0 + i)
+        for i in range(count)
+    ]
+
+
+def test_concurrent_indexes_detect_each_others_invoices(tmp_path):
+    """两个独立连接（相当于两个工作进程）同时登记同一批发票，后登记的一方必须全部识别为重复"""
+    indexes = [DuplicateIndex(tmp_path) for _ in range(2)]
+    barrier = threading.Barrier(2)
+    results = [None, None]
+
+    def run(k: int) -> None:
+        barrier.wait()
+        for start in range(0, 200, 20):
+            results[k] = (results[k] or 0) + indexes[k].check_and_record(_invoices(200)[start:start + 20])
+
+    threads = [threading.Thread(target=run, args=(k,)) for k in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sum(results) == 200
+    assert indexes[0].stats()["entries"] == 200
+
+
+def _hashed(invoices, file_hash: str = "abc"):
+    for invoice in invoices:
+        invoice.file_hash = file_hash
+    return invoices
+
+
+def test_rerun_of_same_file_is_not_a_duplicate(tmp_path):
+    index = DuplicateIndex(tmp_path)
+    assert index.check_and_record(_hashed(_invoices(5))) == 0
+    rerun = _hashed(_invoices(5))
+    assert index.check_and_record(rerun) == 0
+    assert all(invoice.duplicate_of is None for invoice in rerun)
+    assert index.stats()["entries"] == 5
+
+
+def test_same_number_from_another_file_is_a_duplicate(tmp_path):
+    index = DuplicateIndex(tmp_path)
+    index.check_and_record(_hashed(_invoices(3)))
+    renamed = _hashed(_invoices(3))
+    for invoice in renamed:
+        invoice.file_name = "copy-" + invoice.file_name
+    assert index.check_and_record(renamed) == 3
+    assert index.check_and_record(_hashed(_invoices(3), "other")) == 3
+
+
+def test_identical_copies_in_one_batch_are_duplicates(tmp_path):
+    index = DuplicateIndex(tmp_path)
+    assert index.check_and_record(_hashed(_invoices(2) + _invoices(2))) == 2
+
+
+def test_failed_callback_rolls_back_registration(tmp_path):
+    index = DuplicateIndex(tmp_path)
+
+    def fail():
+        raise RuntimeError("store unavailable")
+
+    with pytest.raises(RuntimeError):
+        index.check_and_record(_invoices(4), on_marked=fail)
+    assert index.stats()["entries"] == 0
+    assert index.check_and_record(_invoices(4)) == 0
@@ -0,0 +1,70 @@
+# tests/test_export_utils.py
+import io
+
+import pandas as pd
+import pytest
+
+from models import Invoice
+from utils.export_utils import EXPORT_COLUMNS, EXPORT_FORMATS, export_invoices, invoice_to_row, open_invoice_writer
+
+
+def _invoices():
+    return [
+        Invoice(file_name="a.pdf", invoice_number="25112000000012345678", issue_date="2025年06月23日",
+                buyer="甲有限公司", seller="乙有限公司", item_name="*服务*费", amount=100.0, tax_amount=6.0,
+                total_amount=106.0, flags={"tax_amount": "税额与税率不符"}),
+        Invoice(file_name="b.pdf", issue_date="2025年13月01日", amount=0.1, tax_amount=0.2, total_amount=0.3,
+                duplicate_of="a.pdf"),
+        Invoice(file_name="c.pdf", error="提取失败"),
+        Invoice(file_name="d.pdf", invoice_number="25112000000087654321", issue_date="2025-01-02", seller="乙有限公司",
+                amount=-30.99, tax_amount=-0.93, total_amount=-31.92),
+        Invoice(file_name="e.pdf", buyer="丙有限公司"),
+    ]
+
+
+def _read(spool, fmt: str) -> pd.DataFrame:
+    data = io.BytesIO(spool.read())
+    if fmt == "jsonl":
+        return pd.read_json(data, lines=True, dtype=False)
+    if fmt == "csv":
+        return pd.read_csv(data, encoding="utf-8-sig", dtype={"发票号码": str})
+    if fmt == "xlsx":
+        return pd.read_excel(data, dtype={"发票号码": str})
+    return pd.read_parquet(data)
+
+
+@pytest.mark.parametrize("fmt", EXPORT_FORMATS)
+def test_chunked_export_matches_rows(fmt):
+    invoices = _invoices()
+    with export_invoices(iter(invoices), fmt, chunk_size=2) as spool:
+        frame = _read(spool, fmt)
+    expected = pd.DataFrame([invoice_to_row(invoice) for invoice in invoices])
+    assert list(frame.columns) == list(EXPORT_COLUMNS.values())
+    assert frame["文件名称"].tolist() == [invoice.file_name for invoice in invoices]
+    assert frame["开票日期"].fillna("").tolist() == ["2025-06-23", "2025年13月01日", "", "2025-01-02", ""]
+    assert frame["发票号码"].fillna("").tolist() == expected["发票号码"].fillna("").tolist()
+    pd.testing.assert_series_equal(frame["价税合计"].astype(float), expected["价税合计"].astype(float))
+    assert frame["错误信息"].fillna("").tolist() == ["", "", "提取失败", "", ""]
+    assert frame["校验提示"].fillna("").tolist() == ["税额与税率不符", "", "", "", ""]
+    assert frame["重复提示"].fillna("").tolist() == ["", "a.pdf", "", "", ""]
+
+
+@pytest.mark.parametrize("fmt", EXPORT_FORMATS)
+def test_export_without_error_column(fmt):
+    with export_invoices(_invoices(), fmt, include_error=False) as spool:
+        frame = _read(spool, fmt)
+    assert "错误信息" not in frame.columns and len(frame) == 5
+
+
+def test_row_and_batch_writes_produce_same_file(tmp_path):
+    invoices = _invoices()
+    with open_invoice_writer(tmp_path / "rows.csv") as writer:
+        for invoice in invoices:
+            writer.write(invoice)
+    with export_invoices(invoices, "csv", chunk_size=3) as spool:
+        assert spool.read() == (tmp_path / "rows.csv").read_bytes()
+
+
+def test_unknown_format_is_rejected():
+    with pytest.raises(ValueError):
+        open_invoice_writer(io.BytesIO(), "txt")
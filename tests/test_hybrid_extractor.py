@@ -0,0 +1,77 @@
+# tests/test_hybrid_extractor.py
+import re
+
+import pytest
+
+from benchmarks.corpus import generate_corpus
+from config import COMPANY_SUFFIXES
+from extractors.hybrid_extractor import HybridExtractor
+from models import Invoice
+
+
+class FakeLLM:
+    """返回固定结果的大模型提取器，记录调用次数"""
+    suffixes = COMPANY_SUFFIXES
+    model_path = "fake-llm"
+
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.calls = 0
+
+    def prompt_fingerprint(self) -> str:
+        return "v1"
+
+    def extract(self, text: str) -> Invoice:
+        self.calls += 1
+        if self.fail:
+            raise TimeoutError("请求超时")
+        return Invoice(file_name="", invoice_number="LLM", issue_date="2025年01月01日", buyer="大模型购方有限公司",
+                       seller="大模型销方有限公司", item_name="*大模型*", amount=1.0, tax_amount=0.06,
+                       total_amount=1.06, tax_rates=[0.06])
+
+
+@pytest.fixture
+def text():
+    return generate_corpus(1)[0].text
+
+
+def _without_date(text: str) -> str:
+    return re.sub(r"开票日期：\S+\n", "", text)
+
+
+def test_valid_regex_result_skips_llm(text):
+    llm = FakeLLM()
+    hybrid = HybridExtractor(llm)
+    invoice = hybrid.extract(text)
+    assert llm.calls == 0 and invoice.error is None
+    assert hybrid.stats()["regex_only"] == 1 and hybrid.stats()["model_avoided_ratio"] == 1.0
+
+
+def test_only_failed_fields_are_replaced(text):
+    llm = FakeLLM()
+    hybrid = HybridExtractor(llm)
+    regex_only = hybrid.extract(text)
+    invoice = hybrid.extract(_without_date(text))
+    assert llm.calls == 1
+    assert invoice.issue_date == "2025年01月01日"
+    assert (invoice.invoice_number, invoice.buyer, invoice.amount) == \
+        (regex_only.invoice_number, regex_only.buyer, regex_only.amount)
+    stats = hybrid.stats()
+    assert (stats["total"], stats["escalated"], stats["fields"]) == (2, 1, {"issue_date": 1})
+
+
+def test_inconsistent_amounts_replace_all_amount_fields(text):
+    hybrid = HybridExtractor(FakeLLM())
+    seller = hybrid.extract(text).seller
+    total = text.split("（小写）¥")[1].split()[0]
+    invoice = hybrid.extract(text.replace(f"（小写）¥{total}", f"（小写）¥{float(total) + 10:.2f}"))
+    assert (invoice.amount, invoice.tax_amount, invoice.total_amount) == (1.0, 0.06, 1.06)
+    assert invoice.seller == seller
+    assert set(hybrid.stats()["fields"]) == {"amount", "tax_amount", "total_amount"}
+
+
+def test_llm_failure_keeps_regex_fields_with_error(text):
+    hybrid = HybridExtractor(FakeLLM(fail=True))
+    invoice = hybrid.extract(_without_date(text))
+    assert invoice.invoice_number and invoice.issue_date is None
+    assert "issue_date" in invoice.error and "请求超时" in invoice.error
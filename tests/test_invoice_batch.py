@@ -0,0 +1,58 @@
+# tests/test_invoice_batch.py
+from dataclasses import asdict, fields
+from datetime import date
+
+import numpy as np
+
+from models import Invoice, InvoiceBatch
+from models.invoice_batch import MISSING_CENTS
+
+
+def _full_invoice(i: int) -> Invoice:
+    """每个字段都有值的发票（新增字段未在 InvoiceBatch 中保留时此处会发现）"""
+    invoice = Invoice(
+        file_name=f"{i}.pdf", invoice_number=f"{i:020d}", issue_date=date(2025, 6, i + 1),
+        buyer="北京星石娱动国际传媒有限公司", seller=f"销方{i}有限公司", item_name="*运输服务*客运服务费",
+        amount=98.77, tax_amount=2.96, total_amount=101.73, total_in_words="壹佰零壹圆柒角叁分",
+        tax_rates=[0.03, 0.06], raw_text="原文", error="错误", flags={"tax_amount": "税额与税率不符"},
+        duplicate_of="0.pdf", file_hash=f"{i:064x}",
+    )
+    unset = [f.name for f in fields(Invoice) if getattr(invoice, f.name) in (None, f.default)]
+    assert not unset, f"测试发票缺少字段: {unset}"
+    return invoice
+
+
+def test_round_trip_keeps_every_field():
+    invoices = [_full_invoice(1), Invoice(file_name="empty.pdf")]
+    batch = InvoiceBatch.from_invoices(invoices)
+    expected = [asdict(invoice) for invoice in invoices]
+    assert [asdict(invoice) for invoice in batch] == expected
+    assert [asdict(batch[i]) for i in range(len(batch))] == expected
+    assert [asdict(invoice) for invoice in InvoiceBatch.concat([batch.take([1]), batch.take([0])])] == expected[::-1]
+
+
+def test_unparsed_date_and_raw_text_option():
+    invoice = Invoice(file_name="a.pdf", issue_date="2025年13月01日", raw_text="原文", file_hash="abc")
+    restored = InvoiceBatch.from_invoices([invoice], keep_raw_text=False)[0]
+    assert (restored.issue_date, restored.raw_text, restored.file_hash) == ("2025年13月01日", None, "abc")
+
+
+def test_generator_input_and_boolean_take():
+    invoices = [_full_invoice(i) for i in range(1, 4)] + [Invoice(file_name="empty.pdf")]
+    batch = InvoiceBatch.from_invoices(iter(invoices))
+    assert [asdict(invoice) for invoice in batch] == [asdict(invoice) for invoice in invoices]
+    subset = batch.take(np.array([False, True, False, True]))
+    assert [invoice.file_name for invoice in subset] == ["2.pdf", "empty.pdf"]
+    assert subset.tax_rates == {0: [0.03, 0.06]} and list(subset.errors) == [0]
+
+
+def test_amounts_are_exact_cents_and_frame_columns():
+    invoices = [Invoice(file_name="a.pdf", amount=0.1, tax_amount=0.2, total_amount=0.3),
+                Invoice(file_name="b.pdf", seller="乙有限公司", flags={"a": "甲", "b": "乙"})]
+    batch = InvoiceBatch.from_invoices(invoices)
+    assert batch.amount[0] + batch.tax_amount[0] == batch.total_amount[0] == 30
+    assert batch.amount[1] == MISSING_CENTS
+    frame = batch.to_frame()
+    assert np.isnan(frame["amount"][1]) and frame["total_amount"][0] == 0.3
+    assert frame["seller"].dtype == "category" and frame["seller"][1] == "乙有限公司"
+    assert frame["flags"].isna().tolist() == [True, False] and frame["flags"][1] == "甲；乙"
@@ -0,0 +1,115 @@
+# tests/test_job_utils.py
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from benchmarks.corpus import write_corpus
+from models import Invoice
+from utils import job_utils
+from utils.job_utils import MAX_ATTEMPTS, JobQueue, run_job
+from utils.store_utils import InvoiceStore
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = InvoiceStore(tmp_path)
+    monkeypatch.setattr(job_utils, "get_invoice_store", lambda: store)
+    return store
+
+
+@pytest.fixture
+def queue(tmp_path, store, monkeypatch):
+    """任务表、上传目录与结果库都放在临时目录（不启动工作进程池，任务在本进程内执行）"""
+    monkeypatch.setattr(job_utils, "_worker_queues", {})
+    return JobQueue(tmp_path)
+
+
+@pytest.fixture
+def submitted(monkeypatch):
+    """记录提交给工作进程池的任务，不创建进程"""
+    jobs = []
+    monkeypatch.setattr(JobQueue, "_restart_executor", lambda self, broken: None)
+    monkeypatch.setattr(JobQueue, "_submit", lambda self, job_id: jobs.append(job_id))
+    return jobs
+
+
+def _crashed(error=BrokenProcessPool("工作进程被杀死")) -> Future:
+    future = Future()
+    future.set_exception(error)
+    return future
+
+
+@pytest.fixture
+def pdfs(tmp_path):
+    return write_corpus(tmp_path / "corpus", 3)
+
+
+def test_missing_uploads_fail_the_job(queue, pdfs):
+    job = queue.enqueue(pdfs, "regex")
+    for path in (queue.upload_dir / str(job.id)).glob("*/*"):
+        path.unlink()
+    run_job(job.id, str(queue.db_path.parent))
+    job = queue.get(job.id)
+    assert job.status == "failed"
+    assert "3 个未完成文件" in job.error
+
+
+def test_worker_reuses_one_queue_per_directory(queue, pdfs):
+    directory = str(queue.db_path.parent)
+    for _ in range(2):
+        job = queue.enqueue(pdfs, "regex")
+        run_job(job.id, directory)
+        assert queue.get(job.id).status == "done"
+    assert list(job_utils._worker_queues) == [directory]
+
+
+def test_restart_requeues_running_job_and_resumes(queue, store, pdfs, submitted):
+    job = queue.enqueue(pdfs, "regex")
+    assert queue.mark_running(job.id)
+    # 工作进程中止前已写入第一个文件的结果
+    store.append(job.batch_id, [(0, Invoice(file_name=pdfs[0].name, invoice_number="已完成"))])
+
+    restarted = JobQueue(queue.db_path.parent)
+    restarted.start()
+    assert submitted == [job.id]
+    assert restarted.get(job.id).status == "queued"
+
+    run_job(job.id, str(queue.db_path.parent))
+    job = queue.get(job.id)
+    assert (job.status, job.done, job.attempts) == ("done", 3, 2)
+    invoices = list(store.iter_invoices(job.batch_id))
+    assert [invoice.file_name for invoice in invoices] == [path.name for path in pdfs]
+    assert invoices[0].invoice_number == "已完成"
+    assert not (queue.upload_dir / str(job.id)).exists()
+
+
+def test_crashed_worker_resubmits_until_max_attempts(queue, pdfs, submitted):
+    job = queue.enqueue(pdfs, "regex")
+    for attempt in range(1, MAX_ATTEMPTS):
+        queue.mark_running(job.id)
+        queue._on_worker_exit(job.id, _crashed())
+        assert queue.get(job.id).status == "queued"
+        assert submitted == [job.id] * attempt
+    queue.mark_running(job.id)
+    queue._on_worker_exit(job.id, _crashed())
+    job = queue.get(job.id)
+    assert job.status == "failed" and "工作进程异常退出" in job.error
+    assert len(submitted) == MAX_ATTEMPTS - 1
+
+
+def test_finished_job_ignores_worker_exit(queue, pdfs, submitted):
+    job = queue.enqueue(pdfs, "regex")
+    run_job(job.id, str(queue.db_path.parent))
+    queue._on_worker_exit(job.id, _crashed())
+    assert queue.get(job.id).status == "done" and submitted == []
+
+
+def test_cancelled_queued_job_is_not_run(queue, store, pdfs):
+    job = queue.enqueue(pdfs, "regex")
+    queue.cancel(job.id)
+    assert not (queue.upload_dir / str(job.id)).exists()
+    run_job(job.id, str(queue.db_path.parent))
+    job = queue.get(job.id)
+    assert (job.status, job.attempts) == ("cancelled", 0)
+    assert store.positions(job.batch_id) == set()
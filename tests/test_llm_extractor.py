@@ -0,0 +1,78 @@
+# tests/test_llm_extractor.py
+import json
+import re
+
+import pytest
+
+from benchmarks.stub_server import DEFAULT_EXTRACT_ANSWER, PACK_SECTION_RE, run_stub_server
+from extractors.llm_extractor import LLMExtractor
+
+TEXTS = [f"发票号码：{i:020d}" for i in range(1, 4)]
+
+
+def _reply(indexes, numbers=(1, 2, 3)) -> str:
+    return json.dumps({"发票": [{"序号": index, "发票号码": f"{number:020d}"}
+                              for index, number in zip(indexes, numbers)]}, ensure_ascii=False)
+
+
+@pytest.fixture(scope="module")
+def extractor():
+    return LLMExtractor("test-model", api_key="test", base_url="http://127.0.0.1:9")
+
+
+def test_pack_reply_maps_by_index(extractor):
+    results = extractor._parse_pack_completion(_reply([3, 1, 2], numbers=(3, 1, 2)), TEXTS)
+    assert {i: item["发票号码"] for i, item in results.items()} == {i: f"{i + 1:020d}" for i in range(3)}
+
+
+def test_zero_based_indexes_fall_back_to_position(extractor):
+    results = extractor._parse_pack_completion(_reply([0, 1, 2]), TEXTS)
+    assert sorted(results) == [0, 1, 2]
+
+
+@pytest.mark.parametrize("indexes", [["第1张", "第2张", "第3张"], [None, None, None], ["1", "1", "2"], [1.5, 2, 3]])
+def test_unparseable_indexes_fall_back_to_position(extractor, indexes):
+    assert sorted(extractor._parse_pack_completion(_reply(indexes), TEXTS)) == [0, 1, 2]
+
+
+def test_partial_reply_keeps_indexed_items(extractor):
+    results = extractor._parse_pack_completion(_reply(["1", 3.0], numbers=(1, 3)), TEXTS)
+    assert sorted(results) == [0, 2]
+
+
+def test_partial_reply_without_usable_indexes_is_rejected(extractor):
+    with pytest.raises(ValueError):
+        extractor._parse_pack_completion(_reply([0, 1], numbers=(1, 2)), TEXTS)
+
+
+@pytest.fixture
+def stub():
+    """打包回复中第2张结果无法转换、第3张缺失；单张请求按文本中的发票号码回答，号码以3结尾的也无法转换"""
+    with run_stub_server() as server:
+        def answer(prompt):
+            text = prompt.rsplit("发票文本", 1)[-1]
+            numbers = re.findall(r"\d{20}", text)
+            if not PACK_SECTION_RE.search(text):
+                bad = numbers[0].endswith("3") and server.bad_single
+                return {**DEFAULT_EXTRACT_ANSWER, "发票号码": numbers[0], **({"开票日期": {"年": 2025}} if bad else {})}
+            return {"发票": [{**DEFAULT_EXTRACT_ANSWER, "序号": 1, "发票号码": numbers[0]},
+                             {**DEFAULT_EXTRACT_ANSWER, "序号": 2, "发票号码": numbers[1], "开票日期": {"年": 2025}}]}
+        server.stub.extract_answer = answer
+        server.bad_single = False
+        yield server
+
+
+def _stub_extractor(server) -> LLMExtractor:
+    return LLMExtractor("stub", api_key="test", base_url=f"http://127.0.0.1:{server.server_port}", pack_size=3)
+
+
+def test_pack_retries_only_failed_items_one_at_a_time(stub):
+    invoices = _stub_extractor(stub).extract_pack(TEXTS)
+    assert [invoice.invoice_number for invoice in invoices] == [f"{i:020d}" for i in range(1, 4)]
+    assert stub.stub.stats.snapshot()["requests"] == 3  # 1 次打包 + 2 次单张
+
+
+def test_failed_single_retry_does_not_fail_the_pack(stub):
+    stub.bad_single = True
+    invoices = _stub_extractor(stub).extract_pack(TEXTS)
+    assert [bool(invoice.error) for invoice in invoices] == [False, False, True]
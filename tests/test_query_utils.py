@@ -0,0 +1,109 @@
+# tests/test_query_utils.py
+from datetime import date
+
+import pytest
+
+from models import Invoice
+from utils.query_utils import answer_structured_query, invoices_frame, parse_query, run_query
+
+
+def _invoice(number: str, issue_date: str, total: float) -> Invoice:
+    return Invoice(
+        file_name=f"{number}.pdf", invoice_number=number, issue_date=issue_date,
+        buyer="北京星石娱动国际传媒有限公司", seller="苏州市吉利优行电子科技有限公司",
+        item_name="*运输服务*客运服务费", amount=total, tax_amount=0.0, total_amount=total,
+    )
+
+
+@pytest.fixture
+def frame():
+    invoices = [
+        _invoice("1", "2025年02月15日", 100),
+        _invoice("2", "2025年03月10日", 200),
+        _invoice("3", "2025年05月31日", 300),
+        _invoice("4", "2025年06月01日", 400),
+        _invoice("5", "2025年12月20日", 500),
+        _invoice("6", "2026年02月28日", 600),
+    ]
+    return invoices_frame(invoices)
+
+
+def _date_filter(question, frame):
+    spec = parse_query(question, frame)
+    return [f for f in spec.filters if f[0] == "issue_date"]
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("2025年3月到2025年5月合计", (date(2025, 3, 1), date(2025, 5, 31))),
+    ("2025年12月到2026年2月合计", (date(2025, 12, 1), date(2026, 2, 28))),
+    ("2025年12月到2月合计", (date(2025, 12, 1), date(2026, 2, 28))),
+    ("3月到5月合计", (date(2026, 3, 1), date(2026, 5, 31))),
+    ("2025-03-01到2025-05-31合计", (date(2025, 3, 1), date(2025, 5, 31))),
+])
+def test_month_and_date_ranges(question, expected, frame):
+    assert _date_filter(question, frame) == [("issue_date", "between", expected)]
+
+
+@pytest.mark.parametrize("question, expected, total", [
+    ("2025-06-01以后的发票合计", (">=", date(2025, 6, 1)), 1500),
+    ("2025-06-01之前的发票合计", ("<=", date(2025, 6, 1)), 1000),
+    ("2025年3月以后合计", (">=", date(2025, 3, 1)), 2000),
+    ("2025年5月之前合计", ("<=", date(2025, 5, 31)), 600),
+])
+def test_open_ended_bounds(question, expected, total, frame):
+    spec = parse_query(question, frame)
+    assert [f for f in spec.filters if f[0] == "issue_date"] == [("issue_date", *expected)]
+    assert run_query(spec, frame) == total
+
+
+@pytest.mark.parametrize("question", ["2025-02-30的发票合计", "3月到13月合计", "2025年13月合计"])
+def test_invalid_dates_fall_back_to_llm(question):
+    invoices = [_invoice("1", "2025年02月15日", 100)]
+    with pytest.raises(ValueError):
+        parse_query(question, invoices_frame(invoices))
+    assert answer_structured_query(question, invoices) is None
+
+
+@pytest.fixture
+def numbered():
+    return [
+        Invoice(file_name=f"fapiao_{i:03d}.pdf", invoice_number=f"{i:020d}", issue_date="2025年06月01日",
+                seller="苏州市吉利优行电子科技有限公司", item_name="*运输服务*客运服务费",
+                amount=100.0 * i, tax_amount=6.0 * i, total_amount=106.0 * i)
+        for i in range(1, 5)
+    ]
+
+
+def test_question_about_one_invoice_goes_to_llm(numbered):
+    """“价税合计”中的“合计”不是求和；点名一张发票的问题不按全批合计回答"""
+    assert answer_structured_query("发票号码00000000000000000002的价税合计是多少？", numbered) is None
+    assert answer_structured_query("fapiao_002.pdf的税额合计", numbered) is None
+
+
+def test_check_question_goes_to_llm(numbered):
+    assert answer_structured_query("请帮我检查数量是否正确", numbered) is None
+
+
+def test_named_invoices_are_filtered(numbered):
+    answer = answer_structured_query("发票00000000000000000002和00000000000000000003的价税合计一共多少", numbered)
+    assert "¥530.00" in answer.text
+    assert "发票号码为 00000000000000000002、00000000000000000003" in answer.text
+
+
+def test_unknown_invoice_number_goes_to_llm(numbered):
+    assert answer_structured_query("发票99999999999999999999的金额合计", numbered) is None
+
+
+def test_field_name_is_not_a_metric(numbered):
+    spec = parse_query("价税合计一共多少", invoices_frame(numbered))
+    assert (spec.metric, spec.column) == ("sum", "total_amount")
+    assert parse_query("价税合计是多少", invoices_frame(numbered)) is None
+
+
+def test_frame_cache_is_per_batch(numbered):
+    """两个会话的批次交替提问时各自得到自己批次的结果"""
+    other = [Invoice(file_name="x.pdf", invoice_number="1" * 20, issue_date="2025年06月01日",
+                     item_name="*服务*费", amount=1.0, tax_amount=0.0, total_amount=1.0)]
+    for _ in range(2):
+        assert "¥1,060.00" in answer_structured_query("价税合计一共多少", numbered).text
+        assert "¥1.00" in answer_structured_query("价税合计一共多少", other).text
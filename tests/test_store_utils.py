@@ -0,0 +1,31 @@
+# tests/test_store_utils.py
+from models import Invoice
+from utils.store_utils import InvoiceStore
+
+
+def test_recent_batches_are_scoped_to_owner(tmp_path):
+    store = InvoiceStore(tmp_path)
+    mine = store.add_batch([Invoice(file_name="a.pdf")], "mine", owner="alice")
+    store.add_batch([Invoice(file_name="b.pdf")], "theirs", owner="bob")
+    store.add_batch([Invoice(file_name="c.pdf")], "legacy")
+    assert [row[0] for row in store.recent_batches("alice")] == [mine]
+    assert store.batch(mine).owner == "alice"
+
+
+def test_iter_invoices_can_skip_raw_text(tmp_path):
+    store = InvoiceStore(tmp_path)
+    batch = store.batch(store.add_batch([Invoice(file_name="a.pdf", raw_text="原文")]))
+    assert next(batch.iter_invoices()).raw_text == "原文"
+    assert next(batch.iter_invoices(keep_raw_text=False)).raw_text is None
+
+
+def test_stored_invoices_keep_every_field(tmp_path):
+    invoice = Invoice(
+        file_name="a.pdf", invoice_number="0" * 20, issue_date="2025-06-23", buyer="甲", seller="乙",
+        item_name="*服务*费", amount=100.0, tax_amount=6.0, total_amount=106.0, total_in_words="壹佰零陆圆整",
+        tax_rates=[0.06], raw_text="原文", error="错误", flags={"tax_amount": "税额与税率不符"},
+        duplicate_of="b.pdf", file_hash="abc",
+    )
+    store = InvoiceStore(tmp_path)
+    assert list(store.batch(store.add_batch([invoice])).iter_invoices()) == [invoice]
+    assert InvoiceStore(tmp_path).batch(1).to_batch()[0].file_hash == "abc"
@@ -0,0 +1,58 @@
+# tests/test_validation_utils.py
+from models import Invoice, InvoiceBatch
+from utils.validation_utils import flag_batch, validate_invoices
+
+
+def _invoice(amount: float, tax: float, tax_rates=None) -> Invoice:
+    return Invoice(file_name="a.pdf", invoice_number="0" * 20, issue_date="2025年06月23日",
+                   amount=amount, tax_amount=tax, total_amount=round(amount + tax, 2), tax_rates=tax_rates)
+
+
+def _tax_flagged(invoice: Invoice) -> bool:
+    validate_invoices([invoice])
+    return bool(invoice.flags and "tax_amount" in invoice.flags)
+
+
+def test_mixed_rate_invoice_is_not_flagged():
+    """13% 与 6% 两行（1000.00 + 500.00）：税额 160.00 不等于任一单一税率，但在两税率之间"""
+    assert not _tax_flagged(_invoice(1500.00, 160.00, [0.13, 0.06]))
+    assert _tax_flagged(_invoice(1500.00, 200.00, [0.13, 0.06]))
+
+
+def test_single_rate_invoice_is_checked_against_its_rate():
+    assert not _tax_flagged(_invoice(1000.00, 60.00, [0.06]))
+    # 符合另一个标准税率（3%）但与发票税率不符
+    assert _tax_flagged(_invoice(1000.00, 30.00, [0.06]))
+
+
+def test_legacy_rates_without_extracted_rate():
+    for rate in (0.015, 0.10, 0.16, 0.17):
+        assert not _tax_flagged(_invoice(1000.00, 1000 * rate))
+    assert _tax_flagged(_invoice(1000.00, 111.00))
+
+
+def test_tolerance_grows_with_line_count():
+    """60行 6% 明细逐行四舍五入，累计误差可超过10分"""
+    assert not _tax_flagged(_invoice(1000.00, 60.25, [0.06] * 60))
+    assert _tax_flagged(_invoice(1000.00, 60.25, [0.06] * 10))
+
+
+def test_red_invoice_compares_absolute_values():
+    assert not _tax_flagged(_invoice(-30.99, -0.93, [0.03]))
+
+
+def test_flag_batch_updates_batch_flags():
+    batch = InvoiceBatch.from_invoices([_invoice(1000.00, 60.00, [0.06]), _invoice(1000.00, 30.00, [0.06])])
+    counts = flag_batch(batch)
+    assert counts["tax_amount"] == 1
+    assert list(batch.flags) == [1] and "tax_amount" in batch.flags[1]
+
+
+def test_validate_invoices_clears_stale_flags_and_reuses_batch():
+    invoices = [_invoice(1000.00, 60.00, [0.06]), _invoice(1000.00, 30.00, [0.06])]
+    invoices[0].flags = {"tax_amount": "旧提示"}
+    batch = InvoiceBatch.from_invoices(invoices, keep_raw_text=False)
+    validate_invoices(invoices, batch=batch)
+    assert invoices[0].flags is None
+    assert set(invoices[1].flags) == {"tax_amount"}
+    assert batch.flags == {1: invoices[1].flags}
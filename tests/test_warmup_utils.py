@@ -0,0 +1,36 @@
+# tests/test_warmup_utils.py
+import time
+
+from utils.warmup_utils import MAX_RETRY_SECONDS, ModelStatus, ModelWarmer
+
+
+def test_failed_warmup_waits_before_retrying(monkeypatch):
+    warmer = ModelWarmer(base_url="http://127.0.0.1:9")
+    calls = []
+
+    def fail(model):
+        calls.append(model)
+        status = warmer._status[model]
+        status.failures += 1
+        status.failed_at = time.time()
+        status.state = "failed"
+
+    monkeypatch.setattr(warmer, "_load", fail)
+    monkeypatch.setattr("threading.Thread.start", lambda thread: thread.run())
+    for _ in range(5):
+        status = warmer.warm("m")
+    assert calls == ["m"]
+    assert status.retry_at > time.time()
+
+    status.failed_at -= MAX_RETRY_SECONDS
+    assert warmer.warm("m").failures == 2
+    assert len(calls) == 2
+
+
+def test_retry_interval_doubles_up_to_limit():
+    status = ModelStatus("m", "failed", 0.0, failures=1, failed_at=0.0)
+    first = status.retry_at
+    status.failures = 2
+    assert status.retry_at == 2 * first
+    status.failures = 50
+    assert status.retry_at == MAX_RETRY_SECONDS
@@ -1,4 +1,24 @@
 # utils/__init__.py
+from importlib import import_module
+
 from .file_utils import *
-from .display_utils import *
-from .llm_utils import *
\ No newline at end of file
+from .context_utils import *
+from .query_utils import *
+from .validation_utils import *
+from .duplicate_utils import *
+from .store_utils import *
+from .llm_utils import *
+from .cache_utils import *
+from .batch_utils import *
+from .job_utils import *
+
+# 依赖streamlit的界面模块按需加载，命令行等非UI入口导入 utils 时不加载streamlit
+_UI_MODULES = ("display_utils",)
+
+
+def __getattr__(name: str):
+    for module_name in _UI_MODULES:
+        module = import_module(f".{module_name}", __name__)
+        if hasattr(module, name):
+            return getattr(module, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
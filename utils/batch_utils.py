@@ -0,0 +1,407 @@
+# utils/batch_utils.py
+import asyncio
+import os
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from itertools import islice
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from models import Invoice, InvoiceFile
+from config import BATCH_CONFIG, logger
+from extractors.async_extractor import bounded_as_completed
+from .file_utils import extract_text_from_file
+from .cache_utils import ExtractionCache, file_digest, get_extraction_cache, make_cache_key
+from .validation_utils import validate_invoices
+from .duplicate_utils import mark_duplicates
+from .store_utils import InvoiceStore
+
+
+def prepare_input(file, extractor) -> Any:
+    """
+    预处理阶段（CPU密集）：按提取器所需的输入类型准备数据
+
+    Args:
+        file: 上传的文件对象（带 name/type 的类文件对象）
+        extractor: 提取器实例
+
+    Returns:
+        文本提取器返回PDF/OCR文本，文件型提取器（VLM）返回其 prepare() 结果
+    """
+    file.seek(0)
+    if getattr(extractor, "input_kind", "text") == "file":
+        return extractor.prepare(file)
+    return extract_text_from_file(file)
+
+
+def _prepare_cached(
+    file,
+    extractor,
+    cache: Optional[ExtractionCache]
+    ) -> Tuple[str, Optional[str], Optional[Invoice], Any]:
+    """计算文件内容哈希（缓存键与查重共用），预处理前先查缓存，命中时跳过PDF解析与模型调用"""
+    file = InvoiceFile.coerce(file)
+    file.seek(0)
+    digest = file_digest(file.read())
+    key = None
+    if cache is not None and getattr(extractor, "model_path", None):
+        key = make_cache_key(digest, extractor)
+        cached = cache.get(key)
+        if cached is not None:
+            cached.file_hash = digest
+            return digest, key, cached, None
+    return digest, key, None, prepare_input(file, extractor)
+
+
+def _finish(invoice: Invoice, file_name: str, digest: str, payload: Any, key: Optional[str],
+            cache: Optional[ExtractionCache]) -> Invoice:
+    """补全文件名、内容哈希与原文摘要（文本类提取器），写入缓存"""
+    if isinstance(payload, str):
+        invoice.raw_text = payload[:500] + "..." if len(payload) > 500 else payload
+    invoice.file_name = file_name
+    invoice.file_hash = digest
+    if key is not None:
+        cache.put(key, invoice)
+    return invoice
+
+
+def _extract_one(extractor, file, prepared: Future, cache: Optional[ExtractionCache]) -> Invoice:
+    """模型调用阶段（I/O密集）：单个文件出错时返回带error的Invoice，不影响其他文件"""
+    file_name = _file_name(file)
+    try:
+        digest, key, cached, payload = prepared.result()
+        if cached is not None:
+            cached.file_name = file_name
+            return cached
+        if getattr(extractor, "input_kind", "text") == "file":
+            invoice = extractor.extract_prepared(file_name, payload)
+        else:
+            invoice = extractor.extract(payload)
+        return _finish(invoice, file_name, digest, payload, key, cache)
+    except Exception as e:
+        logger.error(f"处理文件 {file_name} 失败: {str(e)}")
+        return Invoice(file_name=file_name, error=str(e))
+
+
+def _file_name(file) -> str:
+    """文件显示名称（路径取文件名部分）"""
+    if isinstance(file, (str, os.PathLike)):
+        return Path(file).name
+    return getattr(file, "name", "未知文件")
+
+
+def iter_extract(
+    files: Iterable,
+    extractor,
+    max_workers: Optional[int] = None,
+    parse_workers: Optional[int] = None,
+    use_cache: bool = True
+    ) -> Iterator[Invoice]:
+    """
+    并发批量提取，按输入顺序逐个产出结果
+
+    PDF解析/转图片在解析线程池中执行，模型调用在调用线程池中执行，
+    二者流水线重叠；同时在途的文件数有上限，输入可以是惰性迭代器。
+
+    Args:
+        files: 文件对象或文件路径（可迭代，路径在预处理线程中才读取）
+        extractor: 提取器实例
+        max_workers: 模型调用并发数，默认取 batch_config.max_workers
+        parse_workers: 预处理并发数，默认取 batch_config.parse_workers
+        use_cache: 是否使用持久化结果缓存（仅对模型类提取器生效）
+
+    Yields:
+        Invoice: 与输入顺序一致的提取结果
+    """
+    max_workers = max_workers or BATCH_CONFIG.get("max_workers", 4)
+    parse_workers = parse_workers or BATCH_CONFIG.get("parse_workers", 2)
+    window = 2 * (max_workers + parse_workers)
+    cache = get_extraction_cache() if use_cache else None
+    if getattr(extractor, "pack_size", 1) > 1:
+        yield from _iter_extract_packed(files, extractor, max_workers, parse_workers, cache)
+        return
+
+    parse_pool = ThreadPoolExecutor(parse_workers, thread_name_prefix="fapiao-parse")
+    model_pool = ThreadPoolExecutor(max_workers, thread_name_prefix="fapiao-model")
+    pending = deque()
+    try:
+        for file in files:
+            prepared = parse_pool.submit(_prepare_cached, file, extractor, cache)
+            pending.append(model_pool.submit(_extract_one, extractor, file, prepared, cache))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        # 提前中止（异常或生成器关闭）时不再调度剩余任务
+        parse_pool.shutdown(wait=False, cancel_futures=True)
+        model_pool.shutdown(wait=False, cancel_futures=True)
+
+
+def iter_extract_unordered(
+    files: Iterable,
+    extractor,
+    max_workers: Optional[int] = None,
+    parse_workers: Optional[int] = None,
+    use_cache: bool = True
+    ) -> Iterator[Tuple[int, Invoice]]:
+    """
+    并发批量提取，按完成顺序产出 (输入序号, 结果)
+
+    与 iter_extract 相同的两级流水线与在途上限，但慢文件不会阻塞其后已完成的文件；
+    生成器关闭时不再调度剩余文件（已在执行的模型调用会运行完，结果丢弃）。
+    打包模式下按组完成顺序产出。
+
+    Args:
+        files: 文件对象或文件路径
+        extractor: 提取器实例
+        max_workers: 模型调用并发数，默认取 batch_config.max_workers
+        parse_workers: 预处理并发数，默认取 batch_config.parse_workers
+        use_cache: 是否使用持久化结果缓存（仅对模型类提取器生效）
+
+    Yields:
+        Tuple[int, Invoice]: 输入序号与提取结果
+    """
+    max_workers = max_workers or BATCH_CONFIG.get("max_workers", 4)
+    parse_workers = parse_workers or BATCH_CONFIG.get("parse_workers", 2)
+    window = 2 * (max_workers + parse_workers)
+    cache = get_extraction_cache() if use_cache else None
+    if getattr(extractor, "pack_size", 1) > 1:
+        yield from enumerate(_iter_extract_packed(files, extractor, max_workers, parse_workers, cache))
+        return
+
+    parse_pool = ThreadPoolExecutor(parse_workers, thread_name_prefix="fapiao-parse")
+    model_pool = ThreadPoolExecutor(max_workers, thread_name_prefix="fapiao-model")
+    pending: Dict[Future, int] = {}
+
+    def completed() -> Iterator[Tuple[int, Invoice]]:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            yield pending.pop(future), future.result()
+
+    try:
+        for position, file in enumerate(files):
+            prepared = parse_pool.submit(_prepare_cached, file, extractor, cache)
+            pending[model_pool.submit(_extract_one, extractor, file, prepared, cache)] = position
+            if len(pending) >= window:
+                yield from completed()
+        while pending:
+            yield from completed()
+    finally:
+        parse_pool.shutdown(wait=False, cancel_futures=True)
+        model_pool.shutdown(wait=False, cancel_futures=True)
+
+
+@dataclass
+class BatchProgress:
+    """批量提取进度（张数、吞吐量与剩余时间估计）"""
+    total: int
+    done: int = 0
+    errors: int = 0
+    started: float = field(default_factory=time.monotonic)
+
+    def add(self, invoice: Invoice) -> None:
+        self.done += 1
+        if invoice.error:
+            self.errors += 1
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    @property
+    def rate(self) -> float:
+        """吞吐量（张/秒）"""
+        return self.done / max(self.elapsed, 1e-9)
+
+    @property
+    def eta(self) -> float:
+        """按当前吞吐量估计的剩余秒数"""
+        return (self.total - self.done) / self.rate if self.done else 0.0
+
+    def describe(self) -> str:
+        return (f"{self.done}/{self.total} · {self.rate:.2f} 张/秒 · 剩余约 {self.eta:.0f} 秒"
+                + (f" · 失败 {self.errors}" if self.errors else ""))
+
+
+def extract_into_store(
+    files: List,
+    extractor,
+    store: InvoiceStore,
+    batch_id: int,
+    max_workers: Optional[int] = None,
+    parse_workers: Optional[int] = None,
+    use_cache: bool = True,
+    flush_size: int = 20,
+    flush_interval: float = 1.0,
+    positions: Optional[List[int]] = None
+    ) -> Iterator[Tuple[BatchProgress, bool]]:
+    """
+    边提取边写入结果库（界面增量显示使用）
+
+    结果按完成顺序收集，每 flush_size 张或每 flush_interval 秒做一次校验与查重，
+    连同上传顺序序号追加到批次中。生成器提前关闭（取消、页面重新运行）时，
+    已完成但未写入的结果也会写入，不再调度剩余文件。
+
+    Args:
+        files: 文件对象或路径列表
+        extractor: 提取器实例
+        store: InvoiceStore 结果库
+        batch_id: store.create_batch() 创建的批次
+        max_workers: 模型调用并发数
+        parse_workers: 预处理并发数
+        use_cache: 是否使用持久化结果缓存
+        flush_size: 每组写入的张数上限
+        flush_interval: 两次写入的最长间隔（秒）
+        positions: 各文件在批次中的上传顺序序号，默认为列表下标（续跑部分文件时使用）
+
+    Yields:
+        Tuple[BatchProgress, bool]: 每完成一张产出一次进度，以及本次是否有新结果写入结果库
+    """
+    progress = BatchProgress(total=len(files))
+    buffer: List[Tuple[int, Invoice]] = []
+    last_flush = time.monotonic()
+
+    def flush() -> None:
+        invoices = [invoice for _, invoice in buffer]
+        validate_invoices(invoices)
+        # 写入结果库与查重登记同时提交，工作进程在两者之间中止时续跑不会把这些文件标记为重复
+        mark_duplicates(invoices, lambda: store.append(batch_id, buffer))
+        buffer.clear()
+
+    try:
+        for position, invoice in iter_extract_unordered(files, extractor, max_workers, parse_workers, use_cache):
+            buffer.append((positions[position] if positions is not None else position, invoice))
+            progress.add(invoice)
+            flushed = len(buffer) >= flush_size or time.monotonic() - last_flush >= flush_interval \
+                or progress.done == progress.total
+            if flushed:
+                flush()
+                last_flush = time.monotonic()
+            yield progress, flushed
+    finally:
+        if buffer:
+            flush()
+
+
+def _extract_packed_chunk(extractor, chunk: List[Tuple[Any, Future]], model_pool: ThreadPoolExecutor,
+                          cache: Optional[ExtractionCache]) -> List[Invoice]:
+    """一组已提交预处理的文件：缓存命中的直接返回，其余按 plan_packs 打包并发提取"""
+    results: List[Optional[Invoice]] = [None] * len(chunk)
+    todo = []  # (序号, 文件名, 内容哈希, 缓存键, 文本)
+    for i, (file, prepared) in enumerate(chunk):
+        file_name = _file_name(file)
+        try:
+            digest, key, cached, payload = prepared.result()
+        except Exception as e:
+            logger.error(f"处理文件 {file_name} 失败: {str(e)}")
+            results[i] = Invoice(file_name=file_name, error=str(e))
+            continue
+        if cached is not None:
+            cached.file_name = file_name
+            results[i] = cached
+        else:
+            todo.append((i, file_name, digest, key, payload))
+
+    packs = [[todo[j] for j in pack] for pack in extractor.plan_packs([item[4] for item in todo])]
+    futures = [model_pool.submit(extractor.extract_pack, [item[4] for item in pack]) for pack in packs]
+    for pack, future in zip(packs, futures):
+        try:
+            invoices = future.result()
+        except Exception as e:
+            logger.error(f"打包提取 {len(pack)} 个文件失败: {str(e)}")
+            invoices = [Invoice(file_name="", error=str(e)) for _ in pack]
+        if len(invoices) < len(pack):
+            logger.error(f"打包提取 {len(pack)} 个文件只返回 {len(invoices)} 个结果")
+            invoices = list(invoices) + [Invoice(file_name="", error="提取结果缺失")
+                                         for _ in range(len(pack) - len(invoices))]
+        for (i, file_name, digest, key, payload), invoice in zip(pack, invoices):
+            results[i] = _finish(invoice, file_name, digest, payload, key, cache)
+    return results
+
+
+def _iter_extract_packed(files: Iterable, extractor, max_workers: int, parse_workers: int,
+                         cache: Optional[ExtractionCache]) -> Iterator[Invoice]:
+    """
+    打包模式的 iter_extract（LLMExtractor.pack_size > 1，或逐级处理的 CascadeExtractor）
+
+    输入按 pack_size × max_workers 个文件分组：当前组交给模型时下一组已开始预处理，
+    组内未命中缓存的发票按 plan_packs 分包（LLM按上下文长度打包，每包一个请求；级联整组逐级处理）。
+    """
+    chunk_size = extractor.pack_size * max_workers
+    files = iter(files)
+    parse_pool = ThreadPoolExecutor(parse_workers, thread_name_prefix="fapiao-parse")
+    model_pool = ThreadPoolExecutor(max_workers, thread_name_prefix="fapiao-model")
+
+    def submit_chunk() -> List[Tuple[Any, Future]]:
+        return [(file, parse_pool.submit(_prepare_cached, file, extractor, cache))
+                for file in islice(files, chunk_size)]
+
+    try:
+        chunk = submit_chunk()
+        while chunk:
+            upcoming = submit_chunk()
+            yield from _extract_packed_chunk(extractor, chunk, model_pool, cache)
+            chunk = upcoming
+    finally:
+        parse_pool.shutdown(wait=False, cancel_futures=True)
+        model_pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def aiter_extract(
+    files: Iterable,
+    extractor,
+    concurrency: Optional[int] = None,
+    use_cache: bool = True
+    ) -> AsyncIterator[Invoice]:
+    """
+    异步批量提取（AsyncLLMExtractor / AsyncVLMExtractor），按完成顺序产出结果
+
+    查缓存与PDF解析在线程中执行，模型调用在事件循环中并发进行，
+    同时在途的文件数不超过 concurrency。
+
+    Args:
+        files: 文件对象或文件路径
+        extractor: 异步提取器实例
+        concurrency: 最大在途文件数，默认取 batch_config.async_concurrency
+        use_cache: 是否使用持久化结果缓存
+
+    Yields:
+        Invoice: 提取结果（完成顺序，file_name 标识对应文件）
+    """
+    cache = get_extraction_cache() if use_cache else None
+
+    async def extract_one(file) -> Invoice:
+        file_name = _file_name(file)
+        try:
+            digest, key, cached, payload = await asyncio.to_thread(_prepare_cached, file, extractor, cache)
+            if cached is not None:
+                cached.file_name = file_name
+                return cached
+            if getattr(extractor, "input_kind", "text") == "file":
+                invoice = await extractor.aextract_prepared(file_name, payload)
+            else:
+                invoice = await extractor.aextract(payload)
+            return _finish(invoice, file_name, digest, payload, key, cache)
+        except Exception as e:
+            logger.error(f"处理文件 {file_name} 失败: {str(e)}")
+            return Invoice(file_name=file_name, error=str(e))
+
+    async for _, invoice in bounded_as_completed(files, extract_one, concurrency):
+        yield invoice
+
+
+def extract_batch(
+    files: Iterable,
+    extractor,
+    max_workers: Optional[int] = None,
+    parse_workers: Optional[int] = None,
+    use_cache: bool = True
+    ) -> List[Invoice]:
+    """并发批量提取，返回与上传顺序一致的发票列表（UI各模式的统一入口），结果已做批次校验与跨批次查重"""
+    invoices = list(iter_extract(files, extractor, max_workers, parse_workers, use_cache))
+    validate_invoices(invoices)
+    mark_duplicates(invoices)
+    return invoices
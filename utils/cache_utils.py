@@ -0,0 +1,183 @@
+# utils/cache_utils.py
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from dataclasses import asdict
+from pathlib import Path
+from typing import Optional
+
+from models import Invoice
+from config import CACHE_CONFIG, logger
+
+
+def file_digest(data: bytes) -> str:
+    """计算上传文件内容的SHA-256"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def make_cache_key(digest: str, extractor) -> str:
+    """
+    生成缓存键：文件内容哈希 + 提取器类型 + 模型 + 提示词指纹
+
+    Args:
+        digest: file_digest() 计算的文件内容哈希（同时用于查重区分重复运行）
+        extractor: 提取器实例
+
+    Returns:
+        str: 十六进制缓存键
+    """
+    parts = [
+        digest,
+        type(extractor).__name__,
+        str(getattr(extractor, "model_path", "")),
+        extractor.prompt_fingerprint(),
+    ]
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+class ExtractionCache:
+    """
+    基于SQLite的提取结果持久化缓存（线程安全，按大小/时间淘汰）
+
+    命中/未命中次数记录在同一数据库中，任务工作进程的查询也计入界面显示的统计。
+    """
+
+    # 每写入多少条执行一次淘汰检查
+    EVICT_EVERY = 50
+
+    def __init__(self,
+                 directory: str = CACHE_CONFIG.get("directory", ".cache"),
+                 max_size_mb: float = CACHE_CONFIG.get("max_size_mb", 256),
+                 max_age_days: float = CACHE_CONFIG.get("max_age_days", 30)):
+        """
+        初始化缓存
+
+        Args:
+            directory: 缓存目录
+            max_size_mb: 缓存总大小上限（MB）
+            max_age_days: 条目最长保留天数
+        """
+        path = Path(directory)
+        path.mkdir(parents=True, exist_ok=True)
+        self.db_path = path / "extraction_cache.sqlite3"
+        self.max_bytes = int(max_size_mb * 1024 * 1024)
+        self.max_age = max_age_days * 86400
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS extraction_cache (
+                key TEXT PRIMARY KEY,
+                invoice TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_cache_accessed ON extraction_cache(accessed_at)"
+        )
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS cache_counters (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            )
+        """)
+        self._conn.execute("INSERT OR IGNORE INTO cache_counters VALUES ('hits', 0), ('misses', 0)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[Invoice]:
+        """读取缓存的Invoice，未命中或已过期返回None"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT invoice, created_at FROM extraction_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.max_age:
+                self._count_locked("misses")
+                return None
+            self._conn.execute(
+                "UPDATE extraction_cache SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+            self._count_locked("hits")
+        return Invoice(**json.loads(row[0]))
+
+    def _count_locked(self, name: str) -> None:
+        self._conn.execute("UPDATE cache_counters SET value = value + 1 WHERE name = ?", (name,))
+        self._conn.commit()
+
+    def put(self, key: str, invoice: Invoice) -> None:
+        """写入提取结果（出错的结果不缓存）"""
+        if invoice.error:
+            return
+        payload = json.dumps(asdict(invoice), ensure_ascii=False, default=str)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO extraction_cache VALUES (?, ?, ?, ?, ?)",
+                (key, payload, len(payload.encode("utf-8")), now, now)
+            )
+            self._conn.commit()
+            self._writes += 1
+            if self._writes % self.EVICT_EVERY == 0:
+                self._evict_locked()
+
+    def evict(self) -> None:
+        """按时间和总大小淘汰条目"""
+        with self._lock:
+            self._evict_locked()
+
+    def _evict_locked(self) -> None:
+        self._conn.execute(
+            "DELETE FROM extraction_cache WHERE created_at < ?", (time.time() - self.max_age,)
+        )
+        total = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM extraction_cache"
+        ).fetchone()[0]
+        if total > self.max_bytes:
+            # 按最近访问时间从旧到新删除，直到低于上限
+            excess = total - self.max_bytes
+            freed = 0
+            keys = []
+            for key, size in self._conn.execute(
+                "SELECT key, size FROM extraction_cache ORDER BY accessed_at"
+            ):
+                keys.append((key,))
+                freed += size
+                if freed >= excess:
+                    break
+            self._conn.executemany("DELETE FROM extraction_cache WHERE key = ?", keys)
+            logger.info(f"缓存淘汰 {len(keys)} 条，释放 {freed} 字节")
+        self._conn.commit()
+
+    def clear(self) -> None:
+        """清空缓存与计数"""
+        with self._lock:
+            self._conn.execute("DELETE FROM extraction_cache")
+            self._conn.execute("UPDATE cache_counters SET value = 0")
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        """返回命中/未命中次数（所有进程累计）及条目数"""
+        with self._lock:
+            count = self._conn.execute("SELECT COUNT(*) FROM extraction_cache").fetchone()[0]
+            counters = dict(self._conn.execute("SELECT name, value FROM cache_counters").fetchall())
+        return {"hits": counters.get("hits", 0), "misses": counters.get("misses", 0), "entries": count}
+
+
+_cache: Optional[ExtractionCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_extraction_cache() -> Optional[ExtractionCache]:
+    """获取进程级缓存实例，配置关闭时返回None"""
+    global _cache
+    if not CACHE_CONFIG.get("enabled", True):
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = ExtractionCache()
+        return _cache
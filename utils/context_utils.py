@@ -0,0 +1,215 @@
+# utils/context_utils.py
+import math
+import re
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Set
+
+from config import CHAT_CONFIG, logger
+from extractors.llm_extractor import estimate_tokens, model_context_length
+from models import Invoice
+from .store_utils import BatchCache
+
+CJK_RE = re.compile(r"[\u4e00-\u9fff]+")
+NUMBER_RE = re.compile(r"\d+(?:\.\d+)?")
+INVOICE_NUMBER_RE = re.compile(r"\d{20}")
+YEAR_MONTH_RE = re.compile(r"(?:(\d{4})\s*[年\-/.]\s*)?(\d{1,2})\s*月")
+
+# 紧凑行的列（顺序即输出顺序）
+CONTEXT_COLUMNS = ("文件", "发票号码", "开票日期", "购方", "销方", "项目", "金额", "税额", "价税合计")
+
+
+def _bigrams(text: str) -> Set[str]:
+    """中文片段切分为二元组（单字片段保留原样）"""
+    grams = set()
+    for run in CJK_RE.findall(text or ""):
+        if len(run) == 1:
+            grams.add(run)
+        grams.update(run[i:i + 2] for i in range(len(run) - 1))
+    return grams
+
+
+def _format_amount(value: Optional[float]) -> str:
+    return f"{value:.2f}" if value is not None else ""
+
+
+def invoice_row(invoice: Invoice) -> str:
+    """发票转换为一行紧凑文本（列见 CONTEXT_COLUMNS，以“|”分隔）"""
+    issue_date = invoice.parsed_issue_date()
+    return "|".join((
+        invoice.file_name or "",
+        invoice.invoice_number or "",
+        issue_date.isoformat() if issue_date else str(invoice.issue_date or ""),
+        invoice.buyer or "",
+        invoice.seller or "",
+        invoice.item_name or "",
+        _format_amount(invoice.amount),
+        _format_amount(invoice.tax_amount),
+        _format_amount(invoice.total_amount),
+    ))
+
+
+class InvoiceIndex:
+    """
+    发票批次的倒排索引：购/销方与项目名称按二元组，开票日期按年月，金额按数值
+
+    用于按问题挑选相关发票，构建一次后可重复查询。
+    只保存紧凑行、索引与金额合计，不保留发票对象（结果库批次逐块读取，内存与原文长度无关）。
+    """
+
+    def __init__(self, invoices: Iterable[Invoice]):
+        self.text_index: Dict[str, Set[int]] = defaultdict(set)
+        self.month_index: Dict[str, Set[int]] = defaultdict(set)
+        self.amount_index: Dict[str, Set[int]] = defaultdict(set)
+        self.number_index: Dict[str, int] = {}
+        self.rows: List[str] = []
+        # 金额、税额、价税合计的全批合计
+        self.totals = [0.0, 0.0, 0.0]
+        # 旧方式（全部发票缩进JSON）的token数，仅用于统计节省量
+        self.json_tokens = 0
+        # 只遍历一次（结果库批次迭代时从库中分块读取）
+        for inv in invoices:
+            self.json_tokens += estimate_tokens(inv.to_json())
+            if not inv.error:
+                self._add(inv)
+
+    def _add(self, inv: Invoice) -> None:
+        """索引一张成功提取的发票"""
+        i = len(self.rows)
+        self.rows.append(invoice_row(inv))
+        for gram in _bigrams(" ".join(filter(None, (inv.buyer, inv.seller, inv.item_name)))):
+            self.text_index[gram].add(i)
+        issue_date = inv.parsed_issue_date()
+        if issue_date:
+            self.month_index[f"{issue_date.year}-{issue_date.month}"].add(i)
+            self.month_index[f"*-{issue_date.month}"].add(i)
+        for k, value in enumerate((inv.amount, inv.tax_amount, inv.total_amount)):
+            if value is not None:
+                self.amount_index[_format_amount(value)].add(i)
+                self.totals[k] += value
+        if inv.invoice_number:
+            self.number_index[inv.invoice_number] = i
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def search(self, query: str) -> List[int]:
+        """
+        返回与问题相关的发票序号（按相关度降序，同分保持原顺序）
+
+        Args:
+            query: 用户问题
+
+        Returns:
+            List[int]: 相关发票序号；问题中没有可匹配的条件时返回空列表
+        """
+        scores: Dict[int, float] = defaultdict(float)
+        total = max(len(self.rows), 1)
+
+        for number in INVOICE_NUMBER_RE.findall(query):
+            if number in self.number_index:
+                scores[self.number_index[number]] += 100
+
+        for year, month in YEAR_MONTH_RE.findall(query):
+            for i in self.month_index.get(f"{year or '*'}-{int(month)}", ()):
+                scores[i] += 10
+
+        for number in NUMBER_RE.findall(query):
+            for i in self.amount_index.get(_format_amount(float(number)), ()):
+                scores[i] += 10
+
+        for gram in _bigrams(query):
+            matches = self.text_index.get(gram)
+            if matches and len(matches) < total:
+                # 越少见的词权重越高；所有发票都包含的词不参与排序
+                weight = math.log(total / len(matches))
+                for i in matches:
+                    scores[i] += weight
+
+        return sorted(scores, key=lambda i: (-scores[i], i))
+
+
+@dataclass
+class ChatContext:
+    """问答上下文及其统计"""
+    text: str
+    selected: int      # 写入上下文的发票数
+    total: int         # 批次中成功提取的发票数
+    tokens: int        # 上下文估算token数
+    full_tokens: int   # 旧方式（全部发票的缩进JSON）估算token数
+
+
+def context_budget(model_path: Optional[str] = None) -> int:
+    """
+    模型可用于发票数据的token预算
+
+    取 模型 context_length（未配置时为 chat_config.default_context_length）减去
+    chat_config.reserve_tokens（问题与回答预留），并不超过 chat_config.max_context_tokens。
+    """
+    budget = model_context_length(model_path) - CHAT_CONFIG.get("reserve_tokens", 1024)
+    if CHAT_CONFIG.get("max_context_tokens"):
+        budget = min(budget, CHAT_CONFIG["max_context_tokens"])
+    return max(budget, 256)
+
+
+_index_cache = BatchCache(InvoiceIndex)
+
+
+def get_invoice_index(invoices: List[Invoice]) -> InvoiceIndex:
+    """同一批次复用已构建的索引（按批次缓存，各会话的批次互不覆盖，见 BatchCache）"""
+    return _index_cache.get(invoices)
+
+
+def build_chat_context(query: str, invoices: List[Invoice], budget: Optional[int] = None) -> ChatContext:
+    """
+    为问题挑选相关发票，生成不超过token预算的紧凑上下文
+
+    先写入全批汇总（张数与金额合计），再按相关度写入发票行；问题中没有可匹配条件时
+    按原顺序写入。预算用尽后注明未列出的张数。
+
+    Args:
+        query: 用户问题
+        invoices: 当前批次发票
+        budget: token预算，默认为 context_budget()
+
+    Returns:
+        ChatContext: 上下文文本与统计
+    """
+    budget = budget or context_budget()
+    index = get_invoice_index(invoices)
+    ranked = index.search(query)
+    # 相关发票优先，剩余预算按原顺序补充其余发票
+    seen = set(ranked)
+    order = ranked + [i for i in range(len(index)) if i not in seen]
+
+    totals = index.totals
+    header = [
+        f"全批共 {len(index)} 张发票，金额合计 {totals[0]:.2f}，税额合计 {totals[1]:.2f}，价税合计 {totals[2]:.2f}",
+        "|".join(CONTEXT_COLUMNS),
+    ]
+    used = estimate_tokens("\n".join(header))
+    lines = []
+    for i in order:
+        cost = estimate_tokens(index.rows[i]) + 1
+        if used + cost > budget:
+            break
+        lines.append(index.rows[i])
+        used += cost
+    selected = len(lines)
+    if selected < len(index):
+        lines.append(f"（另有 {len(index) - selected} 张发票未列出）")
+
+    text = "\n".join(header + lines)
+    full_tokens = index.json_tokens
+    context = ChatContext(
+        text=text,
+        selected=selected,
+        total=len(index),
+        tokens=estimate_tokens(text),
+        full_tokens=full_tokens,
+    )
+    logger.info(
+        f"问答上下文: {context.selected}/{context.total} 张发票（相关 {len(ranked)} 张），"
+        f"约 {context.tokens} tokens，比全量JSON节省约 {max(full_tokens - context.tokens, 0)} tokens"
+    )
+    return context
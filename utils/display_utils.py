@@ -1,64 +1,167 @@
 # utils/display_utils.py
+import threading
 import streamlit as st
 import pandas as pd
-from io import BytesIO
-from typing import List, Union
-from models import Invoice
-from .llm_utils import ask_llm
+from tempfile import SpooledTemporaryFile
+from typing import Callable, List, Union
+from models import Invoice, InvoiceBatch
+from .llm_utils import ask_llm_stream, TimedStream
+from .query_utils import answer_structured_query
+from .export_utils import EXPORT_MIME_TYPES, batch_to_frame, export_invoices
+from .store_utils import InvoiceFilter, StoredBatch, batch_fingerprint
 from config import logger
 from typing import Union, List, Dict
 
-def show_results(invoices: Union[Invoice, List[Invoice], Dict]):
-    """显示发票处理结果（包含错误处理和两种视图模式）"""
+# InvoiceFilter 条件 -> 对应的 Invoice 字段（内存中的发票列表按此筛选）
+FILTER_FIELDS = {"has_error": "error", "flagged": "flags", "duplicate": "duplicate_of"}
+# 详细视图与失败文件列表每页张数
+RESULTS_PAGE_SIZE = 20
+# 界面导出选项 -> 导出格式
+EXPORT_LABELS = {"Excel": "xlsx", "CSV": "csv", "Parquet": "parquet"}
+_export_lock = threading.Lock()
+
+
+def _select(invoices: Union[StoredBatch, List[Invoice]], **conditions) -> List[Invoice]:
+    """按条件取出发票：结果库批次在库中筛选（只读取符合条件的行），发票列表在内存中筛选"""
+    if isinstance(invoices, StoredBatch):
+        return invoices.select(InvoiceFilter(**conditions))
+    return [inv for inv in invoices
+            if all(bool(getattr(inv, FILTER_FIELDS[name], None)) == value for name, value in conditions.items())]
+
+
+def _page(invoices: Union[StoredBatch, List[Invoice]], offset: int, **conditions) -> List[Invoice]:
+    """按条件取一页发票（结果库批次只读取这一页）"""
+    if isinstance(invoices, StoredBatch):
+        return invoices.page(InvoiceFilter(**conditions), offset, RESULTS_PAGE_SIZE)
+    return _select(invoices, **conditions)[offset:offset + RESULTS_PAGE_SIZE]
+
+
+def _page_offset(total: int, key: str) -> int:
+    """总数超过一页时显示页码选择，返回本页第一张的序号"""
+    pages = (total - 1) // RESULTS_PAGE_SIZE + 1
+    if pages <= 1:
+        return 0
+    page = st.number_input(f"页码（共 {pages} 页，每页 {RESULTS_PAGE_SIZE} 张）",
+                           min_value=1, max_value=pages, value=1, step=1, key=key)
+    return (int(page) - 1) * RESULTS_PAGE_SIZE
+
+
+def _close_export(file: SpooledTemporaryFile) -> None:
+    """导出文件被淘汰出缓存时关闭（释放内存，超过阈值写到磁盘的临时文件随之删除）"""
+    with _export_lock:
+        file.close()
+
+
+@st.cache_resource(show_spinner=False, max_entries=8, on_release=_close_export)
+def _export_file(fingerprint: str, fmt: str, _invoices: Union[StoredBatch, List[Invoice]]) -> SpooledTemporaryFile:
+    """按批次指纹与格式缓存导出文件（成功提取的发票，逐块读取写出）"""
+    rows = _invoices.iter_invoices(InvoiceFilter(has_error=False)) if isinstance(_invoices, StoredBatch) \
+        else (inv for inv in _invoices if not inv.error)
+    return export_invoices(rows, fmt, include_error=False)
+
+
+def _export_reader(fingerprint: str, fmt: str, invoices: Union[StoredBatch, List[Invoice]]) -> Callable[[], bytes]:
+    """
+    下载按钮的数据：用户点击下载时才读取导出文件，页面重新运行时不读取
+
+    各会话共享同一文件对象，读取时加锁；文件已被淘汰（关闭）时重新生成。
+    """
+    def read() -> bytes:
+        while True:
+            file = _export_file(fingerprint, fmt, invoices)
+            with _export_lock:
+                if not file.closed:
+                    file.seek(0)
+                    return file.read()
+    return read
+
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def _result_tables(fingerprint: str, _invoices: Union[StoredBatch, List[Invoice]]) -> Dict:
+    """
+    按批次指纹缓存结果表与统计，页面重新运行（包括每条聊天消息）时不再重新构建
+
+    整批只读取/转换一次：列式批次按列构建表格，结果库批次分块读取，不生成发票列表。
+
+    Returns:
+        Dict: error_count、flagged_count、table（成功发票的结果表）、duplicates（重复发票表）
+    """
+    batch = _invoices.to_batch() if isinstance(_invoices, StoredBatch) \
+        else InvoiceBatch.from_invoices(_invoices, keep_raw_text=False)
+    errors = batch.error_mask
+    success = batch.take(~errors)
+    rows = sorted(success.duplicates)
+    return {
+        "error_count": int(errors.sum()),
+        "flagged_count": len(success.flags),
+        "table": batch_to_frame(success, include_error=False),
+        "duplicates": pd.DataFrame({
+            "文件名称": success.file_name[rows],
+            "发票号码": [success[i].invoice_number for i in rows],
+            "重复提示": [success.duplicates[i] for i in rows],
+        }),
+    }
+
+
+def show_results(invoices: Union[StoredBatch, List[Invoice]]):
+    """显示发票处理结果（包含错误处理和两种视图模式），invoices 可以是结果库批次或发票列表"""
     st.markdown("### 发票信息提取结果")
+    fingerprint = batch_fingerprint(invoices)
+    tables = _result_tables(fingerprint, invoices)
     
-    # 错误文件处理
-    error_files = [inv for inv in invoices if hasattr(inv, 'error') and inv.error]
-    if error_files:
-        st.warning(f"{len(error_files)}个文件处理失败")
-        for inv in error_files:
-            with st.expander(f"❌ 错误文件: {getattr(inv, 'file_name', '未知文件')}", expanded=False):
-                st.error(f"错误类型: {getattr(inv, 'error', '未知错误')}")
-                if hasattr(inv, 'raw_text'):
-                    st.text_area("原始文本", inv.raw_text, height=100, key=f"error_{id(inv)}")
+    # 错误文件处理（展开时才读取，分页显示）
+    error_count = tables["error_count"]
+    if error_count:
+        st.warning(f"{error_count}个文件处理失败")
+        if st.toggle("显示失败文件", key=f"show_errors_{fingerprint}"):
+            offset = _page_offset(error_count, key=f"error_page_{fingerprint}")
+            for idx, inv in enumerate(_page(invoices, offset, has_error=True), offset + 1):
+                with st.expander(f"❌ 错误文件: {getattr(inv, 'file_name', '未知文件')}", expanded=False):
+                    st.error(f"错误类型: {getattr(inv, 'error', '未知错误')}")
+                    if getattr(inv, 'raw_text', None):
+                        st.text_area("原始文本", inv.raw_text, height=100, key=f"error_{idx}")
     
     # 成功文件处理
-    success_files = [inv for inv in invoices if not (hasattr(inv, 'error') and inv.error)]
-    if not success_files:
+    success_count = len(invoices) - error_count
+    if not success_count:
         st.info("没有成功处理的发票文件")
         return
 
+    if tables["flagged_count"]:
+        st.warning(f"{tables['flagged_count']}张发票未通过金额/日期/号码校验，请核对“校验提示”列")
+
+    duplicates = tables["duplicates"]
+    if len(duplicates):
+        st.error(f"{len(duplicates)}张发票与已登记的发票重复，可能是重复报销")
+        with st.expander("查看重复发票", expanded=False):
+            st.dataframe(duplicates, use_container_width=True)
+
     # 视图模式选择
     display_mode = st.radio("显示模式", ["表格视图", "详细视图"], horizontal=True, key="view_mode")
     
     try:
         if display_mode == "表格视图":
-            # 表格视图处理
-            df = pd.DataFrame([{
-                '文件名称': getattr(inv, 'file_name', ''),
-                '发票号码': getattr(inv, 'invoice_number', '未提取'),
-                '开票日期': getattr(inv, 'issue_date', '未提取'),
-                '购方名称': getattr(inv, 'buyer', '未提取'),
-                '销方名称': getattr(inv, 'seller', '未提取'),
-                '项目名称': getattr(inv, 'item_name', '未提取'),
-                '金额': getattr(inv, 'amount', '未提取'),
-                '税额': getattr(inv, 'tax_amount', '未提取'),
-                '价税合计': getattr(inv, 'total_amount', '未提取')
-            } for inv in success_files])
+            # 表格视图处理（同一批次直接复用缓存的结果表）
+            df = tables["table"]
             
             st.dataframe(df, use_container_width=True)
 
-            # Excel导出功能
-            if st.button("导出为Excel", key="export_excel"):
-                output = BytesIO()
-                with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-                    df.to_excel(writer, index=False, sheet_name='发票信息')
+            # 导出功能：分块流式写入临时文件，同一批次同一格式只生成一次
+            label = st.radio("导出格式", list(EXPORT_LABELS), horizontal=True, key="export_format")
+            fmt = EXPORT_LABELS[label]
+            ready = st.session_state.setdefault("exports_ready", set())
+            if (fingerprint, fmt) not in ready and st.button(f"导出为{label}", key="export_excel"):
+                with st.spinner("正在生成导出文件..."):
+                    _export_file(fingerprint, fmt, invoices)
+                ready.add((fingerprint, fmt))
+            if (fingerprint, fmt) in ready:
+                extension, mime = EXPORT_MIME_TYPES[fmt]
                 st.download_button(
-                    label="下载Excel文件",
-                    data=output.getvalue(),
-                    file_name="发票信息.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                    key="download_excel"
+                    label=f"下载{label}文件",
+                    data=_export_reader(fingerprint, fmt, invoices),
+                    file_name=f"发票信息.{extension}",
+                    mime=mime,
+                    key=f"download_{fmt}"
                 )
 
             # # Excel导出功能 + 打印组合
@@ -159,8 +262,9 @@ def show_results(invoices: Union[Invoice, List[Invoice], Dict]):
             #             #     """, unsafe_allow_html=True)
         
         else:
-            # 详细视图处理
-            for idx, inv in enumerate(success_files, 1):
+            # 详细视图处理（分页，只读取和渲染当前页）
+            offset = _page_offset(success_count, key=f"detail_page_{fingerprint}")
+            for idx, inv in enumerate(_page(invoices, offset, has_error=False), offset + 1):
                 with st.expander(f"📄 发票 #{idx}: {getattr(inv, 'file_name', '无名文件')}", expanded=False):
                     col1, col2 = st.columns(2)
                     with col1:
@@ -176,6 +280,11 @@ def show_results(invoices: Union[Invoice, List[Invoice], Dict]):
                         st.write(f"**金额**: {getattr(inv, 'amount', '未提取')}")
                         st.write(f"**税额**: {getattr(inv, 'tax_amount', '未提取')}")
                         st.write(f"**价税合计**: {getattr(inv, 'total_amount', '未提取')}")
+
+                    if getattr(inv, 'flags', None):
+                        st.warning("校验提示: " + "；".join(inv.flags.values()))
+                    if getattr(inv, 'duplicate_of', None):
+                        st.error(f"重复提示: {inv.duplicate_of}")
                     
                     if hasattr(inv, 'raw_text'):
                         st.text_area("原始文本", 
@@ -188,7 +297,33 @@ def show_results(invoices: Union[Invoice, List[Invoice], Dict]):
         st.exception(e)  # 显示完整错误堆栈
 
 
-def chat_interface(model_path: str, invoices: Union[Invoice, List[Invoice], Dict]):
+def _render_chat_message(message: Dict):
+    """渲染单条聊天消息，助手消息附带首字延迟与总耗时"""
+    with st.chat_message(message["role"]):
+        st.markdown(message["content"])
+        metrics = message.get("metrics")
+        if metrics and metrics.get("total") is not None:
+            if metrics.get("source") == "local":
+                st.caption(f"本地计算 · 总计 {metrics['total'] * 1000:.1f} 毫秒")
+            else:
+                st.caption(f"首字 {metrics['ttft'] or 0:.2f} 秒 · 总计 {metrics['total']:.2f} 秒")
+
+
+def _chat_reply(model_path: str, prompt: str, invoices, info: Dict):
+    """聚合类问题（求和、计数、分组等）在本地精确计算，其余问题交给大模型流式回答"""
+    local = None
+    if isinstance(invoices, StoredBatch) or (
+            isinstance(invoices, list) and invoices and all(isinstance(inv, Invoice) for inv in invoices)):
+        local = answer_structured_query(prompt, invoices)
+    if local is not None:
+        info["source"] = "local"
+        yield local.text
+        return
+    info["source"] = "llm"
+    yield from ask_llm_stream(model_path, prompt, invoices)
+
+
+def chat_interface(model_path: str, invoices: Union[StoredBatch, Invoice, List[Invoice], Dict]):
     """支持 /clear 命令的聊天界面（仅按钮/Ctrl+Enter发送）"""
     st.subheader("💬 发票信息查询助手")
     
@@ -206,8 +341,7 @@ def chat_interface(model_path: str, invoices: Union[Invoice, List[Invoice], Dict
 
             # 渲染历史消息
             for message in st.session_state.chat_history:
-                with st.chat_message(message["role"]):
-                    st.markdown(message["content"])
+                _render_chat_message(message)
             
             # 紧凑布局样式
             st.markdown("""
@@ -299,15 +433,30 @@ def chat_interface(model_path: str, invoices: Union[Invoice, List[Invoice], Dict
                 # 添加用户消息
                 st.session_state.chat_history.append({"role": "user", "content": current_prompt})
                 
-                # 获取LLM回复
-                with st.spinner("正在思考..."):
-                    try:
-                        response = ask_llm(model_path, current_prompt, invoices)
-                    except Exception as e:
-                        response = f"处理出错: {str(e)}"
+                # 流式获取LLM回复：重绘历史后逐段显示
+                with chat_container.container():
+                    for message in st.session_state.chat_history:
+                        _render_chat_message(message)
+                    with st.chat_message("assistant"):
+                        reply_info = {}
+                        stream = TimedStream(_chat_reply(model_path, current_prompt, invoices, reply_info))
+                        try:
+                            response = st.write_stream(stream)
+                        except Exception as e:
+                            response = f"处理出错: {str(e)}"
+                metrics = {**stream.metrics(), **reply_info}
+                if metrics["total"] is not None:
+                    logger.info(
+                        f"对话回复({metrics.get('source')}): 首字 {metrics['ttft'] or 0:.2f}s, 总计 {metrics['total']:.2f}s, "
+                        f"{metrics['chunks']} 段"
+                    )
                 
                 # 添加助手回复
-                st.session_state.chat_history.append({"role": "assistant", "content": response})
+                st.session_state.chat_history.append({
+                    "role": "assistant",
+                    "content": response if isinstance(response, str) else "".join(map(str, response)),
+                    "metrics": metrics
+                })
                 
                 # 重置输入框
                 st.session_state.input_area_key += 1
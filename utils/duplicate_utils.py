@@ -0,0 +1,222 @@
+# utils/duplicate_utils.py
+import re
+import sqlite3
+import threading
+import time
+from itertools import islice
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from models import Invoice
+from models.invoice import parse_issue_date
+from config import CACHE_CONFIG, DUPLICATE_CONFIG, logger
+
+# 单条SQL中 IN (...) 的参数个数上限（旧版SQLite限制为999）
+LOOKUP_CHUNK = 500
+# 多个进程（后台任务的工作进程）同时查重时等待写锁的最长秒数
+BUSY_TIMEOUT = 30
+# 销方名称比较前去掉的空白，全角括号统一为半角
+SELLER_BLANK_RE = re.compile(r"\s+")
+SELLER_TRANSLATION = str.maketrans("（）", "()")
+
+
+def secondary_key(invoice: Invoice) -> Optional[str]:
+    """
+    辅助键：销方名称 + 开票日期 + 价税合计（分）
+
+    用于发票号码识别错误（OCR/模型漏字）时仍能发现重复；三项缺一则返回None。
+    """
+    issue_date = parse_issue_date(invoice.issue_date)
+    if not invoice.seller or issue_date is None or invoice.total_amount is None:
+        return None
+    seller = SELLER_BLANK_RE.sub("", invoice.seller).translate(SELLER_TRANSLATION)
+    return f"{seller}|{issue_date.isoformat()}|{round(invoice.total_amount * 100)}"
+
+
+def _same_file(invoice: Invoice, record: Tuple[str, float, Optional[str]]) -> bool:
+    """已登记的记录来自同一文件（文件名与内容哈希均相同）：重复运行或任务续跑，而不是重复报销"""
+    file_name, _, file_hash = record
+    return bool(invoice.file_hash) and file_hash == invoice.file_hash and file_name == invoice.file_name
+
+
+def _describe(file_name: str, recorded_at: float, exact: bool) -> str:
+    when = time.strftime("%Y-%m-%d", time.localtime(recorded_at))
+    if exact:
+        return f"发票号码与 {file_name}（{when}登记）重复"
+    return f"疑似与 {file_name}（{when}登记）重复：销方、开票日期、价税合计相同"
+
+
+class DuplicateIndex:
+    """
+    基于SQLite的历史发票索引，按发票号码及辅助键查重，跨批次持久保存
+
+    线程安全，也支持多进程：查询与登记在同一个 BEGIN IMMEDIATE 事务中完成，
+    两个进程同时登记同一张发票时，后一个会等前一个提交后再查询，从而识别为重复。
+    同时登记文件内容哈希：文件名与内容都相同的发票是同一文件再次提取，不标记为重复。
+    """
+
+    def __init__(self, directory: str = CACHE_CONFIG.get("directory", ".cache")):
+        """
+        初始化索引
+
+        Args:
+            directory: 索引文件所在目录（默认与提取结果缓存相同）
+        """
+        path = Path(directory)
+        path.mkdir(parents=True, exist_ok=True)
+        self.db_path = path / "invoice_index.sqlite3"
+        self._lock = threading.Lock()
+        # isolation_level=None：事务由 check_and_record 显式开启
+        self._conn = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT, check_same_thread=False,
+                                     isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # invoice_number 可为NULL（未提取到号码的发票只登记辅助键）
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS invoice_index (
+                id INTEGER PRIMARY KEY,
+                invoice_number TEXT UNIQUE,
+                secondary_key TEXT,
+                file_name TEXT NOT NULL,
+                file_hash TEXT,
+                recorded_at REAL NOT NULL
+            )
+        """)
+        if "file_hash" not in {row[1] for row in self._conn.execute("PRAGMA table_info(invoice_index)")}:
+            self._conn.execute("ALTER TABLE invoice_index ADD COLUMN file_hash TEXT")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_index_secondary ON invoice_index(secondary_key)"
+        )
+
+    def _lookup_locked(self, column: str, values: List[str]) -> Dict[str, Tuple[str, float, Optional[str]]]:
+        """按列批量查询已登记的发票：值 -> (文件名, 登记时间, 内容哈希)，同一辅助键取最早登记的一条"""
+        found = {}
+        values = list(dict.fromkeys(values))
+        for start in range(0, len(values), LOOKUP_CHUNK):
+            chunk = values[start:start + LOOKUP_CHUNK]
+            rows = self._conn.execute(
+                f"SELECT {column}, file_name, recorded_at, file_hash FROM invoice_index "
+                f"WHERE {column} IN ({','.join('?' * len(chunk))}) ORDER BY id DESC",
+                chunk
+            )
+            found.update((value, tuple(record)) for value, *record in rows)
+        return found
+
+    def check_and_record(self, invoices: List[Invoice], on_marked: Optional[Callable[[], None]] = None) -> int:
+        """
+        查重并登记一批发票
+
+        每张发票先按发票号码、再按辅助键与历史记录及本批中排在前面的发票比较，
+        重复时写入 invoice.duplicate_of（说明首次登记的文件与日期），否则登记到索引。
+        匹配到的记录来自同一文件（文件名与 invoice.file_hash 相同）时不算重复。
+        提取失败的发票不参与。
+
+        Args:
+            invoices: 发票（原地修改）
+            on_marked: 标记完成、登记提交前调用（如写入结果库）；抛出异常时本次登记回滚，
+                       进程在两者之间中止时不会留下已登记但未保存的发票
+
+        Returns:
+            int: 重复（含疑似重复）的张数
+        """
+        candidates = [inv for inv in invoices if not inv.error]
+        for invoice in invoices:
+            invoice.duplicate_of = None
+        if not candidates:
+            if on_marked is not None:
+                on_marked()
+            return 0
+        keys = [(inv.invoice_number or None, secondary_key(inv)) for inv in candidates]
+        now = time.time()
+        with self._lock:
+            # 先取得写锁再查询：其他进程的登记要么已提交（能查到），要么等本事务结束
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                duplicates = self._check_and_record_locked(candidates, keys, now)
+                if on_marked is not None:
+                    on_marked()
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        if duplicates:
+            logger.info(f"查重: {len(candidates)} 张发票中 {duplicates} 张与历史记录重复")
+        return duplicates
+
+    def _check_and_record_locked(self, candidates: List[Invoice], keys: List[Tuple[Optional[str], Optional[str]]],
+                                 now: float) -> int:
+        """在写事务中查重并登记，返回重复张数"""
+        by_number = self._lookup_locked("invoice_number", [n for n, _ in keys if n])
+        by_secondary = self._lookup_locked("secondary_key", [s for _, s in keys if s])
+        rows, duplicates = [], 0
+        for invoice, (number, secondary) in zip(candidates, keys):
+            found = None
+            if number and number in by_number:
+                found, exact = by_number[number], True
+            elif secondary and secondary in by_secondary:
+                found, exact = by_secondary[secondary], False
+            if found:
+                # 同一文件再次提取（重复运行、任务续跑）不算重复
+                if not _same_file(invoice, found):
+                    invoice.duplicate_of = _describe(found[0], found[1], exact)
+                    duplicates += 1
+                # 号码不同的疑似重复仍登记号码，之后同号码的发票按精确重复处理
+                if not number or number in by_number:
+                    continue
+            elif not number and not secondary:
+                continue
+            rows.append((number, secondary, invoice.file_name, invoice.file_hash, now))
+            # 本批登记的记录不带内容哈希：同一批中上传两份相同文件仍标记为重复
+            if number:
+                by_number[number] = (invoice.file_name, now, None)
+            if secondary:
+                by_secondary.setdefault(secondary, (invoice.file_name, now, None))
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO invoice_index (invoice_number, secondary_key, file_name, file_hash, recorded_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            rows
+        )
+        return duplicates
+
+    def clear(self) -> None:
+        """清空索引"""
+        with self._lock:
+            self._conn.execute("DELETE FROM invoice_index")
+
+    def stats(self) -> dict:
+        """返回已登记的发票数"""
+        with self._lock:
+            count = self._conn.execute("SELECT COUNT(*) FROM invoice_index").fetchone()[0]
+        return {"entries": count}
+
+
+_index: Optional[DuplicateIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_duplicate_index() -> Optional[DuplicateIndex]:
+    """获取进程级查重索引，配置关闭时返回None"""
+    global _index
+    if not DUPLICATE_CONFIG.get("enabled", True):
+        return None
+    with _index_lock:
+        if _index is None:
+            _index = DuplicateIndex()
+        return _index
+
+
+def mark_duplicates(invoices: List[Invoice], on_marked: Optional[Callable[[], None]] = None) -> int:
+    """用进程级索引查重并登记（查重关闭时只调用 on_marked），返回重复张数"""
+    index = get_duplicate_index()
+    if index is None:
+        if on_marked is not None:
+            on_marked()
+        return 0
+    return index.check_and_record(invoices, on_marked)
+
+
+def iter_mark_duplicates(invoices: Iterable[Invoice], chunk_size: int = 1000) -> Iterator[Invoice]:
+    """流式结果按 chunk_size 张一组查重后依次产出（命令行批处理使用）"""
+    invoices = iter(invoices)
+    while chunk := list(islice(invoices, chunk_size)):
+        mark_duplicates(chunk)
+        yield from chunk
@@ -0,0 +1,290 @@
+# utils/export_utils.py
+import csv
+import io
+import json
+from itertools import islice
+from pathlib import Path
+from tempfile import SpooledTemporaryFile
+from typing import BinaryIO, Dict, Iterable, List, Optional, TextIO, Union
+
+import pandas as pd
+
+from models import Invoice, InvoiceBatch
+from models.invoice import AMOUNT_FIELDS
+from models.invoice_batch import CATEGORICAL_FIELDS
+
+# Invoice字段 -> 导出列名（与界面表格一致，另加错误信息）
+EXPORT_COLUMNS = {
+    "file_name": "文件名称",
+    "invoice_number": "发票号码",
+    "issue_date": "开票日期",
+    "buyer": "购方名称",
+    "seller": "销方名称",
+    "item_name": "项目名称",
+    "amount": "金额",
+    "tax_amount": "税额",
+    "total_amount": "价税合计",
+    "error": "错误信息",
+    "flags": "校验提示",
+    "duplicate_of": "重复提示",
+}
+
+EXPORT_FORMATS = ("jsonl", "csv", "xlsx", "parquet")
+
+
+def invoice_to_row(invoice: Invoice) -> Dict:
+    """将Invoice转换为导出行（日期统一为 YYYY-MM-DD，无法解析的保留原始字符串，缺失值保留为None）"""
+    row = {}
+    for field, column in EXPORT_COLUMNS.items():
+        value = getattr(invoice, field, None)
+        if value is not None and field == "issue_date":
+            parsed = invoice.parsed_issue_date()
+            value = parsed.isoformat() if parsed else str(value)
+        elif field == "flags":
+            value = "；".join(value.values()) if value else None
+        row[column] = value
+    return row
+
+
+def batch_to_frame(batch: InvoiceBatch, include_error: bool = True) -> pd.DataFrame:
+    """
+    InvoiceBatch 转换为导出表（列名同 EXPORT_COLUMNS，按列构建）
+
+    开票日期格式化为 YYYY-MM-DD，无法解析的保留原始字符串；缺失值为None。
+    """
+    columns = {k: v for k, v in EXPORT_COLUMNS.items() if include_error or k != "error"}
+    df = batch.to_frame(columns, include_error=include_error)
+    date_column = EXPORT_COLUMNS["issue_date"]
+    dates = df[date_column].dt.strftime("%Y-%m-%d").astype(object)
+    for i, value in batch.unparsed_dates.items():
+        dates.iat[i] = value
+    df[date_column] = dates.where(dates.notna(), None)
+    return df
+
+
+class InvoiceWriter:
+    """流式写出器基类：逐条写入，不在内存中累积整批结果"""
+
+    def __init__(self, target: Union[str, Path, BinaryIO], include_error: bool = True):
+        """
+        Args:
+            target: 输出文件路径，或已打开的二进制文件对象（如 SpooledTemporaryFile，关闭写出器时不关闭它）
+            include_error: 是否输出“错误信息”列
+        """
+        self.target = target
+        self.path = Path(target) if isinstance(target, (str, Path)) else None
+        self.columns = {k: v for k, v in EXPORT_COLUMNS.items() if include_error or k != "error"}
+        self.include_error = include_error
+        self.count = 0
+
+    def _open_text(self, encoding: str) -> TextIO:
+        """以文本方式打开输出（文件对象外包一层TextIOWrapper，关闭时分离而不关闭底层文件）"""
+        if self.path is not None:
+            return open(self.path, "w", encoding=encoding, newline="")
+        return io.TextIOWrapper(self.target, encoding=encoding, newline="", write_through=True)
+
+    def _close_text(self, file: TextIO) -> None:
+        if self.path is not None:
+            file.close()
+        else:
+            file.flush()
+            file.detach()
+
+    def write(self, invoice: Invoice) -> None:
+        row = invoice_to_row(invoice)
+        self._write_row({column: row[column] for column in self.columns.values()})
+        self.count += 1
+
+    def write_batch(self, batch: InvoiceBatch) -> None:
+        """写入整个列式批次（不构造Invoice对象）"""
+        df = batch_to_frame(batch, self.include_error)
+        for row in df.astype(object).where(df.notna(), None).to_dict("records"):
+            self._write_row(row)
+        self.count += len(batch)
+
+    def _write_row(self, row: Dict) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        raise NotImplementedError
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class JsonlInvoiceWriter(InvoiceWriter):
+    """每行一个JSON对象"""
+
+    def __init__(self, target: Union[str, Path, BinaryIO], include_error: bool = True):
+        super().__init__(target, include_error)
+        self._file = self._open_text("utf-8")
+
+    def _write_row(self, row: Dict) -> None:
+        self._file.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+    def close(self) -> None:
+        self._close_text(self._file)
+
+
+class CsvInvoiceWriter(InvoiceWriter):
+    """带BOM的UTF-8 CSV，Excel可直接打开"""
+
+    def __init__(self, target: Union[str, Path, BinaryIO], include_error: bool = True):
+        super().__init__(target, include_error)
+        self._file = self._open_text("utf-8-sig")
+        self._writer = csv.DictWriter(self._file, fieldnames=list(self.columns.values()))
+        self._writer.writeheader()
+
+    def _write_row(self, row: Dict) -> None:
+        self._writer.writerow(row)
+
+    def close(self) -> None:
+        self._close_text(self._file)
+
+
+class ExcelInvoiceWriter(InvoiceWriter):
+    """
+    xlsx 写出（xlsxwriter 常量内存模式）
+
+    每写完一行即刷出到临时文件，内存占用与行数无关；因此只能按顺序逐行写入。
+    """
+
+    def __init__(self, target: Union[str, Path, BinaryIO], include_error: bool = True,
+                 sheet_name: str = "发票信息"):
+        super().__init__(target, include_error)
+        import xlsxwriter
+        self._workbook = xlsxwriter.Workbook(
+            str(self.path) if self.path is not None else self.target,
+            {"constant_memory": True, "strings_to_numbers": False, "strings_to_urls": False}
+        )
+        self._sheet = self._workbook.add_worksheet(sheet_name)
+        self._money = self._workbook.add_format({"num_format": "0.00"})
+        money_columns = {EXPORT_COLUMNS[name] for name in AMOUNT_FIELDS}
+        self._formats = [self._money if column in money_columns else None for column in self.columns.values()]
+        self._sheet.write_row(0, 0, list(self.columns.values()), self._workbook.add_format({"bold": True}))
+        self._row = 1
+
+    def _write_row(self, row: Dict) -> None:
+        for col, (value, cell_format) in enumerate(zip(row.values(), self._formats)):
+            if value is not None:
+                self._sheet.write(self._row, col, value, cell_format)
+        self._row += 1
+
+    def close(self) -> None:
+        self._workbook.close()
+
+
+class ParquetInvoiceWriter(InvoiceWriter):
+    """按行组分块写入Parquet（需要pyarrow）"""
+
+    def __init__(self, target: Union[str, Path, BinaryIO], include_error: bool = True, chunk_size: int = 1000):
+        super().__init__(target, include_error)
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("导出Parquet需要安装pyarrow: pip install pyarrow") from e
+        self._pa = pa
+        self._schema = pa.schema([
+            (column, pa.float64() if field in AMOUNT_FIELDS else pa.string())
+            for field, column in self.columns.items()
+        ])
+        self._writer = pq.ParquetWriter(self.path if self.path is not None else self.target, self._schema)
+        self._chunk_size = chunk_size
+        self._buffer: List[Dict] = []
+
+    def _write_row(self, row: Dict) -> None:
+        self._buffer.append(row)
+        if len(self._buffer) >= self._chunk_size:
+            self._flush()
+
+    def write_batch(self, batch: InvoiceBatch) -> None:
+        """列式批次直接转换为Arrow表写入，不经过逐行字典"""
+        self._flush()
+        df = batch_to_frame(batch, self.include_error)
+        for field in CATEGORICAL_FIELDS:
+            df[EXPORT_COLUMNS[field]] = df[EXPORT_COLUMNS[field]].astype(object)
+        self._writer.write_table(self._pa.Table.from_pandas(df, schema=self._schema, preserve_index=False))
+        self.count += len(batch)
+
+    def _flush(self) -> None:
+        if self._buffer:
+            table = self._pa.Table.from_pylist(self._buffer, schema=self._schema)
+            self._writer.write_table(table)
+            self._buffer = []
+
+    def close(self) -> None:
+        self._flush()
+        self._writer.close()
+
+
+_WRITERS = {
+    "jsonl": JsonlInvoiceWriter,
+    "csv": CsvInvoiceWriter,
+    "xlsx": ExcelInvoiceWriter,
+    "parquet": ParquetInvoiceWriter,
+}
+
+# 导出格式 -> (扩展名, MIME类型)，供界面下载使用
+EXPORT_MIME_TYPES = {
+    "jsonl": ("jsonl", "application/x-ndjson"),
+    "csv": ("csv", "text/csv"),
+    "xlsx": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "parquet": ("parquet", "application/vnd.apache.parquet"),
+}
+
+
+def open_invoice_writer(target: Union[str, Path, BinaryIO], fmt: Optional[str] = None,
+                        include_error: bool = True) -> InvoiceWriter:
+    """
+    按格式创建流式写出器
+
+    Args:
+        target: 输出文件路径或二进制文件对象
+        fmt: 输出格式，默认根据扩展名推断（jsonl/csv/xlsx/parquet），target 为文件对象时必须指定
+        include_error: 是否输出“错误信息”列
+
+    Returns:
+        InvoiceWriter: 写出器实例
+
+    Raises:
+        ValueError: 格式不支持
+    """
+    if fmt is None and isinstance(target, (str, Path)):
+        fmt = Path(target).suffix.lstrip(".")
+    fmt = (fmt or "").lower()
+    if fmt == "json":
+        fmt = "jsonl"
+    if fmt not in _WRITERS:
+        raise ValueError(f"不支持的导出格式: {fmt}，可选: {', '.join(EXPORT_FORMATS)}")
+    return _WRITERS[fmt](target, include_error)
+
+
+def export_invoices(invoices: Iterable[Invoice], fmt: str, include_error: bool = True,
+                    chunk_size: int = 5000, spool_size: int = 8 * 1024 * 1024) -> SpooledTemporaryFile:
+    """
+    分块导出到临时文件
+
+    每 chunk_size 张发票转换为一个列式批次写出，内存中只保留一块；输出先写在内存中，
+    超过 spool_size 字节后自动转存到磁盘临时文件。
+
+    Args:
+        invoices: 发票（可以是逐块读取的结果库批次或生成器）
+        fmt: 导出格式（见 EXPORT_FORMATS）
+        include_error: 是否输出“错误信息”列
+        chunk_size: 每块张数
+        spool_size: 内存缓冲上限（字节）
+
+    Returns:
+        SpooledTemporaryFile: 已写完并定位到开头的文件，由调用方关闭
+    """
+    spool = SpooledTemporaryFile(max_size=spool_size)
+    invoices = iter(invoices)
+    with open_invoice_writer(spool, fmt, include_error) as writer:
+        while chunk := list(islice(invoices, chunk_size)):
+            writer.write_batch(InvoiceBatch.from_invoices(chunk, keep_raw_text=False))
+    spool.seek(0)
+    return spool
@@ -1,32 +1,34 @@
 # utils/file_utils.py
 import pdfplumber
 from PIL import Image
-from typing import List, Union
+from typing import TYPE_CHECKING, List, Union
 import pytesseract
 import io
 from models import Invoice
-from streamlit.runtime.uploaded_file_manager import UploadedFile
-from extractors import LLMExtractor, VLMExtractor
 from config import logger
 
+if TYPE_CHECKING:  # 仅用于类型标注，命令行等非UI场景不加载streamlit
+    from streamlit.runtime.uploaded_file_manager import UploadedFile
+
 # 新增多模态处理函数
 def extract_text_from_file(file) -> str:
     """支持PDF/图片的通用文本提取"""
-    if file.type == "application/pdf":
+    content_type = getattr(file, "type", None) or ""
+    if content_type == "application/pdf":
         return extract_text_from_pdf(file)
-    elif file.type.startswith("image/"):
+    elif content_type.startswith("image/"):
         return extract_text_from_image(file)
     else:
-        raise ValueError(f"不支持的格式: {file.type}")
+        raise ValueError(f"不支持的格式: {content_type or '未知'}")
     
 def extract_text_from_pdf(file) -> str:
     with pdfplumber.open(file) as pdf:
         return "".join(page.extract_text() or "" for page in pdf.pages)
 
-def extract_text_from_image(file) -> str:
+def extract_text_from_image(file, lang: str = 'chi_sim') -> str:
     """图片OCR提取"""
     image = Image.open(io.BytesIO(file.read()))
-    return pytesseract.image_to_string(image)
+    return pytesseract.image_to_string(image, lang=lang)
 
 def extract_visual_features(file, vl_model) -> dict:
     """使用VL模型提取视觉特征"""
@@ -52,7 +54,7 @@ def convert_pdf_to_images(file, dpi=200):
     )
 
 def process_files(
-    files: List[UploadedFile],
+    files: List["UploadedFile"],
     extractor,
     vl_model=None,
     use_visual: bool = False
@@ -84,43 +86,29 @@ def process_files(
     return results
 
 def process_pdf_files(files, extractor) -> List[Invoice]:
-    results = []
-    for file in files:
-        try:
-            ftext = file if isinstance(extractor, VLMExtractor) else extract_text_from_pdf(file)
-            invoice = extractor.extract(ftext)
-            invoice.file_name = file.name
-            invoice.raw_text = ftext[:500] + "..." if len(ftext) > 500 else ftext
-            results.append(invoice)
-        except Exception as e:
-            results.append(Invoice(file_name=file.name, error=str(e)))
-    return results
+    """批量处理PDF文件（委托并发批处理引擎，结果保持上传顺序）"""
+    from .batch_utils import extract_batch
+    return extract_batch(files, extractor)
 
 def process_image_files(
-    files: List[UploadedFile],
+    files: List["UploadedFile"],
     extractor,
     vl_model=None
     ) -> List[Invoice]:
     """处理上传的图片文件"""
+    if not vl_model:
+        # 文本提取器走OCR，VLM直接识别图片
+        from .batch_utils import extract_batch
+        return extract_batch(files, extractor)
+
     invoices = []
     for uploaded_file in files:
         try:
-            if isinstance(extractor, LLMExtractor):
-                image = Image.open(uploaded_file)
-                if vl_model:
-                    visual_data = vl_model.process_images([image])
-                    invoice = extractor.extract_from_visual(visual_data)
-                else:
-                    # 备用：使用OCR提取文本
-                    text = pytesseract.image_to_string(image, lang='chi_sim')
-                    invoice = extractor.extract(text)
-                    
-                invoice.file_name = uploaded_file.name
-                invoices.append(invoice)
-            else:
-                invoice = extractor.extract(uploaded_file)
-                invoice.file_name = uploaded_file.name
-                invoices.append(invoice)
+            image = Image.open(uploaded_file)
+            visual_data = vl_model.process_images([image])
+            invoice = extractor.extract_from_visual(visual_data)
+            invoice.file_name = uploaded_file.name
+            invoices.append(invoice)
         except Exception as e:
             logger.error(f"处理图片 {uploaded_file.name} 失败: {str(e)}")
             invoices.append(Invoice(file_name=uploaded_file.name, error=str(e)))
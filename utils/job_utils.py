@@ -0,0 +1,447 @@
+# utils/job_utils.py
+import multiprocessing
+import shutil
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from config import BATCH_CONFIG, CACHE_CONFIG, logger
+from extractors import CascadeExtractor, HybridExtractor, create_extractor
+from .batch_utils import BatchProgress, extract_into_store
+from .store_utils import InvoiceFilter, get_invoice_store
+
+# 未结束的任务状态
+ACTIVE_STATUSES = ("queued", "running")
+# 任务状态 -> 界面显示
+STATUS_LABELS = {
+    "queued": "排队中",
+    "running": "提取中",
+    "done": "已完成",
+    "cancelled": "已取消",
+    "failed": "失败",
+}
+JOB_FIELDS = (
+    "id", "batch_id", "mode", "model", "max_workers", "status", "total", "done", "errors",
+    "message", "error", "cancel_requested", "created_at", "started_at", "finished_at", "attempts",
+)
+# 工作进程向任务表写入进度的最短间隔（秒）
+PROGRESS_INTERVAL = 0.5
+# 工作进程异常退出（如渲染大PDF时内存不足被杀死）后任务最多执行的次数
+MAX_ATTEMPTS = 2
+
+
+@dataclass
+class Job:
+    """提取任务（jobs 表中的一行）"""
+    id: int
+    batch_id: int
+    mode: str
+    model: Optional[str]
+    max_workers: Optional[int]
+    status: str
+    total: int
+    done: int
+    errors: int
+    message: Optional[str]
+    error: Optional[str]
+    cancel_requested: int
+    created_at: float
+    started_at: Optional[float]
+    finished_at: Optional[float]
+    attempts: int
+
+    @property
+    def active(self) -> bool:
+        return self.status in ACTIVE_STATUSES
+
+    def progress(self) -> BatchProgress:
+        """换算为 BatchProgress（任务表记录的是墙钟时间，这里折算为本进程的单调时钟）"""
+        started = time.monotonic() - (time.time() - (self.started_at or time.time()))
+        if self.finished_at and self.started_at:
+            started = time.monotonic() - (self.finished_at - self.started_at)
+        return BatchProgress(total=self.total, done=self.done, errors=self.errors, started=started)
+
+    def describe(self) -> str:
+        if self.status == "queued":
+            return f"{STATUS_LABELS[self.status]}（共 {self.total} 份）"
+        return f"{STATUS_LABELS[self.status]} · {self.progress().describe()}"
+
+
+class JobQueue:
+    """
+    基于SQLite的持久化提取任务队列
+
+    上传的文件先保存到 cache_config.directory/uploads/<任务ID>/ 下，任务交给工作进程池执行，
+    结果边提取边写入结果库；界面只需按批次查询任务状态。服务重启后未完成的任务重新排队，
+    已写入结果库的文件不再重复提取。
+    """
+
+    def __init__(self, directory: str = CACHE_CONFIG.get("directory", ".cache")):
+        """
+        初始化任务队列（只打开任务表；start() 后才会启动工作进程池）
+
+        Args:
+            directory: 任务表与上传文件所在目录（默认与提取结果缓存相同）
+        """
+        path = Path(directory)
+        path.mkdir(parents=True, exist_ok=True)
+        self.db_path = path / "jobs.sqlite3"
+        self.upload_dir = path / "uploads"
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._workers = BATCH_CONFIG.get("job_workers", 2)
+        self._pool_lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY,
+                batch_id INTEGER NOT NULL,
+                mode TEXT NOT NULL,
+                model TEXT,
+                max_workers INTEGER,
+                status TEXT NOT NULL,
+                total INTEGER NOT NULL,
+                done INTEGER NOT NULL DEFAULT 0,
+                errors INTEGER NOT NULL DEFAULT 0,
+                message TEXT,
+                error TEXT,
+                cancel_requested INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                attempts INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        if "attempts" not in {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_batch ON jobs(batch_id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status)")
+        # 模型级联的累计统计（跨任务、跨进程），用于调整 cascade_config 中的顺序
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS model_stats (
+                model TEXT PRIMARY KEY,
+                calls INTEGER NOT NULL,
+                passed INTEGER NOT NULL,
+                errors INTEGER NOT NULL,
+                seconds REAL NOT NULL,
+                resolved INTEGER NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    def start(self, workers: Optional[int] = None) -> None:
+        """
+        启动工作进程池，并把上次未完成的任务重新排队
+
+        Args:
+            workers: 同时执行的任务数，默认取 batch_config.job_workers
+        """
+        self._workers = workers or self._workers
+        self._restart_executor(None)
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET status = 'queued' WHERE status = 'running'")
+            self._conn.commit()
+            pending = [row[0] for row in self._conn.execute(
+                "SELECT id FROM jobs WHERE status = 'queued' ORDER BY id"
+            )]
+        for job_id in pending:
+            self._submit(job_id)
+        if pending:
+            logger.info(f"任务队列: 恢复 {len(pending)} 个未完成的任务")
+
+    def _restart_executor(self, broken: Optional[ProcessPoolExecutor]) -> None:
+        """
+        创建工作进程池；broken 为已损坏的进程池时只在它仍是当前进程池时重建（多个任务同时发现损坏只重建一次）
+        """
+        with self._pool_lock:
+            if self._executor is not broken:
+                return
+            if broken is not None:
+                logger.warning("任务队列: 工作进程池已损坏，重新创建")
+                broken.shutdown(wait=False)
+            # spawn：不复制界面进程的线程与连接
+            self._executor = ProcessPoolExecutor(self._workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def _submit(self, job_id: int) -> None:
+        """提交任务；进程池已损坏（某个工作进程异常退出）时重建后再提交，仍失败则把任务标记为失败"""
+        for _ in range(2):
+            executor = self._executor
+            try:
+                future = executor.submit(run_job, job_id, str(self.db_path.parent))
+            except (BrokenProcessPool, RuntimeError) as e:
+                error = e
+                self._restart_executor(executor)
+                continue
+            future.add_done_callback(lambda f: self._on_worker_exit(job_id, f))
+            return
+        logger.error(f"任务 {job_id} 提交失败: {error}")
+        self.finish(job_id, "failed", error=f"提交失败: {error}")
+
+    def _on_worker_exit(self, job_id: int, future: Future) -> None:
+        """
+        工作进程异常退出（如被系统杀死）时进程池整体损坏，池中所有未完成的任务都会收到异常：
+        未开始的任务重新提交；执行中的任务重新排队续跑（已写入结果库的文件跳过），
+        执行次数达到 MAX_ATTEMPTS 的标记为失败
+        """
+        if future.cancelled() or future.exception() is None:
+            return
+        logger.error(f"任务 {job_id} 的工作进程异常退出: {future.exception()}")
+        job = self.get(job_id)
+        if job is None or not job.active:
+            return
+        if job.attempts >= MAX_ATTEMPTS:
+            self.finish(job_id, "failed", error=f"工作进程异常退出: {future.exception()}")
+            return
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET status = 'queued' WHERE id = ? AND status = 'running'", (job_id,))
+            self._conn.commit()
+        self._submit(job_id)
+
+    def enqueue(self, files: List, mode: str, model: Optional[str] = None,
+                max_workers: Optional[int] = None, label: Optional[str] = None, owner: Optional[str] = None) -> Job:
+        """
+        保存上传文件并创建任务
+
+        Args:
+            files: 上传的文件对象（有 name 与 getvalue()）或文件路径
+            mode: 提取模式（见 extractors.factory.EXTRACTION_MODES）
+            model: 模型名称
+            max_workers: 任务内的模型调用并发数
+            label: 批次说明
+            owner: 批次归属（见 InvoiceStore.create_batch）
+
+        Returns:
+            Job: 新任务（结果批次已创建，可立即按批次ID查看）
+        """
+        batch_id = get_invoice_store().create_batch(label, owner)
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO jobs (batch_id, mode, model, max_workers, status, total, created_at) "
+                "VALUES (?, ?, ?, ?, 'queued', ?, ?)",
+                (batch_id, mode, model, max_workers, len(files), time.time())
+            )
+            self._conn.commit()
+        job_id = cursor.lastrowid
+        # 每个文件一个子目录，保留原文件名（同名文件互不覆盖）
+        for position, file in enumerate(files):
+            target = self.upload_dir / str(job_id) / f"{position:06d}"
+            target.mkdir(parents=True, exist_ok=True)
+            if isinstance(file, (str, Path)):
+                shutil.copyfile(file, target / Path(file).name)
+            else:
+                (target / Path(file.name).name).write_bytes(file.getvalue())
+        if self._executor is not None:
+            self._submit(job_id)
+        logger.info(f"任务队列: 任务 {job_id}（批次 {batch_id}）已排队，共 {len(files)} 个文件")
+        return self.get(job_id)
+
+    def job_files(self, job_id: int) -> List[Tuple[int, Optional[Path]]]:
+        """任务的上传文件：(上传顺序序号, 路径)，文件已被清理的序号路径为None"""
+        root = self.upload_dir / str(job_id)
+        if not root.exists():
+            return []
+        return [(int(folder.name), next(folder.iterdir(), None)) for folder in sorted(root.iterdir())]
+
+    def get(self, job_id: int) -> Optional[Job]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(JOB_FIELDS)} FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return Job(*row) if row else None
+
+    def job_for_batch(self, batch_id: int) -> Optional[Job]:
+        """批次对应的任务（直接写入结果库的批次没有任务，返回None）"""
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(JOB_FIELDS)} FROM jobs WHERE batch_id = ? ORDER BY id DESC LIMIT 1",
+                (batch_id,)
+            ).fetchone()
+        return Job(*row) if row else None
+
+    def cancel(self, job_id: int) -> None:
+        """请求取消：排队中的任务直接取消，执行中的任务由工作进程在下一次写入进度时停止"""
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ?", (job_id,))
+            self._conn.commit()
+        self.finish(job_id, "cancelled", only_if=("queued",))
+
+    def mark_running(self, job_id: int) -> bool:
+        """工作进程开始执行任务，任务已结束（如排队时被取消）时返回False"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = 'running', started_at = COALESCE(started_at, ?), attempts = attempts + 1 "
+                "WHERE id = ? AND status IN ('queued', 'running')",
+                (time.time(), job_id)
+            )
+            self._conn.commit()
+        return cursor.rowcount > 0
+
+    def update_progress(self, job_id: int, done: int, errors: int) -> bool:
+        """写入进度，返回是否已请求取消"""
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET done = ?, errors = ? WHERE id = ?", (done, errors, job_id))
+            self._conn.commit()
+            return bool(self._conn.execute(
+                "SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()[0])
+
+    def finish(self, job_id: int, status: str, message: Optional[str] = None,
+               error: Optional[str] = None, only_if: Tuple[str, ...] = ACTIVE_STATUSES) -> None:
+        """
+        结束任务并删除其上传文件
+
+        Args:
+            job_id: 任务ID
+            status: done / cancelled / failed
+            message: 结束说明（如分级提取统计）
+            error: 失败原因
+            only_if: 只在任务处于这些状态时更新
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                f"UPDATE jobs SET status = ?, message = ?, error = ?, finished_at = ? "
+                f"WHERE id = ? AND status IN ({','.join('?' * len(only_if))})",
+                (status, message, error, time.time(), job_id, *only_if)
+            )
+            self._conn.commit()
+        if cursor.rowcount:
+            shutil.rmtree(self.upload_dir / str(job_id), ignore_errors=True)
+
+    def stats(self) -> Dict[str, int]:
+        """各状态的任务数"""
+        with self._lock:
+            return dict(self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+    def record_model_stats(self, models: List[Dict]) -> None:
+        """累加一次任务的级联统计（CascadeExtractor.model_stats()["models"]）"""
+        rows = [(m["model"], m["calls"], m["passed"], m["errors"], m["seconds"], m["resolved"], time.time())
+                for m in models if m["calls"]]
+        with self._lock:
+            self._conn.executemany("""
+                INSERT INTO model_stats (model, calls, passed, errors, seconds, resolved, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(model) DO UPDATE SET
+                    calls = calls + excluded.calls, passed = passed + excluded.passed,
+                    errors = errors + excluded.errors, seconds = seconds + excluded.seconds,
+                    resolved = resolved + excluded.resolved, updated_at = excluded.updated_at
+            """, rows)
+            self._conn.commit()
+
+    def model_stats(self) -> List[Dict]:
+        """
+        各模型的累计级联统计
+
+        Returns:
+            List[Dict]: model、calls、passed、errors、seconds、resolved、pass_rate（通过率）、
+                        mean_seconds（平均耗时），按平均耗时从小到大排列
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT model, calls, passed, errors, seconds, resolved FROM model_stats "
+                "ORDER BY seconds / calls"
+            ).fetchall()
+        return [
+            {"model": model, "calls": calls, "passed": passed, "errors": errors, "seconds": seconds,
+             "resolved": resolved, "pass_rate": passed / calls, "mean_seconds": seconds / calls}
+            for model, calls, passed, errors, seconds, resolved in rows
+        ]
+
+
+def _summarize(queue: JobQueue, extractor) -> Optional[str]:
+    """任务结束时的提取统计说明；模型级联的统计同时累加到 model_stats 表"""
+    if isinstance(extractor, HybridExtractor) and extractor.stats()["total"]:
+        stats = extractor.stats()
+        return (f"分级提取：{stats['regex_only']}/{stats['total']} 份仅用正则完成，"
+                f"{stats['model_avoided_ratio']:.1%} 免调用大模型")
+    if isinstance(extractor, CascadeExtractor) and extractor.model_stats()["total"]:
+        stats = extractor.model_stats()
+        queue.record_model_stats(stats["models"])
+        levels = " · ".join(f"{m['model']} 完成 {m['resolved']}（平均 {m['mean_seconds']:.1f} 秒）"
+                            for m in stats["models"] if m["calls"])
+        return f"模型级联：{levels} · 均未通过校验 {stats['unresolved']}"
+    return None
+
+
+# 工作进程内按 (模式, 模型) 复用提取器（连接池随之复用）
+_worker_extractors: Dict[Tuple[str, Optional[str]], object] = {}
+# 工作进程内按目录复用任务队列（同一个数据库连接）
+_worker_queues: Dict[str, JobQueue] = {}
+
+
+def run_job(job_id: int, directory: str) -> None:
+    """
+    工作进程入口：执行一个提取任务
+
+    已写入结果库的文件（上次执行中断前完成的）跳过；每隔 PROGRESS_INTERVAL 秒或每写入一组结果
+    更新一次进度，发现取消请求时停止调度剩余文件，已完成的结果保留。
+    未完成文件的上传目录已被清理时任务标记为失败。
+    """
+    if directory not in _worker_queues:
+        _worker_queues[directory] = JobQueue(directory)
+    queue = _worker_queues[directory]
+    job = queue.get(job_id)
+    if job is None or job.cancel_requested or not queue.mark_running(job_id):
+        queue.finish(job_id, "cancelled")
+        return
+    store = get_invoice_store()
+    try:
+        key = (job.mode, job.model)
+        if key not in _worker_extractors:
+            _worker_extractors[key] = create_extractor(job.mode, job.model)
+        extractor = _worker_extractors[key]
+        if isinstance(extractor, (HybridExtractor, CascadeExtractor)):
+            extractor.reset_stats()
+
+        stored = store.positions(job.batch_id)
+        remaining = [(position, path) for position, path in queue.job_files(job_id)
+                     if position not in stored and path is not None]
+        missing = job.total - len(stored) - len(remaining)
+        if missing > 0:
+            queue.finish(job_id, "failed", error=f"{missing} 个未完成文件的上传文件已不存在，无法继续提取")
+            return
+        done = len(stored)
+        errors = store.count(job.batch_id, InvoiceFilter(has_error=True))
+        progress_iter = extract_into_store(
+            [path for _, path in remaining], extractor, store, job.batch_id,
+            max_workers=job.max_workers, positions=[position for position, _ in remaining]
+        )
+        last_update = 0.0
+        for progress, flushed in progress_iter:
+            if not flushed and time.monotonic() - last_update < PROGRESS_INTERVAL:
+                continue
+            last_update = time.monotonic()
+            if queue.update_progress(job_id, done + progress.done, errors + progress.errors):
+                progress_iter.close()
+                queue.update_progress(job_id, len(store.positions(job.batch_id)),
+                                      store.count(job.batch_id, InvoiceFilter(has_error=True)))
+                queue.finish(job_id, "cancelled", message=_summarize(queue, extractor))
+                logger.info(f"任务 {job_id} 已取消，保留已完成的 {done + progress.done} 个文件")
+                return
+
+        queue.update_progress(job_id, len(store.positions(job.batch_id)),
+                              store.count(job.batch_id, InvoiceFilter(has_error=True)))
+        queue.finish(job_id, "done", message=_summarize(queue, extractor))
+    except Exception as e:
+        logger.exception(f"任务 {job_id} 执行失败")
+        queue.finish(job_id, "failed", error=str(e))
+
+
+_queue: Optional[JobQueue] = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    """获取界面进程的任务队列（首次调用时启动工作进程池并恢复未完成的任务）"""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = JobQueue()
+            _queue.start()
+        return _queue
@@ -1,11 +1,12 @@
 import json
-from typing import Union, List, Dict
+import time
+from typing import Union, List, Dict, Iterator, Optional
 import openai
-from openai import OpenAI
 from config import API_CONFIG, logger
+from extractors.client_pool import get_openai_client
 from models import Invoice
-
-from urllib.parse import urljoin, urlparse
+from .context_utils import build_chat_context, context_budget
+from .store_utils import StoredBatch
 
 def preprocess_invoice_data(invoice_data: Union[Invoice, List[Invoice], Dict]) -> str:
     """将发票数据预处理为LLM可理解的文本"""
@@ -19,6 +20,30 @@ def preprocess_invoice_data(invoice_data: Union[Invoice, List[Invoice], Dict]) -
     else:
         raise ValueError(f"不支持的发票数据类型:{invoice_data}, {str(type(invoice_data))}")
 
+def build_chat_messages(
+    user_query: str,
+    invoice_data: Union[Invoice, List[Invoice]],
+    model_path: Optional[str] = None
+    ) -> List[Dict]:
+    """构造问答消息：系统提示词 + 发票数据 + 用户问题"""
+    # 准备系统提示词
+    system_prompt = """你是财务助理。"""
+    
+    # 批量发票：按问题挑选相关发票，以紧凑行写入并控制在模型token预算内
+    if isinstance(invoice_data, StoredBatch) or (
+            isinstance(invoice_data, list) and all(isinstance(inv, Invoice) for inv in invoice_data)):
+        system_prompt += "发票数据每行一张，列名见首行，以“|”分隔。"
+        context_data = build_chat_context(user_query, invoice_data, context_budget(model_path)).text
+    else:
+        context_data = preprocess_invoice_data(invoice_data)
+    
+    # 构建消息历史
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": f"发票数据：\n{context_data}"},
+        {"role": "user", "content": user_query}
+    ]
+
 def ask_llm(
     model_path: str,
     user_query: str,
@@ -38,35 +63,10 @@ def ask_llm(
         LLM生成的回复文本
     """
 
-    api_key=API_CONFIG["api_key"]
-    base_url=API_CONFIG["base_url"]
-
-    # 标准化URL（去除末尾斜杠）
-    base_url = base_url.rstrip('/')
-    # 检查是否已包含/v1
-    parsed = urlparse(base_url)
-    if not parsed.path.endswith('/v1'):
-        base_url = urljoin(base_url + '/', 'v1')
-
     try:
-        # 初始化客户端
-        client = OpenAI(
-            api_key = api_key,
-            base_url = base_url
-        )
-        
-        # 准备系统提示词
-        system_prompt = """你是财务助理。"""
-        
-        # 预处理发票数据
-        context_data = preprocess_invoice_data(invoice_data)
-        
-        # 构建消息历史
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": f"发票数据：\n{context_data}"},
-            {"role": "user", "content": user_query}
-        ]
+        # 复用进程级客户端（keep-alive连接池）
+        client = get_openai_client(API_CONFIG["base_url"], API_CONFIG["api_key"])
+        messages = build_chat_messages(user_query, invoice_data, model_path)
         
         # 调用API
         response = client.chat.completions.create(
@@ -86,3 +86,67 @@ def ask_llm(
         logger.error(f"LLM处理异常: {str(e)}")
         return "系统处理问题时出错，请稍后再试"
 
+
+def ask_llm_stream(
+    model_path: str,
+    user_query: str,
+    invoice_data: Union[Invoice, List[Invoice]],
+    temperature: float = 0.3
+    ) -> Iterator[str]:
+    """
+    向LLM发送查询并逐段返回回复（流式）
+    
+    参数:
+        model_path: 模型标识
+        user_query: 用户问题
+        invoice_data: 单张或多张发票数据
+        temperature: 生成温度
+    
+    返回:
+        逐段产出的回复文本；出错时产出错误提示
+    """
+    try:
+        client = get_openai_client(API_CONFIG["base_url"], API_CONFIG["api_key"])
+        stream = client.chat.completions.create(
+            model=model_path,
+            messages=build_chat_messages(user_query, invoice_data, model_path),
+            temperature=temperature,
+            stream=True
+        )
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+        
+    except openai.APIError as e:
+        logger.error(f"API调用失败: {str(e)}")
+        yield f"查询失败：{e.message}"
+    except Exception as e:
+        logger.error(f"LLM处理异常: {str(e)}")
+        yield "系统处理问题时出错，请稍后再试"
+
+class TimedStream:
+    """
+    包装流式回复，记录首字延迟（time to first token）与总耗时
+
+        stream = TimedStream(ask_llm_stream(...))
+        text = "".join(stream)
+        stream.ttft, stream.total
+    """
+
+    def __init__(self, chunks: Iterator[str]):
+        self._chunks = chunks
+        self.start = time.perf_counter()
+        self.ttft: Optional[float] = None
+        self.total: Optional[float] = None
+        self.chunk_count = 0
+
+    def __iter__(self) -> Iterator[str]:
+        for chunk in self._chunks:
+            if self.ttft is None:
+                self.ttft = time.perf_counter() - self.start
+            self.chunk_count += 1
+            yield chunk
+        self.total = time.perf_counter() - self.start
+
+    def metrics(self) -> Dict:
+        return {"ttft": self.ttft, "total": self.total, "chunks": self.chunk_count}
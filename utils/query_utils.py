@@ -0,0 +1,455 @@
+# utils/query_utils.py
+import re
+import time
+from dataclasses import dataclass, field
+from datetime import date
+from typing import List, Optional, Tuple
+
+import pandas as pd
+
+from config import logger
+from models import Invoice
+from .store_utils import BatchCache, InvoiceFilter, StoredBatch
+
+# 指标 -> 触发词（按顺序匹配，先匹配到的优先）
+METRIC_KEYWORDS = (
+    ("avg", ("平均", "均值")),
+    ("max", ("最高", "最大", "最多的一张", "最贵")),
+    ("min", ("最低", "最小", "最便宜")),
+    ("count", ("多少张", "几张", "张数", "数量", "多少份", "几份", "多少个", "几个")),
+    ("sum", ("合计", "总计", "总额", "总共", "一共", "共计", "汇总", "多少钱", "求和", "总和", "加起来")),
+    ("list", ("列出", "哪些", "明细", "清单", "列表")),
+)
+# 金额字段 -> 触发词
+FIELD_KEYWORDS = (
+    ("tax_amount", ("税额", "税金", "税款")),
+    ("total_amount", ("价税合计", "含税")),
+    ("amount", ("不含税", "金额")),
+)
+# 核对/解释类问题交给大模型（如“检查数量是否正确”中的“数量”不是计数）
+CHECK_KEYWORDS = ("检查", "核对", "核实", "校验", "是否正确", "对不对", "有没有问题", "是否一致", "为什么")
+GROUP_KEYWORDS = (
+    ("seller", ("按销方", "各销方", "每个销方", "按销售方", "每家销售方", "按供应商", "各供应商")),
+    ("buyer", ("按购方", "各购方", "每个购方", "按购买方", "按抬头")),
+    ("item_category", ("按项目", "各项目", "按类别", "各类别", "按类型", "每类")),
+    ("month", ("按月", "每月", "各月", "每个月", "月度")),
+)
+FIELD_LABELS = {"amount": "金额", "tax_amount": "税额", "total_amount": "价税合计"}
+GROUP_LABELS = {"seller": "销方", "buyer": "购方", "item_category": "项目类别", "month": "月份"}
+IDENTITY_LABELS = {"invoice_number": "发票号码", "file_name": "文件"}
+METRIC_LABELS = {"sum": "合计", "avg": "平均", "max": "最高", "min": "最低", "count": "张数"}
+
+AMOUNT_FILTER_RE = re.compile(
+    r"(超过|大于|高于|多于|不低于|不少于|至少|>=|>|低于|小于|少于|不超过|不高于|至多|<=|<)\s*[¥￥]?\s*(\d+(?:\.\d+)?)\s*(?:元|块)?"
+    r"|[¥￥]?\s*(\d+(?:\.\d+)?)\s*(?:元|块)?\s*(以上|以下)"
+)
+MONTH_RANGE_RE = re.compile(
+    r"(?:(\d{4})\s*年\s*)?(\d{1,2})\s*月?\s*(?:到|至|-|~|—)\s*(?:(\d{4})\s*年\s*)?(\d{1,2})\s*月"
+)
+MONTH_RE = re.compile(r"(?:(\d{4})\s*年\s*)?(\d{1,2})\s*月份?")
+YEAR_RE = re.compile(r"(\d{4})\s*年")
+DATE_RE = re.compile(r"(\d{4})[-/年](\d{1,2})[-/月](\d{1,2})日?")
+# 紧跟在日期/月份后的开区间说法：之后为起始日期，之前为截止日期（均含当天/当月）
+OPEN_BOUND_RE = re.compile(r"\s*(以后|之后|以来|起|以前|之前)")
+AFTER_WORDS = {"以后", "之后", "以来", "起"}
+CJK_RUN_RE = re.compile(r"[\u4e00-\u9fff]{4,}")
+ITEM_RE = re.compile(r"\*([^*]+)\*+(.+)")
+# 问题中的发票号码（数电票20位，旧版发票号码8位）
+INVOICE_NUMBER_RE = re.compile(r"\d{8,20}")
+# 文件名主干至少这么长才按主干匹配（避免“1.pdf”之类的短名误匹配）
+MIN_STEM_LENGTH = 6
+
+LOWER_OPS = {"低于", "小于", "少于", "不超过", "不高于", "至多", "<=", "<", "以下"}
+INCLUSIVE_OPS = {"不低于", "不少于", "至少", ">=", "不超过", "不高于", "至多", "<="}
+
+
+@dataclass
+class QuerySpec:
+    """结构化查询：在 filters 过滤后的发票上按 group_by 分组计算 metric(column)"""
+    metric: str                                   # sum / avg / max / min / count / list
+    column: str = "total_amount"                  # amount / tax_amount / total_amount
+    group_by: Optional[str] = None                # seller / buyer / item_category / month
+    filters: List[Tuple[str, str, object]] = field(default_factory=list)  # (列, 运算, 值)
+
+    def describe(self) -> str:
+        """查询条件的中文说明，随答案一起展示"""
+        parts = []
+        for column, op, value in self.filters:
+            if op == "contains":
+                parts.append(f"{GROUP_LABELS.get(column, '项目')}包含“{value}”")
+            elif op == "contains_any":
+                parts.append(f"购方或销方包含“{value}”")
+            elif op == "in":
+                parts.append(f"{IDENTITY_LABELS[column]}为 {'、'.join(value)}")
+            elif op == "between":
+                parts.append(f"开票日期 {value[0].isoformat()} 至 {value[1].isoformat()}")
+            elif column == "issue_date":
+                parts.append(f"开票日期 {op} {value.isoformat()}")
+            else:
+                parts.append(f"{FIELD_LABELS[column]} {op} {value:g}")
+        if self.group_by:
+            parts.append(f"按{GROUP_LABELS[self.group_by]}分组")
+        return "；".join(parts) or "全部发票"
+
+
+def invoices_frame(invoices: List[Invoice]) -> pd.DataFrame:
+    """成功提取的发票转换为DataFrame（日期统一为datetime64，金额为float）"""
+    rows = []
+    for inv in invoices:
+        if inv.error:
+            continue
+        item = ITEM_RE.match(inv.item_name or "")
+        issue_date = inv.parsed_issue_date()
+        rows.append({
+            "file_name": inv.file_name,
+            "invoice_number": inv.invoice_number,
+            "issue_date": pd.Timestamp(issue_date) if issue_date else pd.NaT,
+            "buyer": inv.buyer or "",
+            "seller": inv.seller or "",
+            "item_name": inv.item_name or "",
+            "item_category": item.group(1) if item else (inv.item_name or ""),
+            "amount": inv.amount,
+            "tax_amount": inv.tax_amount,
+            "total_amount": inv.total_amount,
+        })
+    df = pd.DataFrame(rows, columns=[
+        "file_name", "invoice_number", "issue_date", "buyer", "seller",
+        "item_name", "item_category", "amount", "tax_amount", "total_amount",
+    ])
+    df["issue_date"] = pd.to_datetime(df["issue_date"])
+    for column in FIELD_LABELS:
+        df[column] = pd.to_numeric(df[column], errors="coerce")
+    df["month"] = df["issue_date"].dt.strftime("%Y-%m")
+    return df
+
+
+def _build_frame(invoices: List[Invoice]) -> pd.DataFrame:
+    rows = invoices.iter_invoices(InvoiceFilter(has_error=False), keep_raw_text=False) \
+        if isinstance(invoices, StoredBatch) else invoices
+    return invoices_frame(rows)
+
+
+_frame_cache = BatchCache(_build_frame)
+
+
+def get_invoices_frame(invoices: List[Invoice]) -> pd.DataFrame:
+    """
+    同一批次复用已构建的DataFrame（按批次缓存，见 BatchCache）
+
+    结果库批次在首次提问时才从库中逐块读取成功提取的发票（不读取原文）。
+    """
+    return _frame_cache.get(invoices)
+
+
+def _first_match(question: str, table) -> Optional[str]:
+    for key, keywords in table:
+        if any(word in question for word in keywords):
+            return key
+    return None
+
+
+def _mask_fields(question: str) -> str:
+    """去掉问题中的金额字段名，避免“价税合计”中的“合计”被当作求和"""
+    for word in sorted((w for _, words in FIELD_KEYWORDS for w in words), key=len, reverse=True):
+        question = question.replace(word, "|")
+    return question
+
+
+def _identity_filters(question: str, df: pd.DataFrame) -> Optional[List[Tuple[str, str, object]]]:
+    """
+    问题中点名的发票号码与文件名
+
+    Returns:
+        Optional[List[Tuple[str, str, object]]]: 筛选条件；问题中的发票号码不在批次中时返回None
+    """
+    filters = []
+    numbers = INVOICE_NUMBER_RE.findall(question)
+    if numbers:
+        found = [n for n in dict.fromkeys(numbers) if df["invoice_number"].eq(n).any()]
+        if len(found) < len(set(numbers)):
+            return None
+        filters.append(("invoice_number", "in", found))
+    names = [name for name in df["file_name"].dropna().unique()
+             if name and (name in question or (len(name.rsplit(".", 1)[0]) >= MIN_STEM_LENGTH
+                                               and name.rsplit(".", 1)[0] in question))]
+    if names:
+        filters.append(("file_name", "in", names))
+    return filters
+
+
+def _month_range(start_year: Optional[int], start: int, end_year: Optional[int], end: int,
+                 years: List[int]) -> Tuple[date, date]:
+    """
+    月份区间转换为日期区间
+
+    未写年份时取批次中最新的年份；只写了起始年份且截止月份小于起始月份时（“2025年12月到2月”）跨到下一年。
+
+    Raises:
+        ValueError: 月份不在1-12之间
+    """
+    start_year = start_year or end_year or (max(years) if years else date.today().year)
+    if end_year is None:
+        end_year = start_year + 1 if end < start else start_year
+    if not (1 <= start <= 12 and 1 <= end <= 12):
+        raise ValueError(f"无效的月份: {start}-{end}")
+    last = pd.Timestamp(year=end_year, month=end, day=1) + pd.offsets.MonthEnd(0)
+    return date(start_year, start, 1), last.date()
+
+
+def _open_bound(question: str, match: re.Match, first: date, last: date) -> Optional[Tuple[str, date]]:
+    """日期/月份后紧跟“以后/之前”等词时返回 (运算, 日期)，否则返回None"""
+    bound = OPEN_BOUND_RE.match(question, match.end())
+    if bound is None:
+        return None
+    return (">=", first) if bound.group(1) in AFTER_WORDS else ("<=", last)
+
+
+def _date_filters(question: str, years: List[int]) -> List[Tuple[str, str, object]]:
+    """
+    问题中的开票日期条件：日期区间、单个日期、月份区间、单月、年份，以及其后的“以后/之前”
+
+    Raises:
+        ValueError: 日期或月份不存在（如2月30日、13月）
+    """
+    if matches := list(DATE_RE.finditer(question)):
+        days = sorted(date(*map(int, match.groups())) for match in matches)
+        if len(matches) == 1 and (bound := _open_bound(question, matches[0], days[0], days[0])):
+            return [("issue_date", *bound)]
+        return [("issue_date", "between", (days[0], days[-1]))]
+    if match := MONTH_RANGE_RE.search(question):
+        start_year, start, end_year, end = match.groups()
+        return [("issue_date", "between", _month_range(
+            int(start_year) if start_year else None, int(start),
+            int(end_year) if end_year else None, int(end), years))]
+    if match := MONTH_RE.search(question):
+        year, month = match.groups()
+        year = int(year) if year else None
+        first, last = _month_range(year, int(month), year, int(month), years)
+        if bound := _open_bound(question, match, first, last):
+            return [("issue_date", *bound)]
+        return [("issue_date", "between", (first, last))]
+    if match := YEAR_RE.search(question):
+        year = int(match.group(1))
+        first, last = date(year, 1, 1), date(year, 12, 31)
+        if bound := _open_bound(question, match, first, last):
+            return [("issue_date", *bound)]
+        return [("issue_date", "between", (first, last))]
+    return []
+
+
+def _entity_filters(question: str, df: pd.DataFrame) -> List[Tuple[str, str, object]]:
+    """问题中出现的项目类别与企业名称（至少4个连续汉字与名称重合）"""
+    filters = []
+    for category in df["item_category"].dropna().unique():
+        short = category[:-2] if category.endswith("服务") and len(category) > 3 else category
+        if len(short) >= 2 and short in question:
+            filters.append(("item_category", "contains", short))
+            break
+
+    windows = set()
+    for run in CJK_RUN_RE.findall(question):
+        for size in range(len(run), 3, -1):
+            windows.update(run[i:i + size] for i in range(len(run) - size + 1))
+    if not windows:
+        return filters
+
+    def best(column: str) -> Optional[str]:
+        names = df[column].dropna().unique()
+        for window in sorted(windows, key=len, reverse=True):
+            if any(window in name for name in names):
+                return window
+        return None
+
+    seller, buyer = best("seller"), best("buyer")
+    wants_seller = any(word in question for word in ("销方", "销售方", "卖方", "供应商", "开票方"))
+    wants_buyer = any(word in question for word in ("购方", "购买方", "买方", "抬头"))
+    if seller and (wants_seller or not buyer or len(seller) > len(buyer)):
+        filters.append(("seller", "contains", seller))
+    elif buyer and (wants_buyer or not seller or len(buyer) > len(seller)):
+        filters.append(("buyer", "contains", buyer))
+    elif seller:
+        filters.append(("party", "contains_any", seller))
+    return filters
+
+
+def parse_query(question: str, df: pd.DataFrame) -> Optional[QuerySpec]:
+    """
+    规则解析聚合类问题，无法识别为聚合/筛选时返回None（交给大模型自由回答）
+
+    字段名（如“价税合计”）先于指标词识别；核对类问题、只点名一张发票的问题也返回None。
+
+    Args:
+        question: 用户问题
+        df: invoices_frame() 的结果，用于识别问题中的企业与项目名称
+
+    Returns:
+        Optional[QuerySpec]: 结构化查询
+
+    Raises:
+        ValueError: 问题中的日期或月份不存在
+    """
+    question = question.strip()
+    if any(word in question for word in CHECK_KEYWORDS):
+        return None
+    metric = _first_match(_mask_fields(question), METRIC_KEYWORDS)
+    group_by = _first_match(question, GROUP_KEYWORDS)
+    if metric is None and group_by is None:
+        return None
+    identity = _identity_filters(question, df)
+    # 问的是某一张发票（或批次中没有的发票号码）：由大模型结合发票内容回答
+    if identity is None or (identity and _select(df, identity).sum() <= 1):
+        return None
+    spec = QuerySpec(
+        metric=metric or "sum",
+        column=_first_match(question, FIELD_KEYWORDS) or "total_amount",
+        group_by=group_by,
+        filters=identity,
+    )
+
+    years = sorted({int(y) for y in df["issue_date"].dt.year.dropna()})
+    spec.filters.extend(_date_filters(question, years))
+
+    for op, value, value_before, op_after in AMOUNT_FILTER_RE.findall(question):
+        op, value = (op, value) if op else (op_after, value_before)
+        symbol = ("<" if op in LOWER_OPS else ">") + ("=" if op in INCLUSIVE_OPS else "")
+        spec.filters.append((spec.column if spec.column != "tax_amount" else "total_amount", symbol, float(value)))
+
+    spec.filters.extend(_entity_filters(question, df))
+    return spec
+
+
+def _select(df: pd.DataFrame, filters: List[Tuple[str, str, object]]) -> pd.Series:
+    """筛选条件转换为行掩码"""
+    mask = pd.Series(True, index=df.index)
+    for column, op, value in filters:
+        if op == "between":
+            mask &= df["issue_date"].between(pd.Timestamp(value[0]), pd.Timestamp(value[1]))
+        elif op == "contains":
+            mask &= df[column].str.contains(value, regex=False, na=False)
+        elif op == "contains_any":
+            mask &= (df["seller"].str.contains(value, regex=False, na=False)
+                     | df["buyer"].str.contains(value, regex=False, na=False))
+        elif op == "in":
+            mask &= df[column].isin(value)
+        else:
+            series = df[column]
+            if column == "issue_date":
+                value = pd.Timestamp(value)
+            mask &= {">": series > value, ">=": series >= value,
+                     "<": series < value, "<=": series <= value}[op]
+    return mask
+
+
+def run_query(spec: QuerySpec, df: pd.DataFrame):
+    """
+    在DataFrame上执行结构化查询
+
+    Returns:
+        过滤后的DataFrame（list）、分组结果Series（group_by）或标量
+    """
+    selected = df[_select(df, spec.filters)]
+
+    if spec.metric == "list":
+        return selected
+    if spec.group_by:
+        grouped = selected.groupby(spec.group_by)[spec.column]
+        result = grouped.size() if spec.metric == "count" else getattr(grouped, spec.metric if spec.metric != "avg" else "mean")()
+        return result.sort_values(ascending=spec.metric == "min")
+    if spec.metric == "count":
+        return len(selected)
+    values = selected[spec.column].dropna()
+    if values.empty:
+        return None
+    if spec.metric == "sum":
+        return round(values.sum(), 2)
+    if spec.metric == "avg":
+        return round(values.mean(), 2)
+    row = selected.loc[values.idxmax() if spec.metric == "max" else values.idxmin()]
+    return row
+
+
+def _metric_label(spec: QuerySpec) -> str:
+    if spec.metric == "count":
+        return METRIC_LABELS["count"]
+    label = FIELD_LABELS[spec.column]
+    # 避免“价税合计合计”
+    return label if spec.metric == "sum" and label.endswith("合计") else label + METRIC_LABELS[spec.metric]
+
+
+def _money(value) -> str:
+    return f"¥{value:,.2f}"
+
+
+def _markdown_table(headers: List[str], rows: List[List[str]]) -> str:
+    lines = ["| " + " | ".join(headers) + " |", "|" + "---|" * len(headers)]
+    lines += ["| " + " | ".join(row) + " |" for row in rows]
+    return "\n".join(lines)
+
+
+def format_answer(spec: QuerySpec, result, max_rows: int = 50) -> str:
+    """查询结果格式化为Markdown"""
+    label = FIELD_LABELS[spec.column]
+    header = f"**查询条件**：{spec.describe()}\n\n"
+
+    if spec.metric == "list":
+        rows = [[r.file_name, r.invoice_number or "", r.issue_date.strftime("%Y-%m-%d") if pd.notna(r.issue_date) else "",
+                 r.seller, r.item_name, _money(r.total_amount) if pd.notna(r.total_amount) else ""]
+                for r in result.head(max_rows).itertuples()]
+        body = f"共 {len(result)} 张发票，价税合计 {_money(result['total_amount'].sum())}\n\n"
+        if rows:
+            body += _markdown_table(["文件", "发票号码", "开票日期", "销方", "项目", "价税合计"], rows)
+        if len(result) > max_rows:
+            body += f"\n\n（仅显示前 {max_rows} 张）"
+        return header + body
+    if spec.group_by:
+        rows = [[str(key), str(int(value)) if spec.metric == "count" else _money(value)]
+                for key, value in result.head(max_rows).items()]
+        if not rows:
+            return header + "没有符合条件的发票"
+        return header + _markdown_table([GROUP_LABELS[spec.group_by], _metric_label(spec)], rows)
+    if spec.metric == "count":
+        return header + f"共 **{result}** 张发票"
+    if result is None:
+        return header + "没有符合条件的发票"
+    if spec.metric in ("max", "min"):
+        return header + (
+            f"{_metric_label(spec)}的发票：{result.file_name or result.invoice_number}（{result.seller}，"
+            f"{result.item_name}），{label} **{_money(result[spec.column])}**"
+        )
+    return header + f"{_metric_label(spec)}：**{_money(result)}**"
+
+
+@dataclass
+class QueryAnswer:
+    text: str
+    spec: QuerySpec
+    seconds: float
+
+
+def answer_structured_query(question: str, invoices: List[Invoice]) -> Optional[QueryAnswer]:
+    """
+    尝试在本地精确回答聚合类问题（求和、计数、平均、分组、日期/金额筛选）
+
+    Args:
+        question: 用户问题
+        invoices: 当前批次发票
+
+    Returns:
+        Optional[QueryAnswer]: 本地答案；问题不是聚合/筛选类时返回None，由大模型回答
+    """
+    start = time.perf_counter()
+    df = get_invoices_frame(invoices)
+    if df.empty:
+        return None
+    try:
+        # 日期无法解析（如2月30日）时同样交给大模型，而不是报错
+        spec = parse_query(question, df)
+        if spec is None:
+            return None
+        text = format_answer(spec, run_query(spec, df))
+    except Exception as e:
+        logger.warning(f"本地查询失败，改由大模型回答: {str(e)}")
+        return None
+    seconds = time.perf_counter() - start
+    logger.info(f"本地查询: {spec} 耗时 {seconds * 1000:.1f}ms")
+    return QueryAnswer(text=text, spec=spec, seconds=seconds)
@@ -0,0 +1,418 @@
+# utils/store_utils.py
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+
+from models import Invoice, InvoiceBatch
+from config import CACHE_CONFIG, logger
+
+# 表列与 Invoice 字段一一对应（flags、tax_rates 以JSON存储）
+STORE_FIELDS = (
+    "file_name", "invoice_number", "issue_date", "buyer", "seller", "item_name",
+    "amount", "tax_amount", "total_amount", "total_in_words", "raw_text", "error",
+    "flags", "duplicate_of", "tax_rates", "file_hash",
+)
+# 以JSON存储的字段
+JSON_FIELDS = ("flags", "tax_rates")
+# 后来增加的列（旧库按此补列）
+ADDED_FIELDS = ("tax_rates", "file_hash")
+# 建索引的列（精确查询发票号码，按日期区间、购/销方筛选）
+INDEXED_FIELDS = ("invoice_number", "issue_date", "seller", "buyer")
+
+
+@dataclass
+class InvoiceFilter:
+    """发票筛选条件（各条件之间为“且”，为None的条件不生效）"""
+    invoice_number: Optional[str] = None   # 精确匹配
+    seller: Optional[str] = None           # 包含
+    buyer: Optional[str] = None            # 包含
+    date_from: Optional[str] = None        # YYYY-MM-DD，含当天
+    date_to: Optional[str] = None
+    has_error: Optional[bool] = None       # True 只要提取失败的，False 只要成功的
+    flagged: Optional[bool] = None         # 有校验提示
+    duplicate: Optional[bool] = None       # 有重复提示
+
+    def where(self) -> Tuple[List[str], List]:
+        """转换为SQL条件与参数"""
+        clauses, params = [], []
+        if self.invoice_number:
+            clauses.append("invoice_number = ?")
+            params.append(self.invoice_number)
+        for column in ("seller", "buyer"):
+            value = getattr(self, column)
+            if value:
+                clauses.append(f"{column} LIKE ?")
+                params.append(f"%{value}%")
+        if self.date_from:
+            clauses.append("issue_date >= ?")
+            params.append(self.date_from)
+        if self.date_to:
+            clauses.append("issue_date <= ?")
+            params.append(self.date_to)
+        for column, value in (("error", self.has_error), ("flags", self.flagged),
+                              ("duplicate_of", self.duplicate)):
+            if value is not None:
+                clauses.append(f"{column} IS {'NOT ' if value else ''}NULL")
+        return clauses, params
+
+
+def _to_row(batch_id: int, position: int, invoice: Invoice) -> tuple:
+    """Invoice 转换为表行（开票日期能解析时统一存为 YYYY-MM-DD，便于区间筛选）"""
+    values = []
+    for name in STORE_FIELDS:
+        value = getattr(invoice, name)
+        if name == "issue_date" and value is not None:
+            parsed = invoice.parsed_issue_date()
+            value = parsed.isoformat() if parsed else str(value)
+        elif name in JSON_FIELDS:
+            value = json.dumps(value, ensure_ascii=False) if value else None
+        values.append(value)
+    return (batch_id, position, *values)
+
+
+def _to_invoice(row: tuple) -> Invoice:
+    values = dict(zip(STORE_FIELDS, row))
+    for name in JSON_FIELDS:
+        if values[name]:
+            values[name] = json.loads(values[name])
+    return Invoice(**values)
+
+
+class InvoiceStore:
+    """基于SQLite的发票结果库（线程安全），按批次保存提取结果，供界面、导出与问答按需读取"""
+
+    # iter_invoices 每次从库中读取的行数
+    READ_CHUNK = 1000
+
+    def __init__(self, directory: str = CACHE_CONFIG.get("directory", ".cache")):
+        """
+        初始化结果库
+
+        Args:
+            directory: 数据库文件所在目录（默认与提取结果缓存相同）
+        """
+        path = Path(directory)
+        path.mkdir(parents=True, exist_ok=True)
+        self.db_path = path / "invoices.sqlite3"
+        self._lock = threading.Lock()
+        self._batches: Dict[int, "StoredBatch"] = {}
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS batches (
+                id INTEGER PRIMARY KEY,
+                label TEXT,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                owner TEXT
+            )
+        """)
+        if "owner" not in {row[1] for row in self._conn.execute("PRAGMA table_info(batches)")}:
+            self._conn.execute("ALTER TABLE batches ADD COLUMN owner TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_batches_owner ON batches(owner)")
+        self._conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS invoices (
+                id INTEGER PRIMARY KEY,
+                batch_id INTEGER NOT NULL,
+                position INTEGER NOT NULL,
+                file_name TEXT NOT NULL,
+                invoice_number TEXT,
+                issue_date TEXT,
+                buyer TEXT,
+                seller TEXT,
+                item_name TEXT,
+                amount REAL,
+                tax_amount REAL,
+                total_amount REAL,
+                total_in_words TEXT,
+                raw_text TEXT,
+                error TEXT,
+                flags TEXT,
+                duplicate_of TEXT,
+                tax_rates TEXT,
+                file_hash TEXT
+            )
+        """)
+        existing = {row[1] for row in self._conn.execute("PRAGMA table_info(invoices)")}
+        for column in ADDED_FIELDS:
+            if column not in existing:
+                self._conn.execute(f"ALTER TABLE invoices ADD COLUMN {column} TEXT")
+        self._conn.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_invoices_position ON invoices(batch_id, position)"
+        )
+        for column in INDEXED_FIELDS:
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_invoices_{column} ON invoices({column})")
+        self._conn.commit()
+
+    def add_batch(self, invoices: List[Invoice], label: Optional[str] = None, owner: Optional[str] = None) -> int:
+        """
+        批量写入一个批次
+
+        Args:
+            invoices: 发票（按上传顺序）
+            label: 批次说明（如提取模式与文件数）
+            owner: 批次归属（界面会话的用户令牌），只有同一归属才能在历史批次中看到
+
+        Returns:
+            int: 批次ID
+        """
+        batch_id = self.create_batch(label, owner)
+        self.append(batch_id, list(enumerate(invoices)))
+        logger.info(f"结果库: 批次 {batch_id} 写入 {len(invoices)} 张发票")
+        return batch_id
+
+    def create_batch(self, label: Optional[str] = None, owner: Optional[str] = None) -> int:
+        """新建空批次（边提取边写入时使用），返回批次ID"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO batches (label, size, created_at, owner) VALUES (?, 0, ?, ?)",
+                (label, time.time(), owner)
+            )
+            self._conn.commit()
+        return cursor.lastrowid
+
+    def append(self, batch_id: int, items: List[Tuple[int, Invoice]]) -> None:
+        """
+        向批次追加发票（单个事务）
+
+        Args:
+            batch_id: 批次ID
+            items: (上传顺序序号, 发票)，可以按完成顺序分多次追加，读取时按序号排列
+        """
+        with self._lock:
+            self._conn.executemany(
+                f"INSERT INTO invoices (batch_id, position, {', '.join(STORE_FIELDS)}) "
+                f"VALUES ({', '.join('?' * (len(STORE_FIELDS) + 2))})",
+                (_to_row(batch_id, position, inv) for position, inv in items)
+            )
+            self._conn.execute("UPDATE batches SET size = size + ? WHERE id = ?", (len(items), batch_id))
+            self._conn.commit()
+
+    def rename_batch(self, batch_id: int, label: str) -> None:
+        """修改批次说明（如标记已取消）"""
+        with self._lock:
+            self._conn.execute("UPDATE batches SET label = ? WHERE id = ?", (label, batch_id))
+            self._conn.commit()
+            if batch_id in self._batches:
+                self._batches[batch_id].label = label
+
+    def _where(self, batch_id: Optional[int], where: Optional[InvoiceFilter]) -> Tuple[str, List]:
+        clauses, params = where.where() if where else ([], [])
+        if batch_id is not None:
+            clauses.insert(0, "batch_id = ?")
+            params.insert(0, batch_id)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def count(self, batch_id: Optional[int] = None, where: Optional[InvoiceFilter] = None) -> int:
+        """符合条件的发票数（batch_id 为None时在全部批次中统计）"""
+        sql, params = self._where(batch_id, where)
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM invoices{sql}", params).fetchone()[0]
+
+    def page(self, batch_id: Optional[int] = None, where: Optional[InvoiceFilter] = None,
+             offset: int = 0, limit: int = 50) -> List[Invoice]:
+        """
+        分页读取发票（按批次、上传顺序排列）
+
+        Args:
+            batch_id: 批次ID，None 表示全部批次
+            where: 筛选条件
+            offset: 跳过的张数
+            limit: 本页张数
+
+        Returns:
+            List[Invoice]: 本页发票
+        """
+        sql, params = self._where(batch_id, where)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(STORE_FIELDS)} FROM invoices{sql} "
+                f"ORDER BY batch_id, position LIMIT ? OFFSET ?",
+                params + [limit, offset]
+            ).fetchall()
+        return [_to_invoice(row) for row in rows]
+
+    def iter_invoices(self, batch_id: Optional[int] = None, where: Optional[InvoiceFilter] = None,
+                      keep_raw_text: bool = True) -> Iterator[Invoice]:
+        """
+        按批次、上传顺序逐张产出发票，每次只从库中读取 READ_CHUNK 行（按(批次, 序号)续读，不使用OFFSET）
+
+        keep_raw_text=False 时不读取原文（raw_text 为None），用于结果表、问答等不需要原文的场合。
+        """
+        sql, params = self._where(batch_id, where)
+        sql = f"{sql} AND (batch_id, position) > (?, ?)" if sql else " WHERE (batch_id, position) > (?, ?)"
+        columns = ", ".join("NULL" if name == "raw_text" and not keep_raw_text else name for name in STORE_FIELDS)
+        last = (-1, -1)
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT batch_id, position, {columns} FROM invoices{sql} "
+                    f"ORDER BY batch_id, position LIMIT ?",
+                    params + [*last, self.READ_CHUNK]
+                ).fetchall()
+            if not rows:
+                return
+            last = rows[-1][:2]
+            for row in rows:
+                yield _to_invoice(row[2:])
+
+    def batch(self, batch_id: int) -> Optional["StoredBatch"]:
+        """
+        取批次句柄，批次不存在时返回None
+
+        同一批次返回同一对象（问答索引等按对象复用），每次调用时更新其张数（批次可能仍在写入）。
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT label, size, created_at, owner FROM batches WHERE id = ?", (batch_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            if batch_id in self._batches:
+                self._batches[batch_id].label, self._batches[batch_id].size = row[:2]
+            else:
+                self._batches[batch_id] = StoredBatch(self, batch_id, *row)
+            return self._batches[batch_id]
+
+    def positions(self, batch_id: int) -> Set[int]:
+        """批次中已写入的上传顺序序号（任务中断后续跑时跳过已完成的文件）"""
+        with self._lock:
+            return {row[0] for row in self._conn.execute(
+                "SELECT position FROM invoices WHERE batch_id = ?", (batch_id,)
+            )}
+
+    def recent_batches(self, owner: str, limit: int = 20) -> List[Tuple[int, Optional[str], int, float]]:
+        """某一归属的最近批次：(批次ID, 说明, 张数, 创建时间)，新的在前"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT id, label, size, created_at FROM batches WHERE owner = ? ORDER BY id DESC LIMIT ?",
+                (owner, limit)
+            ).fetchall()
+
+    def stats(self) -> dict:
+        """返回批次数与发票数"""
+        with self._lock:
+            batches = self._conn.execute("SELECT COUNT(*) FROM batches").fetchone()[0]
+            invoices = self._conn.execute("SELECT COUNT(*) FROM invoices").fetchone()[0]
+        return {"batches": batches, "invoices": invoices}
+
+
+class StoredBatch:
+    """
+    结果库中一个批次的句柄
+
+    不持有发票对象：len() 为批次张数，迭代时分块从库中读取，可直接传给
+    show_results、chat_interface 等接受发票列表的函数。
+    """
+
+    def __init__(self, store: InvoiceStore, batch_id: int, label: Optional[str], size: int, created_at: float,
+                 owner: Optional[str] = None):
+        self.store = store
+        self.batch_id = batch_id
+        self.label = label
+        self.size = size
+        self.created_at = created_at
+        self.owner = owner
+
+    def __len__(self) -> int:
+        return self.size
+
+    @property
+    def fingerprint(self) -> str:
+        """批次只追加不修改，库文件 + 批次ID + 张数即可唯一标识"""
+        return f"{self.store.db_path}#{self.batch_id}:{self.size}"
+
+    def __iter__(self) -> Iterator[Invoice]:
+        return self.store.iter_invoices(self.batch_id)
+
+    def count(self, where: Optional[InvoiceFilter] = None) -> int:
+        return self.store.count(self.batch_id, where)
+
+    def page(self, where: Optional[InvoiceFilter] = None, offset: int = 0, limit: int = 50) -> List[Invoice]:
+        return self.store.page(self.batch_id, where, offset, limit)
+
+    def iter_invoices(self, where: Optional[InvoiceFilter] = None, keep_raw_text: bool = True) -> Iterator[Invoice]:
+        """按条件逐张产出发票（分块从库中读取）"""
+        return self.store.iter_invoices(self.batch_id, where, keep_raw_text)
+
+    def select(self, where: InvoiceFilter) -> List[Invoice]:
+        """读取符合条件的全部发票（用于失败、重复等通常很少的子集）"""
+        return list(self.iter_invoices(where))
+
+    def to_batch(self, where: Optional[InvoiceFilter] = None, keep_raw_text: bool = False) -> InvoiceBatch:
+        """读取为列式批次（逐块读取，不生成发票列表）"""
+        return InvoiceBatch.from_invoices(self.store.iter_invoices(self.batch_id, where, keep_raw_text), keep_raw_text)
+
+    def __repr__(self) -> str:
+        return f"StoredBatch(batch_id={self.batch_id}, size={self.size})"
+
+
+def batch_fingerprint(invoices: Iterable[Invoice]) -> str:
+    """
+    批次指纹，用于缓存按批次生成的结果表、导出文件等
+
+    结果库批次直接取 StoredBatch.fingerprint；发票列表按各张发票的文件名、号码、金额、
+    错误与提示信息计算哈希（列表内容变化时指纹随之变化）。
+    """
+    if isinstance(invoices, StoredBatch):
+        return invoices.fingerprint
+    digest = hashlib.sha256()
+    for inv in invoices:
+        digest.update(repr((inv.file_name, inv.invoice_number, inv.issue_date, inv.total_amount,
+                            inv.error, inv.flags, inv.duplicate_of)).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+class BatchCache:
+    """
+    按批次缓存派生数据（查询用DataFrame、问答索引等），进程内各会话共享
+
+    结果库批次按 StoredBatch.fingerprint 区分；发票列表按对象身份与长度区分
+    （条目中保留列表引用，列表被回收前其ID不会被其他列表复用）。最近使用的 max_entries 个批次保留。
+    """
+
+    def __init__(self, build: Callable[[Union[StoredBatch, List[Invoice]]], Any], max_entries: int = 8):
+        self._build = build
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple, Tuple[Optional[List[Invoice]], Any]]" = OrderedDict()
+
+    def get(self, invoices: Union[StoredBatch, List[Invoice]]) -> Any:
+        stored = isinstance(invoices, StoredBatch)
+        key = (invoices.fingerprint,) if stored else (id(invoices), len(invoices))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (stored or entry[0] is invoices):
+                self._entries.move_to_end(key)
+                return entry[1]
+        # 构建在锁外进行，不阻塞其他批次的读取
+        value = self._build(invoices)
+        with self._lock:
+            self._entries[key] = (None if stored else invoices, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+_store: Optional[InvoiceStore] = None
+_store_lock = threading.Lock()
+
+
+def get_invoice_store() -> InvoiceStore:
+    """获取进程级结果库实例（各会话共享，会话中只保存批次ID）"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = InvoiceStore()
+        return _store
@@ -0,0 +1,206 @@
+# utils/validation_utils.py
+from datetime import date
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+from config import COMPANY_SUFFIXES, logger
+from extractors.base_extractor import BaseExtractor
+from models import Invoice, InvoiceBatch
+from models.invoice_batch import MISSING_CENTS
+
+# 增值税标准税率/征收率（含2019年4月前的16%、10%及2018年5月前的17%，出租住房减按1.5%）
+VAT_RATES = np.array([0, 0.01, 0.015, 0.03, 0.05, 0.06, 0.09, 0.10, 0.13, 0.16, 0.17])
+# 字段 -> 校验不通过时的说明（顺序即展示顺序）
+FLAG_MESSAGES = {
+    "invoice_number": "发票号码不是20位数字",
+    "issue_date": "开票日期缺失、无法解析或晚于今天",
+    "total_amount": "金额+税额与价税合计不符",
+    "tax_amount": "税额与税率不符",
+    "total_in_words": "大写金额与小写金额不符",
+}
+# 税额允许误差（分）：每行明细的税额单独四舍五入，每行至多差0.5分；
+# 行数未知时按20行以内计（不少于10分），明细行更多时按行数放宽
+TAX_TOLERANCE_CENTS = 10
+# 大写金额无法解析（区别于缺失）
+INVALID_CENTS = MISSING_CENTS + 1
+
+_amount_parser = BaseExtractor(COMPANY_SUFFIXES)
+
+
+def words_to_cents(words: np.ndarray) -> np.ndarray:
+    """
+    大写金额列转换为分（相同写法只转换一次）
+
+    Returns:
+        np.ndarray: int64，缺失为 MISSING_CENTS，无法解析为 INVALID_CENTS
+    """
+    present = np.flatnonzero(words != None)  # noqa: E711  逐元素比较
+    cents = np.full(len(words), MISSING_CENTS, dtype=np.int64)
+    if not len(present):
+        return cents
+    unique, inverse = np.unique(words[present].astype(str), return_inverse=True)
+    converted = np.empty(len(unique), dtype=np.int64)
+    for i, text in enumerate(unique.tolist()):
+        try:
+            converted[i] = round(_amount_parser._chinese_amount_to_float(text) * 100)
+        except (ValueError, KeyError):
+            converted[i] = INVALID_CENTS
+    cents[present] = converted[inverse]
+    return cents
+
+
+def tax_rate_bounds(size: int, tax_rates: Dict[int, List[float]]):
+    """
+    各发票提取到的税率 -> (最低税率, 最高税率, 明细行数)
+
+    Args:
+        size: 批次张数
+        tax_rates: 行号 -> 税率（InvoiceBatch.tax_rates，只含提取到税率的行）
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: 未提取到税率的行为 NaN, NaN, 0
+    """
+    low = np.full(size, np.nan)
+    high = np.full(size, np.nan)
+    lines = np.zeros(size, dtype=np.int64)
+    for i, rates in tax_rates.items():
+        if rates:
+            low[i], high[i], lines[i] = min(rates), max(rates), len(rates)
+    return low, high, lines
+
+
+def validate_batch(batch: InvoiceBatch, tolerance_cents: int = 1,
+                   today: Optional[date] = None) -> Dict[str, np.ndarray]:
+    """
+    对整个批次做一次向量化校验
+
+    - total_amount：金额 + 税额 与价税合计相差超过 tolerance_cents
+    - tax_amount：提取到税率时，税额超出 金额×最低税率 ~ 金额×最高税率 的范围
+      （单一税率即与 金额×税率 比较；多税率发票没有逐行金额，只能校验范围）；
+      未提取到税率时，税额与 金额×任一标准税率 相差都超过允许误差。
+      允许误差为 TAX_TOLERANCE_CENTS 与明细行数×0.5分 中较大者
+    - invoice_number：不是20位数字
+    - issue_date：缺失、无法解析或晚于今天
+    - total_in_words：大写金额无法解析，或与价税合计（小写）不一致
+
+    缺失的金额不参与金额类校验；提取失败（有error）的行不标记。
+
+    Args:
+        batch: 列式发票批次
+        tolerance_cents: 金额允许误差（分）
+        today: 开票日期上限，默认为今天
+
+    Returns:
+        Dict[str, np.ndarray]: 字段 -> 布尔掩码（True 为校验不通过），字段见 FLAG_MESSAGES
+    """
+    amount, tax, total = batch.amount, batch.tax_amount, batch.total_amount
+    has_amounts = (amount != MISSING_CENTS) & (tax != MISSING_CENTS) & (total != MISSING_CENTS)
+    # 缺失值先置0，避免哨兵值参与运算溢出
+    amount0, tax0, total0 = (np.where(has_amounts, column, 0) for column in (amount, tax, total))
+
+    flags = {"total_amount": has_amounts & (np.abs(amount0 + tax0 - total0) > tolerance_cents)}
+
+    # 红字发票金额为负，按绝对值比较
+    abs_amount, abs_tax = np.abs(amount0), np.abs(tax0)
+    low, high, lines = tax_rate_bounds(len(batch), batch.tax_rates)
+    tax_tolerance = np.maximum(max(TAX_TOLERANCE_CENTS, tolerance_cents), np.ceil(lines / 2))
+    known = ~np.isnan(low)
+    out_of_range = (abs_tax < np.rint(abs_amount * np.where(known, low, 0)) - tax_tolerance) | (
+        abs_tax > np.rint(abs_amount * np.where(known, high, 0)) + tax_tolerance)
+    expected = np.rint(abs_amount[:, None] * VAT_RATES[None, :])
+    deviation = np.abs(abs_tax[:, None] - expected).min(axis=1)
+    flags["tax_amount"] = has_amounts & np.where(known, out_of_range, deviation > tax_tolerance)
+
+    numbers = batch.invoice_number
+    if numbers.dtype.kind != "S":
+        numbers = numbers.astype(str)
+    flags["invoice_number"] = ~((np.char.str_len(numbers) == 20) & np.char.isdigit(numbers))
+
+    limit = np.datetime64(today or date.today(), "D")
+    flags["issue_date"] = np.isnat(batch.issue_date) | (batch.issue_date > limit)
+
+    words = words_to_cents(batch.total_in_words)
+    flags["total_in_words"] = (words == INVALID_CENTS) | (
+        (words != MISSING_CENTS) & (total != MISSING_CENTS) & (np.abs(words - np.where(
+            total != MISSING_CENTS, total, 0)) > tolerance_cents)
+    )
+
+    extracted = ~batch.error_mask
+    return {name: flags[name] & extracted for name in FLAG_MESSAGES}
+
+
+def masks_to_flags(masks: Dict[str, np.ndarray]) -> Dict[int, Dict[str, str]]:
+    """
+    校验掩码 -> 行号 -> 校验提示（字段 -> 说明），只含校验不通过的行
+
+    各行不通过的字段组合编码为位掩码，相同组合的提示只生成一次（每行得到各自的副本）。
+    """
+    names = list(FLAG_MESSAGES)
+    codes = np.zeros(len(masks[names[0]]), dtype=np.int64)
+    for bit, name in enumerate(names):
+        codes |= masks[name].astype(np.int64) << bit
+    rows = np.flatnonzero(codes)
+    templates = {code: {name: FLAG_MESSAGES[name] for bit, name in enumerate(names) if code >> bit & 1}
+                 for code in np.unique(codes[rows]).tolist()}
+    return {row: dict(templates[code]) for row, code in zip(rows.tolist(), codes[rows].tolist())}
+
+
+def flag_batch(batch: InvoiceBatch, tolerance_cents: int = 1, today: Optional[date] = None) -> Dict[str, int]:
+    """
+    校验列式批次并原地更新 batch.flags（已持有批次的调用方无需再转换为发票列表）
+
+    Returns:
+        Dict[str, int]: 各字段校验不通过的张数
+    """
+    masks = validate_batch(batch, tolerance_cents, today)
+    batch.flags = masks_to_flags(masks)
+    return {name: int(mask.sum()) for name, mask in masks.items()}
+
+
+def attach_flags(invoices: List[Invoice], flags: Dict[int, Dict[str, str]], previous: Iterable[int] = ()) -> None:
+    """
+    把校验结果写入 Invoice.flags，只访问校验不通过的行与原先带提示的行
+
+    Args:
+        invoices: 发票（原地修改）
+        flags: 行号 -> 校验提示（masks_to_flags 的结果）
+        previous: 原先 flags 非空的行号，不在 flags 中的改为 None
+    """
+    for row in previous:
+        if row not in flags:
+            invoices[row].flags = None
+    for row, row_flags in flags.items():
+        invoices[row].flags = row_flags
+
+
+def validate_invoices(invoices: List[Invoice], tolerance_cents: int = 1,
+                      batch: Optional[InvoiceBatch] = None) -> Dict[str, int]:
+    """
+    校验发票列表并写入各发票的 flags
+
+    Args:
+        invoices: 发票（原地修改）
+        tolerance_cents: 金额允许误差（分）
+        batch: 由 invoices 构建的列式批次，调用方已持有时传入可省去一次转换（其 flags 同时更新）
+
+    Returns:
+        Dict[str, int]: 各字段校验不通过的张数
+    """
+    if batch is None:
+        batch = InvoiceBatch.from_invoices(invoices, keep_raw_text=False)
+    previous = list(batch.flags)
+    counts = flag_batch(batch, tolerance_cents)
+    attach_flags(invoices, batch.flags, previous)
+    if any(counts.values()):
+        logger.info(f"批次校验: {len(invoices)} 张发票，异常 {counts}")
+    return counts
+
+
+def iter_validated(invoices: Iterable[Invoice], chunk_size: int = 1000) -> Iterator[Invoice]:
+    """流式结果按 chunk_size 张一组校验后依次产出（命令行批处理使用）"""
+    invoices = iter(invoices)
+    while chunk := list(islice(invoices, chunk_size)):
+        validate_invoices(chunk)
+        yield from chunk
@@ -0,0 +1,221 @@
+# utils/warmup_utils.py
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from config import API_CONFIG, MODEL_OPTIONS, OLLAMA_MODEL_OPTIONS, WARMUP_CONFIG, logger
+from extractors.client_pool import get_http_session, get_openai_client, request_timeout
+from extractors.llm_extractor import PROMPT_PREFIX
+
+# keep_alive 时长单位（Ollama 的 Go duration 写法）
+DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+# 预热失败后重试间隔的上限（秒）
+MAX_RETRY_SECONDS = 300
+# 模型状态 -> 界面显示
+STATE_LABELS = {
+    "loading": "加载中…",
+    "ready": "已就绪",
+    "failed": "加载失败",
+}
+
+
+def keep_alive_seconds(value) -> float:
+    """
+    keep_alive 换算为秒
+
+    Args:
+        value: 秒数，或 "30m"、"1h30m" 等时长；负数为常驻
+
+    Returns:
+        float: 秒数，常驻为 inf，无法解析时按 Ollama 默认的5分钟
+    """
+    if isinstance(value, (int, float)):
+        return float("inf") if value < 0 else float(value)
+    text = str(value).strip()
+    if text.lstrip("-").replace(".", "", 1).isdigit():
+        return keep_alive_seconds(float(text))
+    if text.startswith("-"):
+        return float("inf")
+    parts = DURATION_RE.findall(text)
+    if not parts or "".join(number + unit for number, unit in parts) != text:
+        return 300.0
+    return sum(float(number) * DURATION_UNITS[unit] for number, unit in parts)
+
+
+def model_keep_alive(model: str) -> float:
+    """
+    模型空闲多久后可能被服务端卸载（秒）
+
+    Ollama 文本模型的提取请求经OpenAI兼容接口发送，不能携带 keep_alive，
+    每次请求都把保留时长重置为服务端默认值，因此取 keep_alive 与 server_keep_alive 中较短者；
+    视觉模型的提取请求与预热一样带 keep_alive。
+    """
+    keep_alive = keep_alive_seconds(WARMUP_CONFIG.get("keep_alive", "5m"))
+    if model in OLLAMA_MODEL_OPTIONS and MODEL_OPTIONS[model]["type"] == "text":
+        return min(keep_alive, keep_alive_seconds(WARMUP_CONFIG.get("server_keep_alive", "5m")))
+    return keep_alive
+
+
+@dataclass
+class ModelStatus:
+    """模型预热状态"""
+    model: str
+    state: str
+    started_at: float
+    load_seconds: Optional[float] = None
+    error: Optional[str] = None
+    failures: int = 0                   # 连续失败次数（决定重试间隔）
+    failed_at: Optional[float] = None
+
+    @property
+    def expired(self) -> bool:
+        """距上次加载已超过模型的保留时长（见 model_keep_alive），服务端可能已卸载模型"""
+        age = time.time() - self.started_at - (self.load_seconds or 0)
+        return age > model_keep_alive(self.model)
+
+    @property
+    def retry_at(self) -> float:
+        """加载失败后下次重试的时间：间隔从 retry_seconds 起每次失败加倍，不超过 MAX_RETRY_SECONDS"""
+        delay = WARMUP_CONFIG.get("retry_seconds", 5) * 2 ** max(self.failures - 1, 0)
+        return (self.failed_at or 0) + min(delay, MAX_RETRY_SECONDS)
+
+    def describe(self) -> str:
+        if self.state == "ready":
+            return f"{STATE_LABELS[self.state]}（加载 {self.load_seconds:.1f} 秒）"
+        if self.state == "failed":
+            wait = max(self.retry_at - time.time(), 0)
+            return f"{STATE_LABELS[self.state]}：{self.error}（{wait:.0f} 秒后重试）"
+        return f"{STATE_LABELS[self.state]}（已等待 {time.time() - self.started_at:.0f} 秒）"
+
+
+class ModelWarmer:
+    """
+    模型预热
+
+    Ollama 模型首次请求（或空闲被卸载后）需要先把权重载入显存，耗时可达数十秒。
+    选择模型后在后台线程发送一次加载请求并带上 keep_alive，使第一张发票不再承担加载时间；
+    vLLM 启动时已加载模型，预热请求发送提示词静态前缀，预先填充前缀缓存。
+    """
+
+    def __init__(self, base_url: str = API_CONFIG["base_url"], api_key: str = API_CONFIG["api_key"]):
+        self.base_url = base_url.rstrip('/')
+        self.api_key = api_key
+        self._lock = threading.Lock()
+        self._status: Dict[str, ModelStatus] = {}
+
+    @staticmethod
+    def _is_ollama(model: str) -> bool:
+        return model in OLLAMA_MODEL_OPTIONS
+
+    def _generate(self, model_path: str, payload: Dict, timeout: Optional[float] = None) -> Dict:
+        """调用 Ollama /api/generate（非流式）"""
+        connect, read = request_timeout()
+        response = get_http_session(self.base_url).post(
+            f"{self.base_url}/api/generate",
+            headers={"Authorization": f"Bearer {self.api_key}"},
+            json={"model": model_path, "stream": False, "keep_alive": WARMUP_CONFIG.get("keep_alive", "5m"),
+                  **payload},
+            timeout=(connect, timeout or read),
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def _complete(self, model_path: str, messages: list, timeout: Optional[float] = None) -> None:
+        """OpenAI兼容接口生成1个token（vLLM）"""
+        client = get_openai_client(self.base_url, self.api_key)
+        if timeout:
+            client = client.with_options(timeout=timeout)
+        client.chat.completions.create(model=model_path, messages=messages, max_tokens=1)
+
+    def _load(self, model: str) -> None:
+        status = self._status[model]
+        model_path = MODEL_OPTIONS[model]["model_path"]
+        try:
+            if self._is_ollama(model):
+                # 空提示词只加载模型，不生成内容
+                self._generate(model_path, {"prompt": ""})
+            else:
+                self._complete(model_path, [{"role": "system", "content": PROMPT_PREFIX},
+                                            {"role": "user", "content": "1"}])
+            status.load_seconds = time.time() - status.started_at
+            status.state = "ready"
+            logger.info(f"模型预热: {model} 已就绪，用时 {status.load_seconds:.1f} 秒")
+        except Exception as e:
+            status.error = str(e)
+            status.failures += 1
+            status.failed_at = time.time()
+            status.state = "failed"
+            logger.warning(f"模型预热: {model} 第 {status.failures} 次加载失败: {str(e)}")
+
+    def warm(self, model: str) -> ModelStatus:
+        """
+        在后台加载模型（已就绪且未超过保留时长、正在加载、或加载失败后未到重试时间时不重复请求）
+
+        Args:
+            model: MODEL_OPTIONS 中的模型名称
+
+        Returns:
+            ModelStatus: 当前状态
+        """
+        with self._lock:
+            status = self._status.get(model)
+            if status and (status.state == "loading" or (status.state == "ready" and not status.expired)
+                           or (status.state == "failed" and time.time() < status.retry_at)):
+                return status
+            failures = status.failures if status and status.state == "failed" else 0
+            status = self._status[model] = ModelStatus(model, "loading", time.time(), failures=failures)
+        threading.Thread(target=self._load, args=(model,), name=f"warmup-{model}", daemon=True).start()
+        return status
+
+    def status(self, model: str) -> Optional[ModelStatus]:
+        with self._lock:
+            return self._status.get(model)
+
+    def probe(self, model: str) -> float:
+        """
+        测量服务当前的排队延迟：生成1个token的往返时间（同时刷新 keep_alive）
+
+        服务端按请求顺序排队执行，其他会话的批量提取会使该时间明显变长。
+
+        Args:
+            model: MODEL_OPTIONS 中的模型名称
+
+        Returns:
+            float: 秒数
+
+        Raises:
+            Exception: 请求失败或超过 warmup_config.probe_timeout
+        """
+        timeout = WARMUP_CONFIG.get("probe_timeout", 30)
+        model_path = MODEL_OPTIONS[model]["model_path"]
+        started = time.perf_counter()
+        if self._is_ollama(model):
+            self._generate(model_path, {"prompt": "1", "options": {"num_predict": 1}}, timeout)
+        else:
+            self._complete(model_path, [{"role": "user", "content": "1"}], timeout)
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            status = self._status.get(model)
+            if status and status.state == "ready":
+                # 探测请求同样刷新了 keep_alive
+                status.started_at = time.time() - status.load_seconds
+        logger.info(f"模型探测: {model} 单次请求 {elapsed:.2f} 秒")
+        return elapsed
+
+
+_warmer: Optional[ModelWarmer] = None
+_warmer_lock = threading.Lock()
+
+
+def get_model_warmer() -> Optional[ModelWarmer]:
+    """获取进程级模型预热器，配置关闭时返回None"""
+    global _warmer
+    if not WARMUP_CONFIG.get("enabled", True):
+        return None
+    with _warmer_lock:
+        if _warmer is None:
+            _warmer = ModelWarmer()
+        return _warmer